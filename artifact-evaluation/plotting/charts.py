@@ -5,6 +5,7 @@ import pandas as pd
 from scipy import stats
 import math
 import os
+import sqlite3
 
 execution_platforms = {}
 
@@ -39,8 +40,26 @@ ax_margins = 0.01
 width = 0.2
 x_tick_num=5
 
-def get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, chunk_size, match_mode, overall_file_size, field = 'avg_exe[ns]', sep = ' '):
+# Averages of the positive values of every measure of every run in the results database written by results_db.py, with a single query
+def get_avgs_from_database(database_path):
+    query = """
+        SELECT e.platform, e.name, b.name, r.file_size, r.chunk_size, r.match_mode, m.name, AVG(m.number)
+        FROM measures m JOIN runs r ON r.id = m.run_id JOIN benchmarks b ON b.id = r.benchmark_id JOIN engines e ON e.id = r.engine_id
+        WHERE m.number > 0
+        GROUP BY m.run_id, m.name"""
+    with sqlite3.connect(database_path) as connection:
+        return {tuple(row[:-1]): row[-1] for row in connection.execute(query)}
+
+def get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, chunk_size, match_mode, overall_file_size, field = 'avg_exe[ns]', sep = ' ', avgs = None):
     avg_final = 0
+    if avgs is not None:
+        key = (execution_platform, execution_engine, benchmark.lower(), overall_file_size, chunk_size, match_mode, field)
+        if key in avgs:
+            avg_final = avgs[key]
+        else:
+            print(key)
+        return avg_final
+
     csv_file_name = "./" + execution_platform + "/"+ execution_engine + "/" + benchmark.lower() + "/output_comp_data_" + overall_file_size + "_" + chunk_size + "_" + match_mode + ".csv"
     if os.path.exists(csv_file_name):
         explfr = pd.read_csv(csv_file_name, sep=sep)
@@ -107,6 +126,8 @@ def plot_runtime(name, dictionary, ticks, ticks_label_text, mode):
 
 def main():
     mode = int(sys.argv[1])
+    # The results database is optional, without it the results are read from the folders
+    avgs = get_avgs_from_database(sys.argv[2]) if len(sys.argv) > 2 else None
     all_execution_engines = []
 
     dictionary = {}
@@ -120,9 +141,9 @@ def main():
                         match_avg = 0
                         for match_mode in match_modes:
                             if execution_engine == 'cicero':
-                                match_avg = get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, str((int(chuck_size) * 1000)), match_mode, overall_file_size, 'AVG_Time[ns]', ',')/division_factor 
+                                match_avg = get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, str((int(chuck_size) * 1000)), match_mode, overall_file_size, 'AVG_Time[ns]', ',', avgs)/division_factor 
                             else:
-                                match_avg = get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, str((int(chuck_size) * 1000)), match_mode, overall_file_size, 'avg_exe[ns]', ' ')/division_factor
+                                match_avg = get_avgs_from_raw_file(execution_platform, execution_engine, benchmark, str((int(chuck_size) * 1000)), match_mode, overall_file_size, 'avg_exe[ns]', ' ', avgs)/division_factor
                         chunks_avg.append(match_avg)
                         #energy efficinecy code
                     avg_power_index = 1
@@ -4,9 +4,58 @@
 #define DRIVER_STATUS_WAIT_REGEX  0x01
 #define DRIVER_STATUS_WAIT_TEXT   0x02
 #define DRIVER_STATUS_EXECUTING   0x03
+#define DRIVER_STATUS_BATCH_COUNT      0x04
+#define DRIVER_STATUS_BATCH_LENGTH     0x05
+#define DRIVER_STATUS_BATCH_TEXT       0x06
+#define DRIVER_STATUS_BATCH_EXECUTING  0x07
+#define DRIVER_STATUS_WAIT_BUDGET      0x08
 
 #define DRIVER_CMD_REGEX  0x00
 #define DRIVER_CMD_TEXT   0x01
+#define DRIVER_CMD_BATCH  0x02
+#define DRIVER_CMD_HELLO  0x03
+#define DRIVER_CMD_QUERY_CODE  0x04
+#define DRIVER_CMD_BUDGET  0x05
+
+// Size of the buffer for strings received in batch mode and for frame payloads, the RAM of CICERO is 512 qwords and is shared with the code
+#define TEXT_BUFFER_SIZE  4096
+// Number of qwords of CICERO RAM
+#define RAM_QWORDS  512
+// Size of the information about the resident code: length (2 bytes) and CRC32 (4 bytes), little-endian
+#define CODE_INFO_SIZE  6
+// Size of a cycle budget: 32 bit little-endian, 0 for no limit
+#define BUDGET_SIZE  4
+
+// Binary framed protocol, every frame is composed of a header (magic byte, type, 16 bit little-endian payload length),
+// the payload and the CRC32 of header and payload (little-endian)
+#define PROTOCOL_VERSION   3
+#define FRAME_MAGIC        0xC1
+#define FRAME_HEADER_SIZE  4
+#define FRAME_CRC_SIZE     4
+
+#define FRAME_STATUS_HEADER     0x00
+#define FRAME_STATUS_PAYLOAD    0x01
+#define FRAME_STATUS_CRC        0x02
+#define FRAME_STATUS_EXECUTING  0x03
+
+#define FRAME_TYPE_REGEX   0x10
+#define FRAME_TYPE_TEXT    0x11
+#define FRAME_TYPE_QUERY_CODE  0x12
+#define FRAME_TYPE_TEXT_PACKED  0x13
+#define FRAME_TYPE_BUDGET  0x14
+#define FRAME_TYPE_ACK     0x20
+#define FRAME_TYPE_NACK    0x21
+#define FRAME_TYPE_RESULT  0x22
+#define FRAME_TYPE_CODE_INFO  0x23
+
+#define FRAME_ERROR_CRC           0x01
+#define FRAME_ERROR_TOO_LONG      0x02
+#define FRAME_ERROR_UNKNOWN_TYPE  0x03
+#define FRAME_ERROR_MALFORMED     0x04
+
+// The payload of a packed text frame starts with the length of the string, including the terminator (16 bit little-endian),
+// padded to 8 bytes so that the qwords that follow are aligned
+#define PACKED_TEXT_HEADER_SIZE  8
 
 // Need to test if this is not conflicting with any possible input value
 #define DRIVER_INPUT_TERMINATOR  0xFF
@@ -43,6 +92,113 @@ void printRAMContents(int qwordsToPrint) {
   Serial.println();
 }
 
+/**
+  Reads a little-endian 16 bit unsigned integer from Serial, the caller must check that 2 bytes are available.
+
+  @return the integer read
+ */
+uint16_t readUInt16() {
+  uint16_t low = Serial.read();
+  uint16_t high = Serial.read();
+  return low | (high << 8);
+}
+
+/**
+  Reads a little-endian 32 bit unsigned integer from an array of bytes.
+
+  @param data the array, must be of size 4
+  @return the integer read
+ */
+uint32_t unpackUInt32(const uint8_t data[]) {
+  uint32_t value = 0;
+  for (int i = 0; i < 4; i++) {
+    value |= ((uint32_t) data[i]) << (8 * i);
+  }
+  return value;
+}
+
+/**
+  Packs the result of an execution as 1 byte of status followed by 4 bytes (little-endian) of elapsed clock cycles.
+
+  @param record the array where the result will be stored, must be of size 5
+  @param status the final status of CICERO
+  @param elapsedCC the clock cycles elapsed for the execution
+ */
+void packResult(uint8_t record[], uint8_t status, uint32_t elapsedCC) {
+  record[0] = status;
+  for (int i = 0; i < 4; i++) {
+    record[i + 1] = (elapsedCC >> (8 * i)) & 0xFF;
+  }
+}
+
+/**
+  Writes the result of an execution in batch mode to Serial.
+
+  @param status the final status of CICERO
+  @param elapsedCC the clock cycles elapsed for the execution
+ */
+void writeBatchRecord(uint8_t status, uint32_t elapsedCC) {
+  uint8_t record[5];
+  packResult(record, status, elapsedCC);
+  Serial.write(record, 5);
+}
+
+/**
+  Updates a CRC32 (same polynomial as zlib) with the given bytes.
+
+  @param crc the CRC of the previous bytes, 0 for the first bytes
+  @param data the bytes to add to the CRC
+  @param len the number of bytes
+  @return the updated CRC
+ */
+uint32_t crc32Update(uint32_t crc, const uint8_t data[], int len) {
+  crc = ~crc;
+  for (int i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int j = 0; j < 8; j++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & (-(crc & 1)));
+    }
+  }
+  return ~crc;
+}
+
+/**
+  Writes a frame to Serial.
+
+  @param type the type of the frame
+  @param payload the payload of the frame
+  @param len the length of the payload
+ */
+void writeFrame(uint8_t type, const uint8_t payload[], uint16_t len) {
+  uint8_t header[FRAME_HEADER_SIZE] = {FRAME_MAGIC, type, (uint8_t) (len & 0xFF), (uint8_t) (len >> 8)};
+  uint32_t crc = crc32Update(crc32Update(0, header, FRAME_HEADER_SIZE), payload, len);
+  uint8_t crcBytes[FRAME_CRC_SIZE];
+  for (int i = 0; i < FRAME_CRC_SIZE; i++) {
+    crcBytes[i] = (crc >> (8 * i)) & 0xFF;
+  }
+
+  Serial.write(header, FRAME_HEADER_SIZE);
+  if (len > 0) Serial.write(payload, len);
+  Serial.write(crcBytes, FRAME_CRC_SIZE);
+}
+
+/**
+  Writes a NACK frame to Serial.
+
+  @param error the code of the error
+ */
+void writeNack(uint8_t error) {
+  writeFrame(FRAME_TYPE_NACK, &error, 1);
+}
+
+/**
+  Answers to the hello command with the version of the framed protocol.
+ */
+void writeHello() {
+  uint8_t hello[2] = {DRIVER_CMD_HELLO, PROTOCOL_VERSION};
+  Serial.write(hello, 2);
+}
+
 /*
   Global variables
  */
@@ -51,6 +207,222 @@ uint8_t driverStatus;
 char inChar;
 String input;
 long charsToRead;
+uint16_t batchRemaining;
+// Aligned to qwords, so that packed strings can be written to CICERO RAM without copying them
+uint8_t textBuffer[TEXT_BUFFER_SIZE] __attribute__((aligned(8)));
+int textBufferIndex;
+bool framedMode;
+uint8_t frameStatus;
+uint8_t frameHeader[FRAME_HEADER_SIZE];
+int frameHeaderIndex;
+uint16_t frameLength;
+uint8_t frameCRC[FRAME_CRC_SIZE];
+int frameCRCIndex;
+uint16_t residentCodeLength;
+uint32_t residentCodeCRC;
+// Max clock cycles of an execution, executions that exceed it are stopped and reported with CICERO_STATUS_TIMEOUT and the budget as elapsed cycles
+uint32_t cycleBudget;
+
+/**
+  Sets the cycle budget of the next executions.
+
+  @param budget the max number of clock cycles, 0 for no limit
+ */
+void setCycleBudget(uint32_t budget) {
+  cycleBudget = budget;
+  Cicero.setCycleBudget(budget);
+}
+
+/**
+  Gets the clock cycles of an execution that has just ended.
+
+  @param status the final status of CICERO
+  @return the cycles read from CICERO, or the budget if the execution has been stopped
+ */
+uint32_t elapsedCycles(uint32_t status) {
+  return status == CICERO_STATUS_TIMEOUT ? cycleBudget : Cicero.getElapsedClockCycles();
+}
+
+/**
+  Checks if an execution has ended.
+
+  @param status the status of CICERO
+  @return true if CICERO has accepted or rejected the string, has failed or has been stopped
+ */
+bool isFinalStatus(uint32_t status) {
+  return status == CICERO_STATUS_ACCEPTED || status == CICERO_STATUS_REJECTED || status == CICERO_STATUS_ERROR || status == CICERO_STATUS_TIMEOUT;
+}
+
+/**
+  Remembers the length and the CRC32 of the code loaded on CICERO, so that the driver can avoid uploading it again.
+
+  @param code the bytes of the code
+  @param len the number of bytes of the code
+ */
+void setResidentCode(const uint8_t code[], int len) {
+  residentCodeLength = len;
+  residentCodeCRC = crc32Update(0, code, len);
+}
+
+/**
+  Forgets the resident code if a string does not fit in RAM after it, as writing the string would overwrite the code.
+
+  @param numBytes the number of bytes of the string, including the terminator
+ */
+void checkTextFits(int numBytes) {
+  int codeQWords = (residentCodeLength + 7) / 8;
+  int textQWords = (numBytes + 7) / 8;
+  if (codeQWords + textQWords > RAM_QWORDS) {
+    residentCodeLength = 0;
+    residentCodeCRC = 0;
+  }
+}
+
+/**
+  Packs the length and the CRC32 of the resident code.
+
+  @param info the array where the information will be stored, must be of size CODE_INFO_SIZE
+ */
+void packCodeInfo(uint8_t info[]) {
+  info[0] = residentCodeLength & 0xFF;
+  info[1] = residentCodeLength >> 8;
+  for (int i = 0; i < 4; i++) {
+    info[i + 2] = (residentCodeCRC >> (8 * i)) & 0xFF;
+  }
+}
+
+/**
+  Executes the command contained in the frame that has just been received.
+ */
+void handleFrame() {
+  uint8_t frameType = frameHeader[1];
+
+  if (frameLength > TEXT_BUFFER_SIZE) {
+    writeNack(FRAME_ERROR_TOO_LONG);
+    return;
+  }
+
+  uint32_t receivedCRC = 0;
+  for (int i = 0; i < FRAME_CRC_SIZE; i++) {
+    receivedCRC |= ((uint32_t) frameCRC[i]) << (8 * i);
+  }
+  if (crc32Update(crc32Update(0, frameHeader, FRAME_HEADER_SIZE), textBuffer, frameLength) != receivedCRC) {
+    writeNack(FRAME_ERROR_CRC);
+    return;
+  }
+
+  switch (frameType) {
+    case FRAME_TYPE_REGEX:
+      Cicero.loadCode(frameLength, textBuffer);
+      setResidentCode(textBuffer, frameLength);
+      writeFrame(FRAME_TYPE_ACK, NULL, 0);
+      break;
+    case FRAME_TYPE_TEXT:
+      // Keep space for the string terminator
+      if (frameLength >= TEXT_BUFFER_SIZE) {
+        writeNack(FRAME_ERROR_TOO_LONG);
+        break;
+      }
+      // Add the string terminator (needed by Cicero)
+      textBuffer[frameLength] = '\0';
+      checkTextFits(frameLength + 1);
+      // Load string to examine to CICERO RAM and begin computation, the result will be sent when the execution ends
+      Cicero.loadStringAndStart(frameLength + 1, textBuffer);
+      frameStatus = FRAME_STATUS_EXECUTING;
+      break;
+    case FRAME_TYPE_TEXT_PACKED: {
+      // The string is already laid out as qwords by the driver, with the terminator and the padding
+      int qwordsToWrite = (frameLength - PACKED_TEXT_HEADER_SIZE) / 8;
+      uint16_t numBytes = textBuffer[0] | (textBuffer[1] << 8);
+      if (frameLength < PACKED_TEXT_HEADER_SIZE || (frameLength - PACKED_TEXT_HEADER_SIZE) % 8 != 0 || numBytes == 0 || (numBytes + 7) / 8 != qwordsToWrite) {
+        writeNack(FRAME_ERROR_MALFORMED);
+        break;
+      }
+      checkTextFits(numBytes);
+      Cicero.loadPackedStringAndStart(numBytes, (uint64_t*) (textBuffer + PACKED_TEXT_HEADER_SIZE));
+      frameStatus = FRAME_STATUS_EXECUTING;
+      break;
+    }
+    case FRAME_TYPE_QUERY_CODE: {
+      uint8_t info[CODE_INFO_SIZE];
+      packCodeInfo(info);
+      writeFrame(FRAME_TYPE_CODE_INFO, info, CODE_INFO_SIZE);
+      break;
+    }
+    case FRAME_TYPE_BUDGET:
+      if (frameLength != BUDGET_SIZE) {
+        writeNack(FRAME_ERROR_MALFORMED);
+        break;
+      }
+      setCycleBudget(unpackUInt32(textBuffer));
+      writeFrame(FRAME_TYPE_ACK, NULL, 0);
+      break;
+    default:
+      writeNack(FRAME_ERROR_UNKNOWN_TYPE);
+      break;
+  }
+}
+
+/**
+  State machine for the binary framed protocol: read header, payload and CRC of a frame, execute it and, if CICERO
+  has been started, wait for the end of the execution to send the result.
+ */
+void framedLoop() {
+  switch (frameStatus) {
+    case FRAME_STATUS_HEADER:
+      while (Serial.available() > 0 && frameHeaderIndex < FRAME_HEADER_SIZE) {
+        uint8_t inByte = Serial.read();
+        if (frameHeaderIndex == 0 && inByte != FRAME_MAGIC) {
+          // A driver that has just connected negotiates the protocol again, any other stray byte is discarded
+          if (inByte == DRIVER_CMD_HELLO) writeHello();
+          continue;
+        }
+        frameHeader[frameHeaderIndex] = inByte;
+        frameHeaderIndex++;
+      }
+      if (frameHeaderIndex < FRAME_HEADER_SIZE) return;
+
+      frameLength = ((uint16_t) frameHeader[2]) | (((uint16_t) frameHeader[3]) << 8);
+      textBufferIndex = 0;
+      frameCRCIndex = 0;
+      frameStatus = frameLength > 0 ? FRAME_STATUS_PAYLOAD : FRAME_STATUS_CRC;
+      break;
+    case FRAME_STATUS_PAYLOAD:
+      while (Serial.available() > 0 && textBufferIndex < frameLength) {
+        inChar = Serial.read();
+        // Payloads that do not fit in the buffer are discarded and rejected when the frame is complete
+        if (textBufferIndex < TEXT_BUFFER_SIZE) {
+          textBuffer[textBufferIndex] = inChar;
+        }
+        textBufferIndex++;
+      }
+      if (textBufferIndex == frameLength) frameStatus = FRAME_STATUS_CRC;
+      break;
+    case FRAME_STATUS_CRC:
+      while (Serial.available() > 0 && frameCRCIndex < FRAME_CRC_SIZE) {
+        frameCRC[frameCRCIndex] = Serial.read();
+        frameCRCIndex++;
+      }
+      if (frameCRCIndex < FRAME_CRC_SIZE) return;
+
+      frameHeaderIndex = 0;
+      frameStatus = FRAME_STATUS_HEADER;
+      handleFrame();
+      break;
+    case FRAME_STATUS_EXECUTING: {
+      uint32_t newStatus = Cicero.getStatusWithinBudget();
+      if (isFinalStatus(newStatus)) {
+        uint8_t record[5];
+        packResult(record, newStatus, elapsedCycles(newStatus));
+        Cicero.reset();
+
+        writeFrame(FRAME_TYPE_RESULT, record, 5);
+        frameStatus = FRAME_STATUS_HEADER;
+      }
+      break;
+    }
+  }
+}
 
 void setup() {
   // Reset global variables
@@ -58,9 +430,17 @@ void setup() {
   driverStatus = DRIVER_STATUS_WAIT_CMD;
   input = "";
   charsToRead = -1;
+  batchRemaining = 0;
+  textBufferIndex = 0;
+  framedMode = false;
+  frameStatus = FRAME_STATUS_HEADER;
+  frameHeaderIndex = 0;
+  residentCodeLength = 0;
+  residentCodeCRC = 0;
   
   // Upload the bitstream of CICERO to the FPGA
   Cicero.begin();
+  setCycleBudget(0);
 
   // Initialize Serial
   Serial.begin(9600);
@@ -74,7 +454,18 @@ void loop() {
     2) REGEX EDITING MODE: wait for the number of bytes to read followed by DRIVER_INPUT_TERMINATOR, then read the bytecode of a new regex, load it into CICERO RAM and return to command mode
     3) TEXT EDITING MODE: wait for the number of bytes to read followed by DRIVER_INPUT_TERMINATOR, then read a new string to examine, load the string into CICERO RAM and go to executing mode; when reading DRIVER_INPUT_TERMINATOR return to command mode
     4) EXECUTING MODE: CICERO is executing, check its status to detect if a match has been found or not, send the result through serial and then reset and return to text editing mode
-   */   
+    After the query code command the length and the CRC32 of the code loaded on CICERO are sent, without leaving command mode.
+    After the budget command the command is echoed, then the cycle budget of the next executions is read (4 bytes, little-endian, 0 for no limit)
+    and DRIVER_INPUT_TERMINATOR is sent; executions that exceed it are stopped and their result is CICERO_STATUS_TIMEOUT with the budget as elapsed cycles.
+    5) BATCH MODE: wait for the number of strings (2 bytes, little-endian), then for each string read its length (2 bytes, little-endian) and its bytes, execute CICERO on it
+       and send the result as 1 byte of status and 4 bytes (little-endian) of elapsed clock cycles; when all strings have been executed return to command mode
+    After the hello command the program switches to the binary framed protocol (see framedLoop()) and never returns to these states.
+   */
+  if (framedMode) {
+    framedLoop();
+    return;
+  }
+
   switch (driverStatus) {
     case DRIVER_STATUS_WAIT_CMD:
       if(Serial.available() <= 0) return;
@@ -92,8 +483,42 @@ void loop() {
           driverStatus = DRIVER_STATUS_WAIT_TEXT;
           Serial.write((byte) DRIVER_CMD_TEXT);
           break;
+        case DRIVER_CMD_BATCH:
+          driverStatus = DRIVER_STATUS_BATCH_COUNT;
+          Serial.write((byte) DRIVER_CMD_BATCH);
+          break;
+        case DRIVER_CMD_HELLO:
+          framedMode = true;
+          frameStatus = FRAME_STATUS_HEADER;
+          frameHeaderIndex = 0;
+          writeHello();
+          break;
+        case DRIVER_CMD_QUERY_CODE: {
+          // Answer with the command followed by the information about the resident code, then stay in command mode
+          uint8_t info[CODE_INFO_SIZE + 1];
+          info[0] = DRIVER_CMD_QUERY_CODE;
+          packCodeInfo(info + 1);
+          Serial.write(info, CODE_INFO_SIZE + 1);
+          break;
+        }
+        case DRIVER_CMD_BUDGET:
+          driverStatus = DRIVER_STATUS_WAIT_BUDGET;
+          Serial.write((byte) DRIVER_CMD_BUDGET);
+          break;
+      }
+      break;
+    case DRIVER_STATUS_WAIT_BUDGET: {
+      if (Serial.available() < BUDGET_SIZE) return;
+      uint8_t budget[BUDGET_SIZE];
+      for (int i = 0; i < BUDGET_SIZE; i++) {
+        budget[i] = Serial.read();
       }
+      setCycleBudget(unpackUInt32(budget));
+
+      driverStatus = DRIVER_STATUS_WAIT_CMD;
+      Serial.write(DRIVER_INPUT_TERMINATOR);
       break;
+    }
     case DRIVER_STATUS_WAIT_REGEX:
       if (charsToRead == -1) {
         while (Serial.available() > 0) {
@@ -120,6 +545,7 @@ void loop() {
         }
       } else {
         Cicero.loadCode(input);
+        setResidentCode((const uint8_t*) input.c_str(), input.length());
         driverStatus = DRIVER_STATUS_WAIT_CMD;
         Serial.write(DRIVER_INPUT_TERMINATOR);
         break;
@@ -156,6 +582,7 @@ void loop() {
       } else {
         // Add the string terminator (needed by Cicero)
         input += '\0';
+        checkTextFits(input.length());
         // Load string to examine to CICERO RAM and begin computation
         Cicero.loadStringAndStart(input);
 
@@ -166,8 +593,8 @@ void loop() {
         break;
       }
       break;
-    case DRIVER_STATUS_EXECUTING:
-      uint32_t newStatus = Cicero.getStatus();
+    case DRIVER_STATUS_EXECUTING: {
+      uint32_t newStatus = Cicero.getStatusWithinBudget();
       // Run the checks only if the status has changed from the previous iteration of the loop()
       if (newStatus != ciceroStatus) {
         ciceroStatus = newStatus;
@@ -177,7 +604,8 @@ void loop() {
           case CICERO_STATUS_ACCEPTED:
           case CICERO_STATUS_REJECTED:
           case CICERO_STATUS_ERROR:
-            uint32_t elapsedCC = Cicero.getElapsedClockCycles();
+          case CICERO_STATUS_TIMEOUT:
+            uint32_t elapsedCC = elapsedCycles(ciceroStatus);
             Serial.print(ciceroStatus);
             Serial.print(elapsedCC);
             Serial.write(DRIVER_INPUT_TERMINATOR);
@@ -195,5 +623,61 @@ void loop() {
         }
       }
       break;
+    }
+    case DRIVER_STATUS_BATCH_COUNT:
+      if (Serial.available() < 2) return;
+      batchRemaining = readUInt16();
+
+      driverStatus = batchRemaining > 0 ? DRIVER_STATUS_BATCH_LENGTH : DRIVER_STATUS_WAIT_CMD;
+      break;
+    case DRIVER_STATUS_BATCH_LENGTH:
+      if (Serial.available() < 2) return;
+      charsToRead = readUInt16();
+      textBufferIndex = 0;
+
+      driverStatus = DRIVER_STATUS_BATCH_TEXT;
+      break;
+    case DRIVER_STATUS_BATCH_TEXT:
+      while (Serial.available() > 0 && charsToRead > 0) {
+        inChar = Serial.read();
+        charsToRead--;
+
+        // Keep the last byte of the buffer for the string terminator, the exceeding bytes are discarded
+        if (textBufferIndex < TEXT_BUFFER_SIZE - 1) {
+          textBuffer[textBufferIndex] = inChar;
+        }
+        textBufferIndex++;
+      }
+
+      if (charsToRead == 0) {
+        if (textBufferIndex >= TEXT_BUFFER_SIZE) {
+          // The string does not fit in the buffer, report an error without executing it
+          writeBatchRecord(CICERO_STATUS_ERROR, 0);
+
+          batchRemaining--;
+          driverStatus = batchRemaining > 0 ? DRIVER_STATUS_BATCH_LENGTH : DRIVER_STATUS_WAIT_CMD;
+          break;
+        }
+
+        // Add the string terminator (needed by Cicero)
+        textBuffer[textBufferIndex] = '\0';
+        checkTextFits(textBufferIndex + 1);
+        // Load string to examine to CICERO RAM and begin computation
+        Cicero.loadStringAndStart(textBufferIndex + 1, textBuffer);
+
+        driverStatus = DRIVER_STATUS_BATCH_EXECUTING;
+      }
+      break;
+    case DRIVER_STATUS_BATCH_EXECUTING: {
+      uint32_t newStatus = Cicero.getStatusWithinBudget();
+      if (isFinalStatus(newStatus)) {
+        writeBatchRecord(newStatus, elapsedCycles(newStatus));
+        Cicero.reset();
+
+        batchRemaining--;
+        driverStatus = batchRemaining > 0 ? DRIVER_STATUS_BATCH_LENGTH : DRIVER_STATUS_WAIT_CMD;
+      }
+      break;
+    }
   }
 }
@@ -0,0 +1,289 @@
+import asyncio
+import sys
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from CiceroSerial.bundle import Bundle
+from CiceroSerial.bytecode_cache import BytecodeCache, find_compiler_version
+from CiceroSerial.driver import CiceroOnArduino, executable_program
+from CiceroSerial import framing
+from CiceroSerial.framing import FrameType
+
+class AsyncCiceroOnArduino:
+    """Asyncio driver for CICERO on the Arduino MKR Vidor 4000.
+    It needs the binary framed protocol: strings are sent without waiting for the result of the previous ones,
+    so that the host encodes and transmits the next strings while CICERO is executing. At most 'window' requests
+    can be in flight, further requests wait until a result is received."""
+    def __init__(self, cicero_compiler_path:str, port:str, baudrate=9600, timeout=1, window=8, debug=False, bytecode_cache:BytecodeCache=None, packed_text=True, bundle:Bundle=None) -> None:
+        """Creates a new instance of the driver, connect() must be awaited before using it.
+
+        :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
+        :param str port: the port where to find the Arduno serial connection
+        :param int baudrate: the baudrate for the Arduino serial connection, defaults to 9600
+        :param int timeout: the time to wait for the protocol negotiation and for each answer (in seconds), defaults to 1
+        :param int window: the max number of requests in flight, defaults to 8
+        :param bool debug: if debug messages should be printed, defaults to False
+        :param BytecodeCache bytecode_cache: the cache for compiled regexes, if None a new one with the default settings is created, defaults to None
+        :param bool packed_text: if strings should be sent already laid out as CICERO RAM, when Arduino supports it, defaults to True
+        :param Bundle bundle: the precompiled programs of the regexes, used instead of the compiler for the regexes it contains, defaults to None
+        """
+        self.cicero_compiler_path = cicero_compiler_path
+        # Add CICERO compiler folder to PATH
+        if self.cicero_compiler_path not in sys.path:
+            sys.path.append(self.cicero_compiler_path)
+
+        self.bytecode_cache = bytecode_cache if bytecode_cache is not None else BytecodeCache()
+        self.bundle = bundle
+        # Programs of the bundle are used only if they come from the compiler that would compile the regexes, if there is one
+        self.compiler_version = find_compiler_version() if bundle is not None else None
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.window = window
+        self.debug = debug
+        self.packed_text = packed_text
+
+        self.regex_loaded = False
+        self.protocol_version = 0
+
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        # Futures waiting for a frame from Arduino, in the same order as the frames that have been sent
+        self._pending = deque()
+        self._window_semaphore = None
+        # Error that stopped the reader of the frames, the connection can't be used anymore
+        self._broken = None
+
+    async def connect(self) -> None:
+        """Opens the serial connection and negotiates the framed protocol.
+
+        :raises Exception: if pyserial-asyncio is not installed or Arduino does not support the framed protocol
+        """
+        # Optional dependency, needed only by the asyncio driver
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise Exception("pyserial-asyncio is needed by the asyncio driver, install it with 'pip install pyserial-asyncio' or use CiceroOnArduino instead")
+
+        self._broken = None
+        self._reader, self._writer = await serial_asyncio.open_serial_connection(url=self.port, baudrate=self.baudrate)
+        self._window_semaphore = asyncio.Semaphore(self.window)
+
+        self._writer.write(CiceroOnArduino.CMD_HELLO)
+        try:
+            read = await asyncio.wait_for(self._reader.readexactly(2), self.timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            read = b""
+        if len(read) != 2 or read[:1] != CiceroOnArduino.CMD_HELLO or not framing.MIN_PROTOCOL_VERSION <= read[1] <= framing.PROTOCOL_VERSION:
+            await self.close()
+            raise Exception("Arduino does not support version " + str(framing.PROTOCOL_VERSION) + " of the framed protocol, use CiceroOnArduino instead")
+        self.protocol_version = read[1]
+
+        self._reader_task = asyncio.create_task(self._read_frames())
+
+    async def close(self) -> None:
+        """Closes the serial connection, pending requests fail."""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+        self._fail_pending(Exception("Connection closed"))
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def __aenter__(self) -> "AsyncCiceroOnArduino":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _fail_pending(self, exc: Exception) -> None:
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _read_frames(self) -> None:
+        """Reads the frames sent by Arduino and resolves the pending requests in order."""
+        try:
+            while True:
+                header = await self._reader.readexactly(framing.FRAME_HEADER.size)
+                frame_type, length = framing.decode_header(header)
+                payload = await self._reader.readexactly(length) if length > 0 else b""
+                framing.check_crc(header, payload, await self._reader.readexactly(framing.FRAME_CRC.size))
+
+                if self.debug:
+                    print("Rx frame ", hex(frame_type), " (", length, " bytes)")
+
+                if not self._pending:
+                    raise Exception("Unexpected frame from Arduino: " + hex(frame_type))
+                expected_type, future = self._pending.popleft()
+
+                if frame_type == FrameType.NACK:
+                    future.set_exception(Exception("Frame rejected by Arduino: " + framing.describe_nack(payload)))
+                elif frame_type != expected_type:
+                    future.set_exception(Exception("Unexpected frame type: expected " + hex(expected_type) + " but got " + hex(frame_type)))
+                else:
+                    future.set_result(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # The stream is not in sync anymore, every pending request fails and so will the next ones
+            self._broken = exc
+            self._fail_pending(exc)
+
+    async def _submit(self, frame_type: FrameType, payload: bytes, expected_type: FrameType) -> asyncio.Future:
+        """Sends a frame, waiting if the window of requests in flight is full.
+
+        :param FrameType frame_type: the type of the frame
+        :param bytes payload: the payload of the frame
+        :param FrameType expected_type: the type of the frame that Arduino will send as answer
+        :raises Exception: if the driver is not connected or the connection is broken
+        :return asyncio.Future: future that will contain the payload of the answer
+        """
+        return await self._submit_frame(framing.encode_frame(frame_type, payload), expected_type)
+
+    async def _submit_frame(self, frame: bytes|bytearray, expected_type: FrameType) -> asyncio.Future:
+        """Sends an already built frame, waiting if the window of requests in flight is full.
+
+        :param bytes|bytearray frame: the frame, ready to be sent
+        :param FrameType expected_type: the type of the frame that Arduino will send as answer
+        :raises Exception: if the driver is not connected or the connection is broken
+        :return asyncio.Future: future that will contain the payload of the answer
+        """
+        if self._writer is None:
+            raise Exception("Trying to send a request before connecting")
+
+        await self._window_semaphore.acquire()
+        # Checked after waiting for the window, as the connection may have broken meanwhile: nothing would answer the request
+        if self._broken is not None:
+            self._window_semaphore.release()
+            raise Exception("The connection with Arduino is broken: " + str(self._broken)) from self._broken
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._window_semaphore.release())
+
+        # No await between appending and writing, so that requests and answers are always in the same order
+        self._pending.append((expected_type, future))
+        self._writer.write(frame)
+        await self._writer.drain()
+        return future
+
+    async def _answer(self, future: asyncio.Future) -> bytes:
+        """Waits for the answer of a request.
+
+        :param asyncio.Future future: the future returned by _submit()
+        :raises Exception: if Arduino does not answer within the timeout, the connection can't be used anymore
+        :return bytes: the payload of the answer
+        """
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # A late answer would be taken for the answer of the next request, every pending request fails and so will the next ones
+            exc = Exception("Arduino did not answer within " + str(self.timeout) + " seconds")
+            self._broken = exc
+            self._fail_pending(exc)
+            raise exc from None
+
+    def _parse_result(self, payload: bytes) -> tuple[bool,int,float]:
+        """Converts the payload of a result frame into the values returned by the driver.
+
+        :param bytes payload: the payload of the result frame
+        :return tuple[bool,int,float]: if a match was found, the elapsed clock cycles and the estimated execution time in microseconds, TIMEOUT for all three if the execution exceeded its cycle budget
+        """
+        if len(payload) != framing.RESULT_PAYLOAD.size:
+            raise Exception("Invalid result: " + payload.hex())
+
+        status, elapsedCC = framing.RESULT_PAYLOAD.unpack(payload)
+        if str(status) == CiceroOnArduino.CICERO_ERROR:
+            print("WARN: CICERO error")
+        if str(status) == CiceroOnArduino.CICERO_TIMEOUT:
+            # Same values as CiceroOnArduino.test_loaded_regex()
+            return CiceroOnArduino.TIMEOUT, CiceroOnArduino.TIMEOUT, CiceroOnArduino.TIMEOUT
+
+        execTime = elapsedCC / CiceroOnArduino.CICERO_CLOCK_FREQ * 1e6
+        return str(status) == CiceroOnArduino.MATCH_FOUND, elapsedCC, execTime
+
+    async def load_regex(self, regex: str, regex_format: str="pythonre") -> None:
+        """Compiles the regex to bytecode, or takes it from the bundle, and loads it to CICERO memory.
+        Strings sent before are still executed with the previous regex.
+
+        :param str regex: the new regex to load
+        :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+        :raises RegexError: if the regex does not compile or its code does not fit in CICERO RAM, nothing is sent to Arduino
+        """
+        regex_code = executable_program(regex, regex_format, self.bytecode_cache, self.bundle, self.compiler_version)
+        await self._answer(await self._submit(FrameType.REGEX, regex_code, FrameType.ACK))
+        self.regex_loaded = True
+
+    async def set_cycle_budget(self, cycle_budget: int|None) -> None:
+        """Sets the max clock cycles of the strings sent from now on, see CiceroOnArduino.set_cycle_budget().
+
+        :param int|None cycle_budget: the number of clock cycles, None or 0 for no limit
+        :raises Exception: if Arduino does not support cycle budgets
+        """
+        if self.protocol_version < 3:
+            raise Exception("Arduino does not support cycle budgets, version 3 of the framed protocol is needed")
+        payload = framing.BUDGET_PAYLOAD.pack(min(int(cycle_budget or 0), CiceroOnArduino.MAX_CYCLE_BUDGET))
+        await self._answer(await self._submit(FrameType.BUDGET, payload, FrameType.ACK))
+
+    async def _submit_string(self, string: str|bytes) -> asyncio.Future:
+        if not self.regex_loaded:
+            raise Exception("Trying to load a string before loading the regex")
+        string = string.encode("utf-8") if isinstance(string, str) else string
+        # Strings too long for a TEXT_PACKED frame are sent in TEXT frames, as CiceroOnArduino does
+        if self.packed_text and self.protocol_version >= 2 and len(string) <= framing.MAX_PACKED_TEXT_LENGTH:
+            frame = bytearray(framing.packed_text_frame_size(len(string)))
+            framing.pack_text_frame_into(frame, 0, string)
+            return await self._submit_frame(frame, FrameType.RESULT)
+        return await self._submit(FrameType.TEXT, string, FrameType.RESULT)
+
+    async def match(self, string: str|bytes) -> tuple[bool,int,float]:
+        """Executes CICERO on a string with the loaded regex.
+
+        :param str|bytes string: the string to test
+        :return tuple[bool,int,float]: if a match was found, the elapsed clock cycles and the estimated execution time in microseconds
+        """
+        return self._parse_result(await self._answer(await self._submit_string(string)))
+
+    async def stream(self, strings: Iterable[str|bytes]|AsyncIterable[str|bytes]) -> AsyncIterator[tuple[bool,int,float]]:
+        """Executes CICERO on all the given strings with the loaded regex, keeping up to 'window' strings in flight.
+
+        :param Iterable[str|bytes]|AsyncIterable[str|bytes] strings: the strings to test
+        :yield tuple[bool,int,float]: for each string in order, if a match was found, the elapsed clock cycles and the estimated execution time in microseconds
+        """
+        in_flight = deque()
+
+        async def iterate():
+            if hasattr(strings, "__aiter__"):
+                async for string in strings:
+                    yield string
+            else:
+                for string in strings:
+                    yield string
+
+        async for string in iterate():
+            if len(in_flight) >= self.window:
+                yield self._parse_result(await self._answer(in_flight.popleft()))
+            in_flight.append(await self._submit_string(string))
+
+        while in_flight:
+            yield self._parse_result(await self._answer(in_flight.popleft()))
+
+    async def load_regex_and_test_strings(self, regex: str, strings: Iterable[str|bytes], regex_format="pythonre") -> list[tuple[bool,int,float]]:
+        """Loads a regex and test all the given strings on it.
+
+        :param str regex: the regex to load
+        :param Iterable[str|bytes] strings: the strings to test
+        :param str regex_format: format of the regex (see compiler), defaults to "pythonre"
+        :return list[tuple[bool,int,float]]: if a match was found, the elapsed clock cycles and the estimated execution time for each string
+        """
+        await self.load_regex(regex, regex_format)
+        return [result async for result in self.stream(strings)]
@@ -0,0 +1,202 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from enum import IntEnum
+
+from CiceroSerial.isa import RAM_QWORDS, code_qwords
+
+# A bundle starts with the header, followed by an entry of the index for each regex, in the order of the regex file, and by the data
+MAGIC = b"CICB"
+VERSION = 2
+# Magic, version, compile options, number of regexes, regex format and compiler version (padded with zeros)
+HEADER = struct.Struct("<4sHHI16s32s")
+# Offset and length of the data, CRC32 of the data, hash of the regex, status
+ENTRY = struct.Struct("<QIIQB3x")
+
+# Bits of the compile options
+OPTION_O1 = 0x1
+OPTION_NO_PREFIX = 0x2
+OPTION_NO_POSTFIX = 0x4
+
+# Longest program that leaves room in CICERO RAM for the terminator of a string
+MAX_CODE_LENGTH = (RAM_QWORDS - code_qwords(1)) * 8
+
+class ProgramStatus(IntEnum):
+    """Enum containing the outcome of the compilation of a regex, the data of failed regexes is the error message."""
+    OK = 0
+    COMPILE_ERROR = 1
+    TOO_LARGE = 2
+
+def regex_hash(regex: str) -> int:
+    """Hashes a regex to find its program in a bundle.
+
+    :param str regex: the regex
+    :return int: the first 8 bytes of its SHA-256, as an unsigned integer
+    """
+    return int.from_bytes(hashlib.sha256(regex.encode("utf-8")).digest()[:8], "little")
+
+def compile_options(O1: bool=True, no_prefix: bool=False, no_postfix: bool=False) -> int:
+    """Packs the options of the compiler into the bits of the header.
+
+    :param bool O1: if the code is optimized, defaults to True
+    :param bool no_prefix: if the regex must match at the start of the string, defaults to False
+    :param bool no_postfix: if the regex must match at the end of the string, defaults to False
+    :return int: the bits of the options
+    """
+    return (OPTION_O1 if O1 else 0) | (OPTION_NO_PREFIX if no_prefix else 0) | (OPTION_NO_POSTFIX if no_postfix else 0)
+
+def write_bundle(path: str, regexes: list[str], programs: list[tuple[ProgramStatus,bytes]], regex_format: str, options: int=compile_options(), compiler_version: str="") -> None:
+    """Writes the programs of the regexes of a file to a bundle, atomically.
+
+    :param str path: the path of the bundle
+    :param list[str] regexes: the regexes, in the order of the file
+    :param list[tuple[ProgramStatus,bytes]] programs: for each regex, the outcome of its compilation and its bytecode, or the error message
+    :param str regex_format: the format of the regexes (see compiler)
+    :param int options: the options of the compiler, see compile_options(), defaults to compile_options()
+    :param str compiler_version: the version of the compiler (see get_compiler_version()), defaults to ""
+    :raises Exception: if the regexes and the programs are not as many or the regex format or the compiler version are too long
+    """
+    if len(regexes) != len(programs):
+        raise Exception(f"{len(regexes)} regexes but {len(programs)} programs")
+    encoded_format = regex_format.encode("utf-8")
+    if len(encoded_format) > 16:
+        raise Exception("Regex format '" + regex_format + "' is too long for the bundle header")
+    encoded_version = compiler_version.encode("utf-8")
+    if len(encoded_version) > 32:
+        raise Exception("Compiler version '" + compiler_version + "' is too long for the bundle header")
+
+    offset = HEADER.size + ENTRY.size * len(programs)
+    index = bytearray()
+    for regex, (status, data) in zip(regexes, programs):
+        index += ENTRY.pack(offset, len(data), zlib.crc32(data), regex_hash(regex), status)
+        offset += len(data)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, options, len(programs), encoded_format, encoded_version))
+        f.write(index)
+        for _, data in programs:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+class Bundle:
+    """Read-only, memory-mapped bundle of the programs of the regexes of a file, written by compile_for_arduino.py -regexfile.
+    Programs are loaded by the index of their regex in the file, or found by the regex itself, without the compiler."""
+    def __init__(self, path: str) -> None:
+        """Opens a bundle.
+
+        :param str path: the path of the bundle
+        :raises Exception: if the file is not a bundle or is truncated
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b""
+        if len(self._mapped) < HEADER.size:
+            raise Exception("'" + path + "' is not a bundle of programs")
+        magic, version, self.options, self.count, regex_format, compiler_version = HEADER.unpack_from(self._mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("'" + path + "' is not a bundle of programs of version " + str(VERSION))
+        self.regex_format = regex_format.rstrip(b"\0").decode("utf-8")
+        self.compiler_version = compiler_version.rstrip(b"\0").decode("utf-8")
+
+        data_start = HEADER.size + ENTRY.size * self.count
+        if len(self._mapped) < data_start:
+            raise Exception("The index of '" + path + "' is truncated")
+        self._entries = [ENTRY.unpack_from(self._mapped, HEADER.size + ENTRY.size * i) for i in range(self.count)]
+        if any(offset < data_start or offset + length > len(self._mapped) for offset, length, _, _, _ in self._entries):
+            raise Exception("The data of '" + path + "' is truncated")
+        self._by_hash = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "Bundle":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def matches_options(self, regex_format: str, O1: bool=True, no_prefix: bool=False, no_postfix: bool=False, compiler_version: str|None=None) -> bool:
+        """Checks if the programs were compiled with the given format and options, and by the given compiler.
+
+        :param str regex_format: the format of the regexes (see compiler)
+        :param bool O1: if the code is optimized, defaults to True
+        :param bool no_prefix: if the regex must match at the start of the string, defaults to False
+        :param bool no_postfix: if the regex must match at the end of the string, defaults to False
+        :param str|None compiler_version: the version of the compiler that would compile the regexes (see find_compiler_version()),
+                                          None if there is no compiler and the bundle is the only source of programs, defaults to None
+        :return bool: True if the programs of the bundle can be used instead of compiling
+        """
+        if compiler_version is not None and self.compiler_version != compiler_version:
+            return False
+        return self.regex_format == regex_format and self.options == compile_options(O1, no_prefix, no_postfix)
+
+    def status(self, index: int) -> ProgramStatus:
+        """Gets the outcome of the compilation of a regex.
+
+        :param int index: the index of the regex in the file
+        :return ProgramStatus: the status of its program
+        """
+        return ProgramStatus(self._entries[index][4])
+
+    def crc32(self, index: int) -> int:
+        """Gets the CRC32 of the program of a regex, the same that Arduino reports for its resident code.
+
+        :param int index: the index of the regex in the file
+        :return int: the CRC32
+        """
+        return self._entries[index][2]
+
+    def _data(self, index: int) -> bytes:
+        offset, length, _, _, _ = self._entries[index]
+        return self._mapped[offset:offset + length]
+
+    def error(self, index: int) -> str|None:
+        """Gets the reason why a regex has no program.
+
+        :param int index: the index of the regex in the file
+        :return str|None: the error message, None if the regex has a program
+        """
+        if self.status(index) == ProgramStatus.OK:
+            return None
+        return self._data(index).decode("utf-8", errors="replace")
+
+    def code(self, index: int) -> bytes:
+        """Gets the program of a regex.
+
+        :param int index: the index of the regex in the file
+        :raises Exception: if the regex has no program, because it did not compile or it does not fit in CICERO RAM
+        :return bytes: the bytecode
+        """
+        if self.status(index) != ProgramStatus.OK:
+            raise Exception(f"Regex {index} of the bundle has no program ({self.status(index).name}): {self.error(index)}")
+        return self._data(index)
+
+    def find(self, regex: str) -> int|None:
+        """Finds the index of a regex in the bundle.
+
+        :param str regex: the regex
+        :return int|None: the index of its first occurrence, None if it is not in the bundle
+        """
+        if self._by_hash is None:
+            self._by_hash = {}
+            for index, entry in reversed(list(enumerate(self._entries))):
+                self._by_hash[entry[3]] = index
+        return self._by_hash.get(regex_hash(regex))
+
+    def stats(self) -> dict[str,int]:
+        """Counts the programs of the bundle by status.
+
+        :return dict[str,int]: the number of regexes for each status
+        """
+        counts = dict.fromkeys((status.name for status in ProgramStatus), 0)
+        for entry in self._entries:
+            counts[ProgramStatus(entry[4]).name] += 1
+        return counts
+
+    def close(self) -> None:
+        if isinstance(self._mapped, mmap.mmap):
+            self._mapped.close()
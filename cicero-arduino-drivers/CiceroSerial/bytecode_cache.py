@@ -0,0 +1,246 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Callable
+
+# Default location of the persistent tier, can be overridden with the CICERO_BYTECODE_CACHE environment variable
+DEFAULT_CACHE_DIR = os.environ.get("CICERO_BYTECODE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "cicero-bytecode"))
+
+def code_to_bytes(code: str) -> bytearray:
+    """Converts the output of CICERO compiler into bytecode that can be sent to Arduino.
+
+    :param str code: the compiled code, a string containing bytes represented as hex separated by '\\n'
+    :return bytearray: the bytecode, two bytes (big-endian) for each instruction
+    """
+    code_bytes = bytearray()
+    for line in code.split('\n'):
+        if line.lstrip() == '':
+            break
+        tmp = int(line, 16)
+        code_bytes += tmp.to_bytes(2, 'big')
+    return code_bytes
+
+def get_compiler_version() -> str:
+    """Gets a string identifying the version of CICERO compiler that is currently importable.
+    If the compiler does not expose a version, the hash of all the Python sources of its folder is used instead,
+    so that a change to any module of the compiler invalidates the cached bytecode.
+
+    :return str: the compiler version
+    """
+    import re2compiler
+
+    version = getattr(re2compiler, "__version__", None)
+    if version is not None:
+        return str(version)
+
+    compiler_dir = os.path.dirname(os.path.abspath(re2compiler.__file__))
+    sources = []
+    for root, dirs, files in os.walk(compiler_dir):
+        # Walk in a fixed order, the hash must not depend on the order of the directory entries
+        dirs.sort()
+        sources += [os.path.join(root, file) for file in sorted(files) if file.endswith(".py")]
+
+    digest = hashlib.sha256()
+    for path in sources:
+        digest.update(os.path.relpath(path, compiler_dir).replace(os.sep, "/").encode("utf-8") + b"\0")
+        with open(path, 'rb') as f:
+            source = f.read()
+        digest.update(len(source).to_bytes(8, "little"))
+        digest.update(source)
+    return "src-" + digest.hexdigest()[:16]
+
+def find_compiler_version() -> str|None:
+    """Gets the version of CICERO compiler like get_compiler_version(), if the compiler can be imported.
+
+    :return str|None: the compiler version, None if the compiler is not available
+    """
+    try:
+        return get_compiler_version()
+    except ImportError:
+        return None
+
+class BytecodeCache:
+    """Content-addressed cache for the bytecode produced by CICERO compiler.
+    It has two tiers: a LRU dictionary in memory and a directory on disk that is bounded in size,
+    when the size is exceeded the least recently used files are deleted."""
+    def __init__(self, cache_dir: str=DEFAULT_CACHE_DIR, max_memory_entries: int=4096, max_disk_bytes: int=64*1024*1024) -> None:
+        """Creates a new cache.
+
+        :param str cache_dir: the directory for the persistent tier, None to keep the cache only in memory, defaults to DEFAULT_CACHE_DIR
+        :param int max_memory_entries: the max number of programs kept in memory, defaults to 4096
+        :param int max_disk_bytes: the max size in bytes of the persistent tier, defaults to 64 MiB
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._compiler_version = None
+
+        # Counters exposed for reporting
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._disk_bytes = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    @property
+    def hits(self) -> int:
+        """The total number of lookups that did not need compilation."""
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def compiler_version(self) -> str:
+        """The version of the compiler, computed lazily as it requires importing the compiler."""
+        if self._compiler_version is None:
+            self._compiler_version = get_compiler_version()
+        return self._compiler_version
+
+    def make_key(self, regex: str, regex_format: str, O1: bool, no_prefix: bool, no_postfix: bool) -> str:
+        """Computes the key that identifies a compiled program.
+
+        :param str regex: the regex
+        :param str regex_format: the format of the regex (see compiler)
+        :param bool O1: if compiler optimizations are enabled
+        :param bool no_prefix: if the regex can match only at the start of the string
+        :param bool no_postfix: if the regex can match only at the end of the string
+        :return str: the hex digest identifying the program
+        """
+        key = "\x00".join([self.compiler_version, regex_format, str(int(O1)), str(int(no_prefix)), str(int(no_postfix)), regex])
+        return hashlib.sha256(key.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".bin")
+
+    def _scan_disk(self) -> list[tuple[str,int,float]]:
+        """Lists the files of the persistent tier.
+
+        :return list[tuple[str,int,float]]: path, size and last access time of each cached program
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if not file.endswith(".bin"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _remember(self, key: str, code: bytes) -> None:
+        self._memory[key] = code
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> bytes|None:
+        """Looks up a program in the cache, updating the counters.
+
+        :param str key: the key of the program, see make_key()
+        :return bytes|None: the bytecode, or None if it is not cached
+        """
+        code = self._memory.get(key)
+        if code is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return code
+
+        if self.cache_dir:
+            path = self._key_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    code = f.read()
+                # Refresh the modification time, it is used as the last access time for the eviction
+                os.utime(path)
+            except OSError:
+                code = None
+
+            if code is not None:
+                self._remember(key, code)
+                self.disk_hits += 1
+                return code
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, code: bytes) -> None:
+        """Stores a program in both tiers of the cache.
+
+        :param str key: the key of the program, see make_key()
+        :param bytes code: the bytecode
+        """
+        code = bytes(code)
+        self._remember(key, code)
+
+        if not self.cache_dir:
+            return
+
+        path = self._key_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A program already on disk is replaced, its size must not be counted twice
+        try:
+            self._disk_bytes -= os.path.getsize(path)
+        except OSError:
+            pass
+        # Write to a temporary file and rename it, so that concurrent processes never read a partial program
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(code)
+        os.replace(tmp_path, path)
+
+        self._disk_bytes += len(code)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Deletes the least recently used programs from disk until the size of the persistent tier is below 3/4 of the limit."""
+        entries = sorted(self._scan_disk(), key=lambda entry: entry[2])
+        self._disk_bytes = sum(size for _, size, _ in entries)
+
+        target = self.max_disk_bytes * 3 // 4
+        for path, size, _ in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+
+    def get_or_compile(self, regex: str, compile_function: Callable[[], bytes], regex_format: str="pythonre", O1: bool=True, no_prefix: bool=False, no_postfix: bool=False) -> bytes:
+        """Gets a program from the cache, compiling and storing it if it is not present.
+
+        :param str regex: the regex
+        :param Callable[[], bytes] compile_function: function that compiles the regex and returns the bytecode
+        :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+        :param bool O1: if compiler optimizations are enabled, defaults to True
+        :param bool no_prefix: if the regex can match only at the start of the string, defaults to False
+        :param bool no_postfix: if the regex can match only at the end of the string, defaults to False
+        :return bytes: the bytecode
+        """
+        key = self.make_key(regex, regex_format, O1, no_prefix, no_postfix)
+        code = self.get(key)
+        if code is None:
+            code = bytes(compile_function())
+            self.put(key, code)
+        return code
+
+    def stats(self) -> dict[str,int]:
+        """Gets the counters of the cache.
+
+        :return dict[str,int]: the number of hits for each tier, the number of misses and the size of the persistent tier
+        """
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
@@ -1,6 +1,20 @@
+import mmap
 import serial
+import struct
 import sys
+import zlib
+from contextlib import AbstractContextManager, nullcontext
 from enum import Enum
+from itertools import islice
+from typing import Iterable, Iterator
+
+from CiceroSerial.bundle import Bundle
+from CiceroSerial.bytecode_cache import BytecodeCache, code_to_bytes, find_compiler_version
+from CiceroSerial import framing
+from CiceroSerial.framing import FrameType
+from CiceroSerial.instrumentation import PhaseRecorder
+from CiceroSerial.isa import RAM_QWORDS, code_qwords
+from CiceroSerial.verifier import GoldenModelVerifier
 
 def decode_bytes_as_hex(data_bytes: bytes) -> str:
     """Formats a bytestring as a string containing the hex representation of the bytes.
@@ -22,11 +36,82 @@ def debug_print(data_bytes: bytes, bytes_num: int, tx: bool) -> None:
     debug_str += "(" + str(bytes_num) + "): " + decode_bytes_as_hex(data_bytes)
     print(debug_str)
 
+def compile_regex(regex: str, bytecode_cache: BytecodeCache, regex_format: str="pythonre") -> bytes:
+    """Compiles the regex to obtain bytecode for CICERO, the bytecode is looked up in the cache first.
+    CICERO compiler folder must have been added to PATH.
+
+    :param str regex: the regex to compile
+    :param BytecodeCache bytecode_cache: the cache for compiled regexes
+    :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+    :return bytes: the compiled bytecode
+    """
+    def compile_uncached() -> bytearray:
+        # Import CICERO compiler (folder containing it has been added to PATH)
+        import re2compiler
+
+        code = re2compiler.compile(data=regex, O1=True, no_postfix=False, no_prefix=False, frontend=regex_format)
+
+        # Code is returned as a string containing bytes represented as hex separated by '\n'
+        # We need to convert it into a byte array that can be sent to Arduino
+        return code_to_bytes(code)
+
+    return bytecode_cache.get_or_compile(regex, compile_uncached, regex_format=regex_format, O1=True, no_prefix=False, no_postfix=False)
+
+def find_program(regex: str, regex_format: str, bytecode_cache: BytecodeCache, bundle: Bundle=None, compiler_version: str|None=None) -> bytes:
+    """Gets the bytecode of a regex for CICERO, from the bundle if it has the regex compiled with the same format and compiler,
+    otherwise compiling it (see compile_regex()).
+
+    :param str regex: the regex
+    :param str regex_format: the format of the regex (see compiler)
+    :param BytecodeCache bytecode_cache: the cache for compiled regexes
+    :param Bundle bundle: the precompiled programs of the regexes, defaults to None
+    :param str|None compiler_version: the version of the installed compiler, None if there is none (see Bundle.matches_options()), defaults to None
+    :raises Exception: if the regex does not compile, or the bundle records that it does not compile or does not fit in CICERO RAM
+    :return bytes: the bytecode
+    """
+    # The drivers always compile with the default options of the compiler
+    if bundle is not None and bundle.matches_options(regex_format, compiler_version=compiler_version):
+        index = bundle.find(regex)
+        if index is not None:
+            return bundle.code(index)
+    return compile_regex(regex, bytecode_cache, regex_format)
+
+def executable_program(regex: str, regex_format: str, bytecode_cache: BytecodeCache, bundle: Bundle=None, compiler_version: str|None=None) -> bytes:
+    """Gets the bytecode of a regex like find_program(), checking that CICERO can execute it.
+
+    :param str regex: the regex
+    :param str regex_format: the format of the regex (see compiler)
+    :param BytecodeCache bytecode_cache: the cache for compiled regexes
+    :param Bundle bundle: the precompiled programs of the regexes, defaults to None
+    :param str|None compiler_version: the version of the installed compiler, None if there is none (see Bundle.matches_options()), defaults to None
+    :raises RegexError: if the regex does not compile or its code does not fit in CICERO RAM
+    :return bytes: the bytecode
+    """
+    try:
+        regex_code = find_program(regex, regex_format, bytecode_cache, bundle, compiler_version)
+    except Exception as exc:
+        raise RegexError("Could not compile regex '" + regex + "': " + str(exc)) from exc
+    # One qword is needed at least for the string terminator
+    if code_qwords(len(regex_code)) >= RAM_QWORDS:
+        raise RegexError("The code of regex '" + regex + "' does not fit in CICERO RAM (" + str(len(regex_code)) + " bytes)")
+    return regex_code
+
+# Used to time phases when there is no instrumentation
+_NO_PHASE = nullcontext()
+
+class RegexError(Exception):
+    """The regex can't be executed on CICERO: the compiler rejected it or its code does not fit in CICERO RAM.
+    Nothing has been sent to Arduino, so the connection can still be used for other regexes."""
+
 class CiceroOnArduino:
     """Driver for CICERO on the Arduino MKR Vidor 4000."""
     # Commands for the Arduino
     CMD_REGEX = b"\x00"
     CMD_TEXT = b"\x01"
+    CMD_BATCH = b"\x02"
+    CMD_HELLO = b"\x03"
+    CMD_QUERY_CODE = b"\x04"
+    CMD_BUDGET = b"\x05"
     CMD_EXIT_TEXT = b"-2\xFF"
 
     # Special character to be used as a delimiter
@@ -36,6 +121,23 @@ class CiceroOnArduino:
     MATCH_FOUND = "2"
     MATCH_NOT_FOUND = "3"
     CICERO_ERROR = "4"
+    CICERO_TIMEOUT = "5"
+
+    # Value of the match, of the clock cycles and of the execution time of a string whose execution exceeded its cycle budget
+    TIMEOUT = "TIMEOUT"
+    # Max cycle budget, sent as a 32 bit unsigned integer
+    MAX_CYCLE_BUDGET = 0xFFFFFFFF
+
+    # Format of the batch mode messages: the number of strings and the length of each string are 16 bit unsigned integers,
+    # each result is composed of 1 byte of status and 4 bytes of elapsed clock cycles (all little-endian)
+    BATCH_HEADER = struct.Struct("<H")
+    BATCH_RECORD = struct.Struct("<BI")
+    # Answer to the query code command: the length and the CRC32 of the code loaded on CICERO (little-endian)
+    CODE_INFO = framing.CODE_INFO_PAYLOAD
+    # Max number of strings sent in a single batch
+    BATCH_MAX_STRINGS = 64
+    # Size of the buffer where Arduino stores a string, including the terminator
+    TEXT_BUFFER_SIZE = 4096
     
     # CICERO clock frequency on the FPGA on the Arduino to estimate execution time
     CICERO_CLOCK_FREQ = 24e6
@@ -46,7 +148,7 @@ class CiceroOnArduino:
         TEXT_MODE = 2
         EXECUTION_MODE = 3
 
-    def __init__(self, cicero_compiler_path:str, port:str, baudrate=9600, timeout=1, debug=False) -> None:
+    def __init__(self, cicero_compiler_path:str, port:str, baudrate=9600, timeout=1, debug=False, bytecode_cache:BytecodeCache=None, framed_protocol=True, verifier:GoldenModelVerifier=None, skip_resident_upload=True, instrumentation:PhaseRecorder=None, packed_text=True, bundle:Bundle=None) -> None:
         """Creates a new instance of the driver.
 
         :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
@@ -54,41 +156,119 @@ class CiceroOnArduino:
         :param int baudrate: the baudrate for the Arduino serial connection, defaults to 9600
         :param int timeout: the time to wait for data sent from Arduino (in seconds), defaults to 1
         :param bool debug: if debug messages should be printed, defaults to False
+        :param BytecodeCache bytecode_cache: the cache for compiled regexes, if None a new one with the default settings is created, defaults to None
+        :param bool framed_protocol: if the binary framed protocol should be negotiated with Arduino, the old protocol is used if Arduino doesn't support it, defaults to True
+        :param GoldenModelVerifier verifier: the verifier that checks the results against the golden model, if None results are not checked, defaults to None
+        :param bool skip_resident_upload: if the upload of a regex should be skipped when its code is already loaded on CICERO, also after a reconnection, defaults to True
+        :param PhaseRecorder instrumentation: the recorder of the latency of each phase of the communication, if None nothing is measured, defaults to None
+        :param bool packed_text: if strings should be sent already laid out as CICERO RAM, when Arduino supports it, defaults to True
+        :param Bundle bundle: the precompiled programs of the regexes, used instead of the compiler for the regexes it contains, defaults to None
         """
         self.cicero_compiler_path = cicero_compiler_path
         # Add CICERO compiler folder to PATH
-        sys.path.append(self.cicero_compiler_path)
+        if self.cicero_compiler_path not in sys.path:
+            sys.path.append(self.cicero_compiler_path)
+
+        self.bytecode_cache = bytecode_cache if bytecode_cache is not None else BytecodeCache()
+        self.bundle = bundle
+        # Programs of the bundle are used only if they come from the compiler that would compile the regexes, if there is one
+        self.compiler_version = find_compiler_version() if bundle is not None else None
+        self.verifier = verifier
+        self.instrumentation = instrumentation
 
         self.arduino = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
         
         self.debug = debug
         self.regex_loaded = False
+        # Length in bytes of the code loaded on CICERO, the rest of the RAM is available for strings
+        self.regex_code_length = 0
+        # Set to False the first time that Arduino does not recognize the batch command, to fall back to one string at a time
+        self.batch_supported = True
         # On power up or reset the Arduino is in command mode
         self.driver_status = self.DriverStatus.COMMAND_MODE
+
+        # Version of the framed protocol in use, 0 if the old protocol is used
+        self.protocol_version = self._negotiate_protocol() if framed_protocol else 0
+        self.packed_text = packed_text and self.protocol_version >= 2
+        # Budget frames were added in version 3 of the framed protocol, with the old protocol support is detected the first time a budget is set
+        self.budget_supported = self.protocol_version >= 3 if self.framed else True
+        # Cycle budget set on Arduino, None if unknown, as it survives a reconnection of the driver
+        self.cycle_budget = None
+        # Reused to build the frames of packed strings, so that they are not allocated for every string
+        self._frame_buffer = bytearray()
+
+        # Length and CRC32 of the code loaded on CICERO, None if unknown
+        self.resident_code = self._query_resident_code() if skip_resident_upload else None
+        self.skip_resident_upload = skip_resident_upload and self.resident_code is not None
+        if self.resident_code is not None and self.resident_code[0] > 0:
+            self.regex_loaded = True
+            self.regex_code_length = self.resident_code[0]
+        self.regex_uploads = 0
+        self.regex_uploads_skipped = 0
+
+    @property
+    def framed(self) -> bool:
+        """If the binary framed protocol is in use."""
+        return self.protocol_version > 0
+
+    def _negotiate_protocol(self) -> int:
+        """Asks Arduino to switch to the binary framed protocol.
+        Arduino answers with the version of the protocol that it implements, older firmware does not answer at all.
+
+        :return int: the version of the protocol in use, 0 if the old protocol should be used
+        """
+        self._serial_write(self.CMD_HELLO)
+        read = self._serial_read_exact(2)
+
+        if len(read) != 2 or read[:1] != self.CMD_HELLO:
+            # Discard anything that older firmware could have sent
+            self.arduino.reset_input_buffer()
+            return 0
+
+        if not framing.MIN_PROTOCOL_VERSION <= read[1] <= framing.PROTOCOL_VERSION:
+            raise Exception("Unsupported protocol version: Arduino implements version " + str(read[1]) + " but the driver implements versions from " + str(framing.MIN_PROTOCOL_VERSION) + " to " + str(framing.PROTOCOL_VERSION))
+        return read[1]
+
+    def _phase(self, phase: str) -> AbstractContextManager:
+        """Times a phase of the communication, if instrumentation is enabled.
+
+        :param str phase: the name of the phase (see instrumentation.PHASES)
+        :return AbstractContextManager: the context manager that measures the phase
+        """
+        if self.instrumentation is None:
+            return _NO_PHASE
+        return self.instrumentation.phase(phase)
+
+    def _query_resident_code(self) -> tuple[int,int]|None:
+        """Asks Arduino the length and the CRC32 of the code loaded on CICERO, that survive a reconnection of the driver.
+
+        :return tuple[int,int]|None: the length (0 if no valid code is loaded) and the CRC32 of the code, None if Arduino does not support the query
+        """
+        if self.framed:
+            self._send_frame(FrameType.QUERY_CODE)
+            frame_type, payload = framing.read_frame(self._serial_read_exact)
+            # Older firmware rejects unknown frame types
+            if frame_type != FrameType.CODE_INFO or len(payload) != self.CODE_INFO.size:
+                return None
+            return self.CODE_INFO.unpack(payload)
+
+        self._serial_write(self.CMD_QUERY_CODE)
+        read = self._serial_read_exact(1 + self.CODE_INFO.size)
+        if len(read) != 1 + self.CODE_INFO.size or read[:1] != self.CMD_QUERY_CODE:
+            # Older firmware ignores unknown commands
+            self.arduino.reset_input_buffer()
+            return None
+        return self.CODE_INFO.unpack(read[1:])
     
-    def _compile_regex(self, regex: str, regex_format = "pythonre") -> bytearray:
-        """Compiles the regex to obtain bytecode for CICERO.
+    def _compile_regex(self, regex: str, regex_format = "pythonre") -> bytes:
+        """Compiles the regex to obtain bytecode for CICERO, the bytecode is looked up in the bundle and in the cache first.
 
         :param str regex: the regex to compile
         :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
-        :return bytearray: the compiled bytecode
+        :raises Exception: if the bundle records that the regex does not compile or does not fit in CICERO RAM
+        :return bytes: the compiled bytecode
         """
-        # Import CICERO compiler (folder containing it has been added to PATH)
-        import re2compiler
-        
-        code = re2compiler.compile(data=regex, O1=True, no_postfix=False, no_prefix=False, frontend=regex_format)
-
-        # Code is returned as a string containing bytes represented as hex separated by '\n'
-        # We need to convert it into a byte array that can be sent to Arduino
-        code_arr = code.split('\n')
-        
-        code_bytes = bytearray()
-        for line in code_arr:
-            if line.lstrip() == '':
-                break
-            tmp = int(line, 16)
-            code_bytes += tmp.to_bytes(2, 'big')
-        return code_bytes
+        return find_program(regex, regex_format, self.bytecode_cache, self.bundle, self.compiler_version)
 
     def _serial_write(self, data: bytes|str, encoding:str=None) -> int:
         """Writes data to Arduino through serial.
@@ -100,10 +280,11 @@ class CiceroOnArduino:
         if encoding:
             data_bytes = bytes(data, encoding)
         else:
-            data_bytes = bytes(data)
-            
+            # Bytes-like objects, as views on a buffer, are written without copying them
+            data_bytes = data
+
         bytes_sent = self.arduino.write(data_bytes)
-        
+
         if self.debug:
             debug_print(data_bytes, bytes_sent, True)
         
@@ -121,6 +302,81 @@ class CiceroOnArduino:
             
         return read
     
+    def _serial_read_exact(self, size: int) -> bytes:
+        """Reads the given number of bytes from Arduino through serial, less bytes are returned if the timeout expires.
+
+        :param int size: the number of bytes to read
+        :return bytes: the bytes read
+        """
+        read = self.arduino.read(size)
+
+        if self.debug:
+            debug_print(read, len(read), False)
+
+        return read
+
+    def _send_frame(self, frame_type: FrameType, payload: bytes=b"") -> None:
+        """Sends a frame to Arduino through serial.
+
+        :param FrameType frame_type: the type of the frame
+        :param bytes payload: the payload of the frame, defaults to b""
+        """
+        self._serial_write(framing.encode_frame(frame_type, payload))
+
+    def _send_text_frames(self, strings: list[bytes|memoryview]) -> None:
+        """Sends strings to Arduino, each one in its own frame.
+        If Arduino supports it, strings are sent in TEXT_PACKED frames built in a buffer that is reused across calls,
+        strings too long for a TEXT_PACKED frame are sent in TEXT frames.
+
+        :param list[bytes | memoryview] strings: the strings to send, without the terminator
+        """
+        if not self.packed_text:
+            self._serial_write(b"".join(framing.encode_frame(FrameType.TEXT, string) for string in strings))
+            return
+
+        frames = [string if len(string) <= framing.MAX_PACKED_TEXT_LENGTH else framing.encode_frame(FrameType.TEXT, string) for string in strings]
+        size = sum(framing.packed_text_frame_size(len(frame)) if frame is string else len(frame) for frame, string in zip(frames, strings))
+        if len(self._frame_buffer) < size:
+            self._frame_buffer = bytearray(size)
+
+        end = 0
+        for frame, string in zip(frames, strings):
+            if frame is string:
+                end = framing.pack_text_frame_into(self._frame_buffer, end, string)
+            else:
+                self._frame_buffer[end:end + len(frame)] = frame
+                end += len(frame)
+
+        with memoryview(self._frame_buffer) as view:
+            self._serial_write(view[:end])
+
+    def _receive_frame(self, expected_type: FrameType) -> bytes:
+        """Receives a frame from Arduino through serial.
+
+        :param FrameType expected_type: the type of the frame that Arduino should send
+        :raises Exception: if the frame is corrupted, Arduino rejected the previous frame or the frame has an unexpected type
+        :return bytes: the payload of the frame
+        """
+        frame_type, payload = framing.read_frame(self._serial_read_exact)
+
+        if frame_type == FrameType.NACK:
+            raise Exception("Frame rejected by Arduino: " + framing.describe_nack(payload))
+        if frame_type != expected_type:
+            raise Exception("Unexpected frame type: expected " + hex(expected_type) + " but got " + hex(frame_type))
+        return payload
+
+    def _receive_result_frame(self) -> tuple[str,int]:
+        """Receives the result of a computation through the framed protocol.
+
+        :return tuple[str,int]: result and clock cycles elapsed for this execution
+        """
+        payload = self._receive_frame(FrameType.RESULT)
+        if len(payload) != framing.RESULT_PAYLOAD.size:
+            raise Exception("Invalid result: " + decode_bytes_as_hex(payload))
+
+        status, elapsedCC = framing.RESULT_PAYLOAD.unpack(payload)
+        return str(status), elapsedCC
+
     def _serial_read_until_terminator(self) -> bytes:
         """Reads bytes from Arduino through serial until INPUT_TERMINATOR is found.
 
@@ -152,7 +408,9 @@ class CiceroOnArduino:
 
     def _enter_text_mode(self) -> None:
         """Enters the driver status where strings can be sent to be analyzed by CICERO."""
-        self._send_command(self.CMD_TEXT)
+        # The framed protocol does not have modes, every frame carries its type
+        if not self.framed:
+            self._send_command(self.CMD_TEXT)
         self.driver_status = self.DriverStatus.TEXT_MODE
 
     def _exit_text_mode(self) -> None:
@@ -162,6 +420,10 @@ class CiceroOnArduino:
         """
         if self.driver_status != self.DriverStatus.TEXT_MODE:
             raise Exception("Trying to exit text mode while not in it")
+
+        if self.framed:
+            self.driver_status = self.DriverStatus.COMMAND_MODE
+            return
         
         # We can't use _send_command() as it will check if we are in command mode
         self._serial_write(self.CMD_EXIT_TEXT)
@@ -183,18 +445,46 @@ class CiceroOnArduino:
         """
         len_str = str(len(data))
         data_bytes = len_str.encode("utf-8")
-        self._serial_write(data_bytes + self.INPUT_TERMINATOR)
-        
-        read = self._serial_read_until_terminator()
+        with self._phase("length_handshake"):
+            self._serial_write(data_bytes + self.INPUT_TERMINATOR)
+
+            read = self._serial_read_until_terminator()
         if read != data_bytes:
             raise Exception("Command not processed correctly! Expected '" + len_str + "' but got '" + str(read, "utf-8") + "'")
     
+    def _forget_overwritten_code(self, text_length: int) -> None:
+        """Forgets the resident code if a string does not fit in RAM after it, as Arduino would overwrite the code with the string.
+
+        :param int text_length: the length of the string in bytes, without the terminator
+        """
+        if self.resident_code is not None and code_qwords(self.resident_code[0]) + code_qwords(text_length + 1) > RAM_QWORDS:
+            self.resident_code = (0, 0)
+
     def _change_regex_code(self, new_regex_code: bytearray) -> None:
-        """Sends the new regex code to Arduino to be loaded on CICERO memory.
+        """Sends the new regex code to Arduino to be loaded on CICERO memory, unless the same code is already loaded.
 
         :param bytearray new_regex_code: the code of the regex
         :raises Exception: if Arduino doesn't respond
         """
+        code_info = (len(new_regex_code), zlib.crc32(new_regex_code))
+        if self.skip_resident_upload and self.resident_code == code_info:
+            self.regex_uploads_skipped += 1
+            self.regex_loaded = True
+            self.regex_code_length = len(new_regex_code)
+            return
+
+        # Until the upload succeeds the content of CICERO RAM is unknown
+        self.resident_code = None
+        self.regex_uploads += 1
+
+        if self.framed:
+            self._send_frame(FrameType.REGEX, new_regex_code)
+            self._receive_frame(FrameType.ACK)
+            self.regex_loaded = True
+            self.regex_code_length = len(new_regex_code)
+            self.resident_code = code_info
+            return
+
         self._send_command(self.CMD_REGEX)
         
         self._send_data_length(new_regex_code)
@@ -205,19 +495,125 @@ class CiceroOnArduino:
             raise Exception("Could not change regex code!")
 
         self.regex_loaded = True
+        self.regex_code_length = len(new_regex_code)
+        self.resident_code = code_info
+
+    def upload_stats(self) -> dict[str,int]:
+        """Gets the number of regex uploads done and skipped because the code was already loaded on CICERO.
+
+        :return dict[str,int]: the number of uploads and of skipped uploads
+        """
+        return {"regex_uploads": self.regex_uploads, "regex_uploads_skipped": self.regex_uploads_skipped}
+
+    def set_cycle_budget(self, cycle_budget: int|None) -> bool:
+        """Sets the max clock cycles of the next executions: Arduino stops the executions that exceed it and reports them as timeouts.
+        The budget is sent only if it is different from the one already set on Arduino, it is always sent the first time.
+
+        :param int|None cycle_budget: the number of clock cycles, None or 0 for no limit
+        :raises Exception: if the driver is not in command mode or Arduino doesn't respond
+        :return bool: if the budget is enforced, False if Arduino does not support cycle budgets
+        """
+        cycle_budget = min(int(cycle_budget or 0), self.MAX_CYCLE_BUDGET)
+        # The budget set on Arduino is unknown until the first one is sent, so the first one is always sent, even if it is no limit:
+        # Arduino keeps the budget of the previous connection. With older firmware this costs a timeout once per connection
+        if not self.budget_supported or cycle_budget == self.cycle_budget:
+            return self.budget_supported
+
+        if self.framed:
+            self._send_frame(FrameType.BUDGET, framing.BUDGET_PAYLOAD.pack(cycle_budget))
+            self._receive_frame(FrameType.ACK)
+            self.cycle_budget = cycle_budget
+            return True
+
+        if self.driver_status != self.DriverStatus.COMMAND_MODE:
+            raise Exception("Trying to send a command while not in command mode")
+        self._serial_write(self.CMD_BUDGET)
+        read = self._serial_read()
+        if read == b"":
+            # Older firmware ignores unknown commands
+            self.budget_supported = False
+            return False
+        if read != self.CMD_BUDGET:
+            raise Exception("Command not processed correctly! Expected '" + str(int.from_bytes(self.CMD_BUDGET, "big")) + "' but got '" + str(read, "utf-8") + "'")
+
+        self._serial_write(framing.BUDGET_PAYLOAD.pack(cycle_budget))
+        if self._serial_read() != self.INPUT_TERMINATOR:
+            raise Exception("Could not set the cycle budget!")
+        self.cycle_budget = cycle_budget
+        return True
+
+    def recover(self) -> None:
+        """Brings the connection back to a known state after a result that did not arrive in time or could not be parsed,
+        so that the next strings can be executed. Everything that Arduino sends until then is discarded: with the framed protocol
+        the protocol is negotiated again, which Arduino answers after the executions still pending, with the old protocol
+        the driver waits until Arduino stops sending. A driver that was waiting for a result goes back to text mode.
+
+        :raises Exception: if Arduino doesn't respond
+        """
+        if self.framed:
+            self.arduino.reset_input_buffer()
+            hello = self.CMD_HELLO + bytes([self.protocol_version])
+            self._serial_write(self.CMD_HELLO)
+            read = self.arduino.read_until(hello)
+            if not read.endswith(hello):
+                raise Exception("Could not recover the connection with Arduino")
+        else:
+            while self._serial_read_exact(4096):
+                pass
+
+        if self.driver_status == self.DriverStatus.EXECUTION_MODE:
+            self.driver_status = self.DriverStatus.TEXT_MODE
+
+    def max_text_length(self) -> int:
+        """Gets the length of the longest string that fits in CICERO RAM together with the loaded code.
+
+        :raises Exception: if there is no regex loaded
+        :return int: the max length in bytes, without the terminator
+        """
+        if not self.regex_loaded:
+            raise Exception("Trying to compute the text window before loading the regex")
+
+        # One byte is needed for the string terminator
+        ram_bytes = (RAM_QWORDS - code_qwords(self.regex_code_length)) * 8
+        return min(ram_bytes, self.TEXT_BUFFER_SIZE) - 1
 
     def load_regex(self, regex: str, regex_format: str="pythonre") -> None:
         """Compiles the regex to bytecode and loads it to CICERO memory.
 
         :param str regex: the new regex to load
         :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+        :raises RegexError: if the regex does not compile or its code does not fit in CICERO RAM
+        :raises Exception: if Arduino doesn't respond
         """
-        regex_code = self._compile_regex(regex, regex_format)
+        with self._phase("compile"):
+            regex_code = executable_program(regex, regex_format, self.bytecode_cache, self.bundle, self.compiler_version)
 
         if self.debug:
             print("Compiled regex code: ", decode_bytes_as_hex(regex_code))
 
-        self._change_regex_code(regex_code)
+        # With the old protocol this includes the length handshake, that is also measured separately
+        with self._phase("regex_upload"):
+            self._change_regex_code(regex_code)
+
+    def load_program(self, index: int) -> None:
+        """Loads to CICERO memory the program of a regex of the bundle, without the compiler.
+
+        :param int index: the index of the regex in the file the bundle was compiled from
+        :raises RegexError: if the regex has no program
+        :raises Exception: if there is no bundle or Arduino doesn't respond
+        """
+        if self.bundle is None:
+            raise Exception("Trying to load a program by index without a bundle")
+        try:
+            regex_code = self.bundle.code(index)
+        except Exception as exc:
+            raise RegexError(str(exc)) from exc
+
+        if self.debug:
+            print("Bundled regex code: ", decode_bytes_as_hex(regex_code))
+
+        with self._phase("regex_upload"):
+            self._change_regex_code(regex_code)
 
     def load_string_and_start(self, string: str|bytes) -> None:
         """Loads a new string to CICERO memory and starts the execution.
@@ -229,15 +625,26 @@ class CiceroOnArduino:
             raise Exception("Trying to load a string before loading the regex")
         if self.driver_status != self.DriverStatus.TEXT_MODE:
             raise Exception("Trying to load a string while not in text mode")
+
+        data = string.encode("utf-8") if isinstance(string, str) else string
+        self._forget_overwritten_code(len(data))
+
+        if self.framed:
+            # Arduino answers directly with the result, without acknowledging the string
+            with self._phase("text_transmit"):
+                self._send_text_frames([data])
+            self.driver_status = self.DriverStatus.EXECUTION_MODE
+            return
         
         self._send_data_length(string)
-        # If string is a bytestring do not try to decode it as utf-8
-        if isinstance(string, str):
-            self._serial_write(string, "utf-8")
-        else:
-            self._serial_write(string)
-
-        read = self._serial_read()
+        with self._phase("text_transmit"):
+            # If string is a bytestring do not try to decode it as utf-8
+            if isinstance(string, str):
+                self._serial_write(string, "utf-8")
+            else:
+                self._serial_write(string)
+
+            read = self._serial_read()
         if read != self.INPUT_TERMINATOR:
             raise Exception("Could not load string!")
         
@@ -249,43 +656,171 @@ class CiceroOnArduino:
         :raises Exception: if the result is not valid
         :return tuple[str,int]: result and clock cycles elapsed for this execution
         """
-        result = self._serial_read()
-        if result not in [self.MATCH_FOUND.encode("utf-8"), self.MATCH_NOT_FOUND.encode("utf-8"), self.CICERO_ERROR.encode("utf-8")]:
-            raise Exception("Invalid result: " + decode_bytes_as_hex(result))
-
-        elapsedCC = self._serial_read_until_terminator()
-              
-        # Convert from bytestring to int
-        elapsedCC = int(elapsedCC.decode("utf-8"))
+        try:
+            if self.framed:
+                # The time waiting for the result includes the execution on the FPGA
+                with self._phase("result_receive"):
+                    result = self._receive_result_frame()
+                self.driver_status = self.DriverStatus.TEXT_MODE
+                return result
+
+            with self._phase("result_receive"):
+                result = self._serial_read()
+                if result not in [self.MATCH_FOUND.encode("utf-8"), self.MATCH_NOT_FOUND.encode("utf-8"), self.CICERO_ERROR.encode("utf-8"), self.CICERO_TIMEOUT.encode("utf-8")]:
+                    raise Exception("Invalid result: " + decode_bytes_as_hex(result))
+
+                elapsedCC = self._serial_read_until_terminator()
+
+            # Convert from bytestring to int
+            elapsedCC = int(elapsedCC.decode("utf-8"))
+        except Exception:
+            # Leave the driver in text mode, ready for the next string
+            self.recover()
+            raise
         
         self.driver_status = self.DriverStatus.TEXT_MODE
         return result.decode("utf-8"), elapsedCC
     
-    def load_regex_and_test_strings(self, regex: str, strings: list[str], regex_format="pythonre") -> list[tuple[bool,int,float]]:
+    def _test_batch(self, strings: list[str|bytes]) -> list[tuple[str,int]]|None:
+        """Sends a batch of strings to Arduino, that executes them one after the other on the loaded regex.
+
+        :param list[str|bytes] strings: the strings to test, at most BATCH_MAX_STRINGS
+        :raises Exception: if there is no regex loaded, the driver is not in command mode or Arduino doesn't respond
+        :return list[tuple[str,int]]|None: result and clock cycles elapsed for each string, None if Arduino does not support batch mode
+        """
+        if not self.regex_loaded:
+            raise Exception("Trying to load a string before loading the regex")
+        if self.driver_status != self.DriverStatus.COMMAND_MODE:
+            raise Exception("Trying to send a command while not in command mode")
+
+        data_list = [string.encode("utf-8") if isinstance(string, str) else string for string in strings]
+        for data in data_list:
+            self._forget_overwritten_code(len(data))
+
+        if self.framed:
+            # With the framed protocol all the strings can be sent without waiting, Arduino answers with a result frame for each string
+            with self._phase("text_transmit"):
+                self._send_text_frames(data_list)
+            try:
+                with self._phase("result_receive"):
+                    return [self._receive_result_frame() for _ in strings]
+            except Exception:
+                # Discard the results of the rest of the batch
+                self.recover()
+                raise
+
+        self._serial_write(self.CMD_BATCH)
+        read = self._serial_read()
+        if read == b"":
+            # Older firmware ignores unknown commands
+            self.batch_supported = False
+            return None
+        if read != self.CMD_BATCH:
+            raise Exception("Command not processed correctly! Expected '" + str(int.from_bytes(self.CMD_BATCH, "big")) + "' but got '" + str(read, "utf-8") + "'")
+
+        frame = bytearray(self.BATCH_HEADER.pack(len(strings)))
+        for data in data_list:
+            frame += self.BATCH_HEADER.pack(len(data))
+            frame += data
+        with self._phase("text_transmit"):
+            self._serial_write(frame)
+
+        results = []
+        with self._phase("result_receive"):
+            for _ in strings:
+                record = self._serial_read_exact(self.BATCH_RECORD.size)
+                if len(record) != self.BATCH_RECORD.size:
+                    self.recover()
+                    raise Exception("Invalid batch result: " + decode_bytes_as_hex(record))
+
+                status, elapsedCC = self.BATCH_RECORD.unpack(record)
+                results.append((str(status), elapsedCC))
+        return results
+
+    def test_strings(self, strings: list[str|bytes], budgets: list[int]=None) -> list[tuple[str,int]]:
+        """Executes CICERO on all the given strings with the loaded regex, using batch mode when Arduino supports it.
+        If budgets are given, every batch of strings is executed with the largest budget among its strings (see set_cycle_budget()),
+        without limit if any of its strings has no limit.
+
+        :param list[str|bytes] strings: the strings to test
+        :param list[int] budgets: the cycle budget of each string (0 or None for no limit), None for no limit at all, defaults to None
+        :return list[tuple[str,int]]: result and clock cycles elapsed for each string, the result is CICERO_TIMEOUT and the clock cycles are the budget for the executions that exceeded it
+        """
+        results = []
+
+        def budget_of(start: int, end: int) -> int:
+            batch_budgets = budgets[start:end] if budgets is not None else []
+            # A string without limit removes the limit of its whole batch
+            if not batch_budgets or not all(batch_budgets):
+                return 0
+            return max(batch_budgets)
+
+        start = 0
+        while self.batch_supported and start < len(strings):
+            self.set_cycle_budget(budget_of(start, start + self.BATCH_MAX_STRINGS))
+            batch_results = self._test_batch(strings[start:start + self.BATCH_MAX_STRINGS])
+            if batch_results is None:
+                break
+            results += batch_results
+            start += self.BATCH_MAX_STRINGS
+
+        if start < len(strings):
+            self.set_cycle_budget(budget_of(start, len(strings)))
+            self._enter_text_mode()
+            try:
+                for string in strings[start:]:
+                    if self.debug:
+                        print("Loading string: ", string)
+
+                    self.load_string_and_start(string)
+                    results.append(self.wait_result())
+            finally:
+                # After a failed execution the driver has recovered to text mode, return to command mode for the next regex
+                if self.driver_status == self.DriverStatus.TEXT_MODE:
+                    self._exit_text_mode()
+
+        if self.instrumentation is not None:
+            for _, elapsedCC in results:
+                self.instrumentation.record("fpga_execution", elapsedCC)
+
+        return results
+
+    def load_regex_and_test_strings(self, regex: str, strings: list[str], regex_format="pythonre", budgets: list[int]=None) -> list[tuple[bool,int,float]]:
         """Loads a regex and test all the given strings on it.
 
         :param str regex: the regex to load
         :param list[str] strings: a list of strings to test
         :param str regex_format: format of the regex (see compiler), defaults to "pythonre"
+        :param list[int] budgets: the cycle budget of each string, None for no limit, defaults to None
         :return list[tuple[bool,int,float]]: a list of tuples containing the following for each tested string: if a match was found, the elapsed clock cycles and the estimated execution time for that computation
         """
-        results = []
-
         if self.debug:
             print("Loading regex: ", regex)
 
         self.load_regex(regex, regex_format)
 
-        self._enter_text_mode()
-        for string in strings:           
-            if self.debug:
-                print("Loading string: ", string)
+        return self.test_loaded_regex(regex, strings, regex_format, budgets)
 
-            self.load_string_and_start(string)
-            
-            result, elapsedCC = self.wait_result()
+    def test_loaded_regex(self, regex: str, strings: list[str], regex_format="pythonre", budgets: list[int]=None) -> list[tuple[bool,int,float]]:
+        """Tests all the given strings on the regex that has already been loaded with load_regex().
+        Strings whose execution exceeded its cycle budget have TIMEOUT as match, clock cycles and execution time, as their result is unknown.
+
+        :param str regex: the loaded regex, used to verify the results
+        :param list[str] strings: a list of strings to test
+        :param str regex_format: format of the regex (see compiler), defaults to "pythonre"
+        :param list[int] budgets: the cycle budget of each string, None for no limit, defaults to None
+        :return list[tuple[bool,int,float]]: a list of tuples containing the following for each tested string: if a match was found, the elapsed clock cycles and the estimated execution time for that computation, or TIMEOUT for all three
+        """
+        results = []
+
+        for string, (result, elapsedCC) in zip(strings, self.test_strings(strings, budgets)):
             if result == self.CICERO_ERROR:
                 print("WARN: CICERO error on regex: ", regex, ", string: ", string)
+            if result == self.CICERO_TIMEOUT:
+                print("WARN: CICERO exceeded the budget of", elapsedCC, "cycles on regex: ", regex, ", string: ", string)
+                # The result is unknown, so it is not verified
+                results.append([self.TIMEOUT, self.TIMEOUT, self.TIMEOUT])
+                continue
             
             # Estimate exec time (in seconds) based on CICERO's clock frequency
             execTime = elapsedCC / self.CICERO_CLOCK_FREQ
@@ -294,13 +829,103 @@ class CiceroOnArduino:
             # Convert result to boolean
             result = result == self.MATCH_FOUND
 
-            # Import model to test CICERO's results against (folder has been added to PATH)
-            import golden_model
-            golden_model_res = golden_model.get_golden_model_result(regex, string, no_prefix=False, no_postfix=False, frontend=regex_format)
-            if result != golden_model_res:
-               print("CICERO output (", result, ") is incorrect for regex '", regex, "', string '", string, "'")
+            # Test CICERO's results against the golden model, out of the communication with Arduino
+            if self.verifier is not None:
+                self.verifier.submit(regex, string, result, regex_format)
 
             results.append([result, elapsedCC, execTime])
-        self._exit_text_mode()
 
         return results
+
+    def _text_window(self, overlap: int) -> int:
+        """Gets the size of the windows used to scan long inputs.
+
+        :param int overlap: the number of bytes shared by consecutive windows
+        :raises Exception: if the overlap leaves no room for new bytes in a window
+        :return int: the size of the windows
+        """
+        window = self.max_text_length()
+        if overlap < 0 or overlap >= window:
+            raise Exception("Invalid overlap " + str(overlap) + ", it must be between 0 and " + str(window - 1) + " for the loaded regex")
+        return window
+
+    def _scan_windows(self, windows: Iterator[bytes|memoryview], stop_on_match: bool) -> tuple[bool,int,float]:
+        """Executes CICERO on a sequence of windows, a batch at a time.
+
+        :param Iterator[bytes | memoryview] windows: the windows to test
+        :param bool stop_on_match: if the scan should end at the first batch containing a match
+        :return tuple[bool,int,float]: if a match was found, the total elapsed clock cycles and the estimated execution time in microseconds
+        """
+        match = False
+        elapsedCC = 0
+        while True:
+            batch = list(islice(windows, self.BATCH_MAX_STRINGS))
+            if not batch:
+                break
+            results = self.test_strings(batch)
+            # Release the windows, they can be views on a memory-mapped file
+            del batch
+
+            for result, cycles in results:
+                if result == self.CICERO_ERROR:
+                    print("WARN: CICERO error while scanning")
+                match = match or result == self.MATCH_FOUND
+                elapsedCC += cycles
+
+            if match and stop_on_match:
+                break
+
+        return match, elapsedCC, elapsedCC / self.CICERO_CLOCK_FREQ * 1e6
+
+    def scan_stream(self, chunks: Iterable[bytes], overlap: int=0, stop_on_match: bool=True) -> tuple[bool,int,float]:
+        """Matches the loaded regex on an input of any length, received as a sequence of chunks of any size.
+        The input is split into the largest windows that fit in CICERO RAM with the loaded code, consecutive windows share 'overlap' bytes:
+        to find every match of a regex that matches at most N bytes the overlap must be at least N - 1.
+
+        :param Iterable[bytes] chunks: the chunks of the input
+        :param int overlap: the number of bytes shared by consecutive windows, defaults to 0
+        :param bool stop_on_match: if the scan should end as soon as a match is found, defaults to True
+        :return tuple[bool,int,float]: if a match was found, the total elapsed clock cycles and the estimated execution time in microseconds
+        """
+        window = self._text_window(overlap)
+
+        def windows() -> Iterator[bytes]:
+            buffer = bytearray()
+            emitted = False
+            for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= window:
+                    yield bytes(buffer[:window])
+                    emitted = True
+                    del buffer[:window - overlap]
+            # The last window contains the remaining bytes, unless they have all been tested already by the previous window
+            if not emitted or len(buffer) > overlap:
+                yield bytes(buffer)
+
+        return self._scan_windows(windows(), stop_on_match)
+
+    def scan_file(self, path: str, overlap: int=0, stop_on_match: bool=True) -> tuple[bool,int,float]:
+        """Matches the loaded regex on the content of a file of any size, see scan_stream().
+        The file is memory-mapped and windows are sent as views on it, without copying it in memory.
+
+        :param str path: the path of the file
+        :param int overlap: the number of bytes shared by consecutive windows, defaults to 0
+        :param bool stop_on_match: if the scan should end as soon as a match is found, defaults to True
+        :return tuple[bool,int,float]: if a match was found, the total elapsed clock cycles and the estimated execution time in microseconds
+        """
+        window = self._text_window(overlap)
+
+        with open(path, 'rb') as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return self._scan_windows(iter([b""]), stop_on_match)
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    step = window - overlap
+                    # The last window is the first one that reaches the end of the file
+                    starts = range(0, max(size - overlap, 1), step)
+                    return self._scan_windows((view[start:start + window] for start in starts), stop_on_match)
+                finally:
+                    view.release()
@@ -0,0 +1,378 @@
+import argparse
+import os
+import pty
+import struct
+import threading
+import time
+import tty
+import zlib
+
+from CiceroSerial import framing
+from CiceroSerial.framing import FrameType, FrameError
+from CiceroSerial.isa import Opcode, RAM_QWORDS, code_qwords, decode_bytecode
+
+# Statuses of CICERO, the same as CICERO_STATUS_* in Cicero.h
+STATUS_ACCEPTED = 2
+STATUS_REJECTED = 3
+STATUS_ERROR = 4
+STATUS_TIMEOUT = 5
+
+# Commands and delimiters of CiceroSerial.ino
+CMD_REGEX = 0x00
+CMD_TEXT = 0x01
+CMD_BATCH = 0x02
+CMD_HELLO = 0x03
+CMD_QUERY_CODE = 0x04
+CMD_BUDGET = 0x05
+INPUT_TERMINATOR = 0xFF
+TEXT_BUFFER_SIZE = 4096
+BATCH_HEADER = struct.Struct("<H")
+BATCH_RECORD = struct.Struct("<BI")
+
+# Cycle model: cycles to start the execution, to fetch and execute an instruction of a thread and to move to the next character
+CYCLES_START = 4
+CYCLES_INSTRUCTION = 1
+CYCLES_CHARACTER = 1
+
+class CiceroCore:
+    """Cycle-approximate model of CICERO: a Pike VM over the bytecode, where every instruction executed by a thread costs
+    one clock cycle and threads at the same program counter on the same character are merged."""
+    def __init__(self) -> None:
+        self.instructions = []
+        self.code_qwords = 0
+
+    def load_code(self, code: bytes) -> None:
+        """Loads machine code into the RAM.
+
+        :param bytes code: the bytecode
+        """
+        self.instructions = decode_bytecode(code)
+        self.code_qwords = code_qwords(len(code))
+
+    def text_capacity(self) -> int:
+        """Gets the max number of bytes of text that fit in RAM after the code, including the terminator.
+
+        :return int: the number of bytes
+        """
+        return (RAM_QWORDS - self.code_qwords) * 8
+
+    def run(self, text: bytes, cycle_budget: int=0) -> tuple[int,int]:
+        """Executes the loaded program on a string.
+
+        :param bytes text: the string, including the terminator
+        :param int cycle_budget: the max clock cycles of the execution, 0 for no limit, defaults to 0
+        :return tuple[int,int]: the final status and the elapsed clock cycles, STATUS_TIMEOUT and the budget if the execution exceeded it
+        """
+        if len(text) > self.text_capacity() or not self.instructions:
+            return STATUS_ERROR, 0
+
+        cycles = CYCLES_START
+        end = len(text) - 1
+        current = [0]
+        for position in range(len(text)):
+            char = text[position]
+            next_threads = []
+            next_seen = set()
+            seen = set()
+
+            stack = list(reversed(current))
+            while stack:
+                pc = stack.pop()
+                if pc in seen:
+                    continue
+                seen.add(pc)
+                cycles += CYCLES_INSTRUCTION
+                if cycle_budget and cycles > cycle_budget:
+                    return STATUS_TIMEOUT, cycle_budget
+
+                if pc >= len(self.instructions):
+                    return STATUS_ERROR, cycles
+                opcode, data = self.instructions[pc]
+
+                if opcode == Opcode.ACCEPT_PARTIAL or (opcode == Opcode.ACCEPT and position == end):
+                    return STATUS_ACCEPTED, cycles
+                elif opcode == Opcode.SPLIT:
+                    stack.append(data)
+                    stack.append(pc + 1)
+                elif opcode == Opcode.JMP:
+                    stack.append(data)
+                elif position < end and ((opcode == Opcode.MATCH and char == (data & 0xFF)) or
+                                         (opcode == Opcode.NOT_MATCH and char != (data & 0xFF)) or
+                                         opcode == Opcode.MATCH_ANY):
+                    if pc + 1 not in next_seen:
+                        next_seen.add(pc + 1)
+                        next_threads.append(pc + 1)
+                # ACCEPT before the end, END_WITHOUT_ACCEPTING and failed matches kill the thread
+
+            if not next_threads:
+                return STATUS_REJECTED, cycles
+            current = next_threads
+            cycles += CYCLES_CHARACTER
+
+        return STATUS_REJECTED, cycles
+
+class CiceroEmulator:
+    """Software Arduino running CiceroSerial.ino, reachable through a pseudo-terminal.
+    It implements the command, regex, text, executing, batch and framed states of the sketch on top of CiceroCore,
+    and can model the latency and the bandwidth of the serial link."""
+    def __init__(self, latency: float=0.0, bandwidth: float=None, clock_freq: float=None, link: str=None) -> None:
+        """Creates a new emulator, start() must be called to serve requests.
+
+        :param float latency: the seconds to wait before sending every answer, defaults to 0.0
+        :param float bandwidth: the bytes per second of the link in both directions, None for unlimited, defaults to None
+        :param float clock_freq: if given, executions last as long as their cycles at this frequency (in Hz), defaults to None
+        :param str link: path of a symlink to create to the pseudo-terminal, defaults to None
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.clock_freq = clock_freq
+        self.link = link
+
+        self.core = CiceroCore()
+        self.executions = 0
+        # Length and CRC32 of the loaded code, like residentCodeLength and residentCodeCRC in the sketch
+        self.resident_code = (0, 0)
+        # Max clock cycles of an execution, 0 for no limit
+        self.cycle_budget = 0
+        self.timeouts = 0
+
+        self._master_fd, self._slave_fd = pty.openpty()
+        # No line discipline: the protocol is binary
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        if self.link:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+
+        self._buffer = bytearray()
+        self._stopped = False
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts serving requests on a background thread."""
+        self._thread = threading.Thread(target=self._serve, name="CiceroEmulator", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the emulator and closes the pseudo-terminal."""
+        self._stopped = True
+        os.close(self._slave_fd)
+        os.close(self._master_fd)
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def _read(self, size: int) -> bytes:
+        """Reads exactly 'size' bytes from the link.
+
+        :param int size: the number of bytes to read
+        :return bytes: the bytes read
+        """
+        while len(self._buffer) < size:
+            chunk = os.read(self._master_fd, 65536)
+            if not chunk:
+                raise EOFError()
+            if self.bandwidth:
+                time.sleep(len(chunk) / self.bandwidth)
+            self._buffer += chunk
+
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_until_terminator(self) -> bytes:
+        """Reads from the link until INPUT_TERMINATOR, like the ASCII length parsing of the sketch.
+
+        :return bytes: the bytes read, without the terminator
+        """
+        data = bytearray()
+        while True:
+            byte = self._read(1)[0]
+            if byte == INPUT_TERMINATOR:
+                return bytes(data)
+            data.append(byte)
+
+    def _write(self, data: bytes) -> None:
+        """Writes to the link, modeling its latency and bandwidth.
+
+        :param bytes data: the bytes to write
+        """
+        delay = self.latency + (len(data) / self.bandwidth if self.bandwidth else 0)
+        if delay > 0:
+            time.sleep(delay)
+        os.write(self._master_fd, data)
+
+    def _load_code(self, code: bytes) -> None:
+        self.core.load_code(code)
+        self.resident_code = (len(code), zlib.crc32(code))
+
+    def _execute(self, text: bytes) -> tuple[int,int]:
+        """Executes CICERO on a string, waiting for the modeled execution time if requested.
+
+        :param bytes text: the string, without the terminator
+        :return tuple[int,int]: the final status and the elapsed clock cycles
+        """
+        # A string that does not fit after the code overwrites it
+        if code_qwords(self.resident_code[0]) + code_qwords(len(text) + 1) > RAM_QWORDS:
+            self.resident_code = (0, 0)
+
+        status, cycles = self.core.run(text + b"\x00", self.cycle_budget)
+        self.executions += 1
+        if status == STATUS_TIMEOUT:
+            self.timeouts += 1
+        if self.clock_freq:
+            time.sleep(cycles / self.clock_freq)
+        return status, cycles
+
+    @staticmethod
+    def _atoi(data: bytes) -> int:
+        """Parses an integer like atoi() does, ignoring anything after the digits.
+
+        :param bytes data: the ASCII representation of the integer
+        :return int: the integer, 0 if it can't be parsed
+        """
+        text = data.decode("ascii", "replace").strip()
+        digits = ""
+        for index, char in enumerate(text):
+            if char.isdigit() or (index == 0 and char in "+-"):
+                digits += char
+            else:
+                break
+        try:
+            return int(digits)
+        except ValueError:
+            return 0
+
+    def _serve(self) -> None:
+        try:
+            while not self._stopped:
+                command = self._read(1)[0]
+                if command == CMD_REGEX:
+                    self._write(bytes([CMD_REGEX]))
+                    self._regex_mode()
+                elif command == CMD_TEXT:
+                    self._write(bytes([CMD_TEXT]))
+                    self._text_mode()
+                elif command == CMD_BATCH:
+                    self._write(bytes([CMD_BATCH]))
+                    self._batch_mode()
+                elif command == CMD_HELLO:
+                    self._write(bytes([CMD_HELLO, framing.PROTOCOL_VERSION]))
+                    self._framed_mode()
+                elif command == CMD_QUERY_CODE:
+                    self._write(bytes([CMD_QUERY_CODE]) + framing.CODE_INFO_PAYLOAD.pack(*self.resident_code))
+                elif command == CMD_BUDGET:
+                    self._write(bytes([CMD_BUDGET]))
+                    self.cycle_budget, = framing.BUDGET_PAYLOAD.unpack(self._read(framing.BUDGET_PAYLOAD.size))
+                    self._write(bytes([INPUT_TERMINATOR]))
+                # Unknown commands are ignored, like the sketch does
+        except (EOFError, OSError):
+            # The pseudo-terminal has been closed
+            return
+
+    def _read_length(self) -> int:
+        length = self._atoi(self._read_until_terminator())
+        self._write(str(length).encode("ascii") + bytes([INPUT_TERMINATOR]))
+        return length
+
+    def _regex_mode(self) -> None:
+        length = self._read_length()
+        self._load_code(self._read(max(length, 0)))
+        self._write(bytes([INPUT_TERMINATOR]))
+
+    def _text_mode(self) -> None:
+        while True:
+            length = self._read_length()
+            if length < -1:
+                # Negative length means to return to command mode
+                self._write(bytes([INPUT_TERMINATOR]))
+                return
+
+            text = self._read(max(length, 0))
+            self._write(bytes([INPUT_TERMINATOR]))
+            status, cycles = self._execute(text)
+            self._write(str(status).encode("ascii") + str(cycles).encode("ascii") + bytes([INPUT_TERMINATOR]))
+
+    def _batch_mode(self) -> None:
+        count, = BATCH_HEADER.unpack(self._read(BATCH_HEADER.size))
+        for _ in range(count):
+            length, = BATCH_HEADER.unpack(self._read(BATCH_HEADER.size))
+            text = self._read(length)
+            if length >= TEXT_BUFFER_SIZE:
+                self._write(BATCH_RECORD.pack(STATUS_ERROR, 0))
+                continue
+            self._write(BATCH_RECORD.pack(*self._execute(text)))
+
+    def _framed_mode(self) -> None:
+        while not self._stopped:
+            first = self._read(1)
+            if first[0] != framing.FRAME_MAGIC:
+                # A driver that has just connected negotiates the protocol again, any other stray byte is discarded
+                if first[0] == CMD_HELLO:
+                    self._write(bytes([CMD_HELLO, framing.PROTOCOL_VERSION]))
+                continue
+
+            header = first + self._read(framing.FRAME_HEADER.size - 1)
+            frame_type, length = framing.decode_header(header)
+            payload = self._read(length)
+            crc = self._read(framing.FRAME_CRC.size)
+
+            if length > TEXT_BUFFER_SIZE:
+                self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.TOO_LONG])))
+                continue
+            try:
+                framing.check_crc(header, payload, crc)
+            except Exception:
+                self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.CRC])))
+                continue
+
+            self._handle_frame(frame_type, payload)
+
+    def _handle_frame(self, frame_type: int, payload: bytes) -> None:
+        if frame_type == FrameType.REGEX:
+            self._load_code(payload)
+            self._write(framing.encode_frame(FrameType.ACK))
+        elif frame_type == FrameType.BUDGET:
+            if len(payload) != framing.BUDGET_PAYLOAD.size:
+                self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.MALFORMED])))
+                return
+            self.cycle_budget, = framing.BUDGET_PAYLOAD.unpack(payload)
+            self._write(framing.encode_frame(FrameType.ACK))
+        elif frame_type == FrameType.QUERY_CODE:
+            self._write(framing.encode_frame(FrameType.CODE_INFO, framing.CODE_INFO_PAYLOAD.pack(*self.resident_code)))
+        elif frame_type == FrameType.TEXT:
+            if len(payload) >= TEXT_BUFFER_SIZE:
+                self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.TOO_LONG])))
+                return
+            status, cycles = self._execute(payload)
+            self._write(framing.encode_frame(FrameType.RESULT, framing.RESULT_PAYLOAD.pack(status, cycles)))
+        elif frame_type == FrameType.TEXT_PACKED:
+            image = payload[framing.TEXT_PACKED_HEADER.size:]
+            length, = framing.TEXT_PACKED_HEADER.unpack(payload[:framing.TEXT_PACKED_HEADER.size]) if len(payload) >= framing.TEXT_PACKED_HEADER.size else (0,)
+            if length == 0 or len(image) % 8 != 0 or code_qwords(length) * 8 != len(image):
+                self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.MALFORMED])))
+                return
+            # The image contains the string followed by the terminator and the padding
+            status, cycles = self._execute(image[:length - 1])
+            self._write(framing.encode_frame(FrameType.RESULT, framing.RESULT_PAYLOAD.pack(status, cycles)))
+        else:
+            self._write(framing.encode_frame(FrameType.NACK, bytes([FrameError.UNKNOWN_TYPE])))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='emulate CICERO on Arduino over a pseudo-terminal')
+    arg_parser.add_argument('-latency',     type=float,  help='seconds to wait before every answer',                             default=0.0)
+    arg_parser.add_argument('-bandwidth',   type=float,  help='bytes per second of the serial link, unlimited if not given',     default=None)
+    arg_parser.add_argument('-clockfreq',   type=float,  help='model the execution time at this CICERO clock frequency (Hz)',    default=None)
+    arg_parser.add_argument('-link',        type=str,    help='path of a symlink to create to the pseudo-terminal',              default=None)
+
+    args = arg_parser.parse_args()
+
+    emulator = CiceroEmulator(args.latency, args.bandwidth, args.clockfreq, args.link)
+    print("CICERO emulator listening on", args.link or emulator.port)
+    emulator.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
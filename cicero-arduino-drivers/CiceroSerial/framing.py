@@ -0,0 +1,163 @@
+import struct
+import zlib
+from enum import IntEnum
+from typing import Callable
+
+# Version of the framed protocol implemented by this module, it must be the same as PROTOCOL_VERSION in CiceroSerial.ino
+PROTOCOL_VERSION = 3
+# Oldest version of the protocol that the driver can still use, packed text frames were added in version 2 and budget frames in version 3
+MIN_PROTOCOL_VERSION = 1
+
+# Every frame starts with this byte, so that stray bytes can be detected
+FRAME_MAGIC = 0xC1
+# The header is composed of the magic byte, the type of the frame and the length of the payload (little-endian)
+FRAME_HEADER = struct.Struct("<BBH")
+# The header and the payload are followed by their CRC32 (little-endian)
+FRAME_CRC = struct.Struct("<I")
+# Max size of the payload, limited by the buffer on Arduino
+MAX_PAYLOAD_SIZE = 4096
+
+# Payload of a RESULT frame: the final status of CICERO and the elapsed clock cycles
+RESULT_PAYLOAD = struct.Struct("<BI")
+# Payload of a BUDGET frame: the max clock cycles of the next executions, 0 for no limit
+BUDGET_PAYLOAD = struct.Struct("<I")
+# Payload of a CODE_INFO frame: the length and the CRC32 of the code loaded on CICERO, length 0 if there is no valid code
+CODE_INFO_PAYLOAD = struct.Struct("<HI")
+# The payload of a TEXT_PACKED frame starts with the length of the string including the terminator, padded to 8 bytes
+# so that the image of the string that follows is aligned to qwords on Arduino
+TEXT_PACKED_HEADER = struct.Struct("<H6x")
+# Max length of a string sent in a TEXT_PACKED frame, without the terminator
+MAX_PACKED_TEXT_LENGTH = MAX_PAYLOAD_SIZE - TEXT_PACKED_HEADER.size - 1
+
+# Padding of the last qword of a packed string
+_QWORD_PADDING = bytes(8)
+
+class FrameType(IntEnum):
+    """Enum containing the types of the frames."""
+    # Host to Arduino
+    REGEX = 0x10
+    TEXT = 0x11
+    QUERY_CODE = 0x12
+    TEXT_PACKED = 0x13
+    BUDGET = 0x14
+    # Arduino to host
+    ACK = 0x20
+    NACK = 0x21
+    RESULT = 0x22
+    CODE_INFO = 0x23
+
+class FrameError(IntEnum):
+    """Enum containing the error codes sent in the payload of a NACK frame."""
+    CRC = 0x01
+    TOO_LONG = 0x02
+    UNKNOWN_TYPE = 0x03
+    MALFORMED = 0x04
+
+def encode_frame(frame_type: FrameType, payload: bytes=b"") -> bytes:
+    """Builds a frame.
+
+    :param FrameType frame_type: the type of the frame
+    :param bytes payload: the payload of the frame, defaults to b""
+    :raises Exception: if the payload is too long
+    :return bytes: the frame, ready to be sent
+    """
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise Exception("Payload too long: " + str(len(payload)) + " bytes, max is " + str(MAX_PAYLOAD_SIZE))
+
+    header = FRAME_HEADER.pack(FRAME_MAGIC, frame_type, len(payload))
+    crc = zlib.crc32(payload, zlib.crc32(header))
+    return b"".join((header, payload, FRAME_CRC.pack(crc)))
+
+def packed_text_frame_size(text_length: int) -> int:
+    """Gets the size of the TEXT_PACKED frame of a string.
+
+    :param int text_length: the length of the string in bytes, without the terminator
+    :return int: the size of the whole frame in bytes
+    """
+    image_size = (text_length + 1 + 7) // 8 * 8
+    return FRAME_HEADER.size + TEXT_PACKED_HEADER.size + image_size + FRAME_CRC.size
+
+def pack_text_frame_into(buffer: bytearray, offset: int, text: bytes|memoryview) -> int:
+    """Writes the TEXT_PACKED frame of a string into a buffer, with the string laid out as CICERO expects it in RAM:
+    bytes in little-endian order inside each qword, followed by the terminator and zero padding up to a full qword.
+
+    :param bytearray buffer: the buffer, must have room for packed_text_frame_size() bytes after 'offset'
+    :param int offset: the position in the buffer where the frame starts
+    :param bytes|memoryview text: the string, without the terminator
+    :raises Exception: if the string is too long for a frame
+    :return int: the position in the buffer after the end of the frame
+    """
+    # CICERO reads the qwords in little-endian order, so the image of the string is the string itself followed by the terminator and the padding
+    image_size = (len(text) + 1 + 7) // 8 * 8
+    payload_size = TEXT_PACKED_HEADER.size + image_size
+    if payload_size > MAX_PAYLOAD_SIZE:
+        raise Exception("Payload too long: " + str(payload_size) + " bytes, max is " + str(MAX_PAYLOAD_SIZE))
+
+    FRAME_HEADER.pack_into(buffer, offset, FRAME_MAGIC, FrameType.TEXT_PACKED, payload_size)
+    TEXT_PACKED_HEADER.pack_into(buffer, offset + FRAME_HEADER.size, len(text) + 1)
+    image_start = offset + FRAME_HEADER.size + TEXT_PACKED_HEADER.size
+    text_end = image_start + len(text)
+    image_end = image_start + image_size
+    buffer[image_start:text_end] = text
+    buffer[text_end:image_end] = _QWORD_PADDING[:image_end - text_end]
+
+    with memoryview(buffer) as view:
+        crc = zlib.crc32(view[offset:image_end])
+    FRAME_CRC.pack_into(buffer, image_end, crc)
+    return image_end + FRAME_CRC.size
+
+def decode_header(header: bytes) -> tuple[int,int]:
+    """Parses the header of a frame.
+
+    :param bytes header: the header, must be FRAME_HEADER.size bytes long
+    :raises Exception: if the header is not valid
+    :return tuple[int,int]: the type of the frame and the length of its payload
+    """
+    if len(header) != FRAME_HEADER.size:
+        raise Exception("Frame header truncated: got " + str(len(header)) + " bytes")
+
+    magic, frame_type, length = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise Exception("Invalid frame magic: " + hex(magic))
+    return frame_type, length
+
+def check_crc(header: bytes, payload: bytes, crc: bytes) -> None:
+    """Checks the CRC of a frame.
+
+    :param bytes header: the header of the frame
+    :param bytes payload: the payload of the frame
+    :param bytes crc: the CRC received after the payload
+    :raises Exception: if the CRC does not match
+    """
+    if len(crc) != FRAME_CRC.size or FRAME_CRC.unpack(crc)[0] != zlib.crc32(payload, zlib.crc32(header)):
+        raise Exception("Frame CRC mismatch")
+
+def read_frame(read: Callable[[int], bytes]) -> tuple[int,bytes]:
+    """Reads a frame and checks its integrity.
+
+    :param Callable[[int], bytes] read: function that reads the given number of bytes
+    :raises Exception: if the frame is truncated or corrupted
+    :return tuple[int,bytes]: the type and the payload of the frame
+    """
+    header = read(FRAME_HEADER.size)
+    frame_type, length = decode_header(header)
+
+    payload = read(length) if length > 0 else b""
+    if len(payload) != length:
+        raise Exception("Frame payload truncated: expected " + str(length) + " bytes but got " + str(len(payload)))
+
+    check_crc(header, payload, read(FRAME_CRC.size))
+    return frame_type, payload
+
+def describe_nack(payload: bytes) -> str:
+    """Gets a readable description of a NACK frame.
+
+    :param bytes payload: the payload of the NACK frame
+    :return str: the description of the error
+    """
+    if len(payload) != 1:
+        return "unknown error"
+    try:
+        return FrameError(payload[0]).name
+    except ValueError:
+        return "error " + str(payload[0])
@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Phases of the communication with CICERO on Arduino, with the unit of their measures
+PHASES = {
+    "compile": "ns",
+    "regex_upload": "ns",
+    "length_handshake": "ns",
+    "text_transmit": "ns",
+    "fpga_execution": "cycles",
+    "result_receive": "ns",
+}
+
+# Percentiles reported in the exports
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Returned when instrumentation is disabled, so that timing a phase costs only a function call
+_NO_PHASE = nullcontext()
+
+class LatencyHistogram:
+    """Histogram with log-linear buckets, like HdrHistogram: every power of two is split into 2^sub_bucket_bits buckets,
+    so that the relative error of every value is at most 2^-sub_bucket_bits while the memory stays small for any range of values."""
+    def __init__(self, sub_bucket_bits: int=5) -> None:
+        """Creates a new empty histogram.
+
+        :param int sub_bucket_bits: the number of bits of precision kept for every value, defaults to 5 (about 3% of relative error)
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket_of(self, value: int) -> tuple[int,int]:
+        """Gets the bucket of a value.
+
+        :param int value: the value, not negative
+        :return tuple[int,int]: the exponent and the mantissa of the bucket, the value is between mantissa << exponent and ((mantissa + 1) << exponent) - 1
+        """
+        exponent = max(0, value.bit_length() - self.sub_bucket_bits)
+        return exponent, value >> exponent
+
+    def record(self, value: int) -> None:
+        """Adds a value to the histogram.
+
+        :param int value: the value, negative values are recorded as 0
+        """
+        value = max(0, int(value))
+        bucket = self._bucket_of(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile: float) -> int|None:
+        """Gets the value below which the given percentage of the recorded values fall.
+
+        :param float percentile: the percentile, between 0 and 100
+        :return int|None: the highest value of the bucket containing the percentile, None if the histogram is empty
+        """
+        if self.count == 0:
+            return None
+
+        rank = max(1, round(percentile / 100 * self.count))
+        seen = 0
+        for exponent, mantissa in sorted(self.buckets):
+            seen += self.buckets[(exponent, mantissa)]
+            if seen >= rank:
+                return min(((mantissa + 1) << exponent) - 1, self.max)
+        return self.max
+
+    def summary(self) -> dict[str,int|float|None]:
+        """Gets the statistics of the recorded values.
+
+        :return dict[str,int|float|None]: the count, min, max and mean of the values and the percentiles in PERCENTILES
+        """
+        summary = {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+        }
+        for percentile in PERCENTILES:
+            summary["p" + str(percentile)] = self.percentile(percentile)
+        return summary
+
+    def to_dict(self) -> dict:
+        """Gets the statistics together with the non empty buckets.
+
+        :return dict: the summary and the buckets as [lowest value, highest value, count]
+        """
+        buckets = [[mantissa << exponent, ((mantissa + 1) << exponent) - 1, self.buckets[(exponent, mantissa)]] for exponent, mantissa in sorted(self.buckets)]
+        return {**self.summary(), "buckets": buckets}
+
+class _PhaseTimer:
+    """Context manager that records the nanoseconds spent in a phase."""
+    __slots__ = ("recorder", "phase", "start")
+
+    def __init__(self, recorder: "PhaseRecorder", phase: str) -> None:
+        self.recorder = recorder
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info) -> None:
+        self.recorder.record(self.phase, time.perf_counter_ns() - self.start)
+
+class PhaseRecorder:
+    """Collects the latency of each phase of the communication with CICERO into histograms.
+    It can be enabled and disabled at any time, when it is disabled timing a phase does nothing.
+    The same recorder can be shared by drivers running on different threads."""
+    def __init__(self, enabled: bool=True, sub_bucket_bits: int=5) -> None:
+        """Creates a new recorder with an empty histogram for each phase in PHASES.
+
+        :param bool enabled: if measures should be recorded, defaults to True
+        :param int sub_bucket_bits: the precision of the histograms (see LatencyHistogram), defaults to 5
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.histograms = {phase: LatencyHistogram(sub_bucket_bits) for phase in PHASES}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def phase(self, phase: str) -> _PhaseTimer|nullcontext:
+        """Times a phase, to be used as 'with recorder.phase("compile"): ...'.
+
+        :param str phase: the name of the phase, one of PHASES
+        :return _PhaseTimer|nullcontext: the context manager that measures the phase
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return _PhaseTimer(self, phase)
+
+    def record(self, phase: str, value: int) -> None:
+        """Records a measure of a phase, if the recorder is enabled.
+
+        :param str phase: the name of the phase, one of PHASES
+        :param int value: the measure, in the unit of the phase
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.histograms[phase].record(value)
+
+    def summary(self) -> dict[str,dict]:
+        """Gets the statistics of every phase.
+
+        :return dict[str,dict]: for each phase, its unit and the statistics of its histogram
+        """
+        with self._lock:
+            return {phase: {"unit": PHASES[phase], **histogram.summary()} for phase, histogram in self.histograms.items()}
+
+    def export_json(self, path: str) -> None:
+        """Writes the statistics and the buckets of every phase to a JSON file.
+
+        :param str path: the path of the file
+        """
+        with self._lock:
+            data = {phase: {"unit": PHASES[phase], **histogram.to_dict()} for phase, histogram in self.histograms.items()}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def export_csv(self, path: str) -> None:
+        """Writes the statistics of every phase to a CSV file, one row for each phase.
+
+        :param str path: the path of the file
+        """
+        summary = self.summary()
+        columns = ["phase", "unit", "count", "min", "max", "mean"] + ["p" + str(percentile) for percentile in PERCENTILES]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for phase, stats in summary.items():
+                writer.writerow([phase] + [stats[column] for column in columns[1:]])
@@ -0,0 +1,39 @@
+from enum import IntEnum
+
+# The RAM of CICERO is addressed by qwords and it is shared by the code and the string to examine, see RAM_MAX_ADDRESS in Cicero.cpp
+RAM_QWORDS = 512
+
+# Every instruction is 16 bits: 3 bits of opcode followed by 13 bits of data
+OPCODE_SHIFT = 13
+DATA_MASK = (1 << OPCODE_SHIFT) - 1
+
+class Opcode(IntEnum):
+    """Enum containing the opcodes of CICERO instructions."""
+    ACCEPT = 0b000
+    SPLIT = 0b001
+    MATCH = 0b010
+    JMP = 0b011
+    END_WITHOUT_ACCEPTING = 0b100
+    MATCH_ANY = 0b101
+    ACCEPT_PARTIAL = 0b110
+    NOT_MATCH = 0b111
+
+def decode_bytecode(code: bytes) -> list[tuple[Opcode,int]]:
+    """Decodes the bytecode produced by the compiler (two bytes for each instruction, big-endian).
+
+    :param bytes code: the bytecode
+    :return list[tuple[Opcode,int]]: the opcode and the data of each instruction
+    """
+    instructions = []
+    for i in range(0, len(code) - 1, 2):
+        instruction = (code[i] << 8) | code[i + 1]
+        instructions.append((Opcode(instruction >> OPCODE_SHIFT), instruction & DATA_MASK))
+    return instructions
+
+def code_qwords(code_length: int) -> int:
+    """Gets the number of qwords of RAM occupied by a program.
+
+    :param int code_length: the length of the bytecode in bytes
+    :return int: the number of qwords
+    """
+    return (code_length + 7) // 8
@@ -0,0 +1,301 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from CiceroSerial.driver import CiceroOnArduino, RegexError
+
+class _Job:
+    """A slice of strings to test on a regex."""
+    def __init__(self, regex: str, regex_format: str, strings: list, group: "_JobGroup", index: int, budgets: list[int]=None) -> None:
+        self.regex = regex
+        self.regex_format = regex_format
+        self.strings = strings
+        self.budgets = budgets
+        self.group = group
+        self.index = index
+        self.attempts = 0
+
+class _JobGroup:
+    """All the jobs created by a single request, the caller waits until all of them are done."""
+    def __init__(self, jobs_num: int) -> None:
+        self.results = [None] * jobs_num
+        self.remaining = jobs_num
+        self.exception = None
+
+class _Board:
+    """A driver instance together with its queue of jobs."""
+    def __init__(self, port: str, driver: CiceroOnArduino) -> None:
+        self.port = port
+        self.driver = driver
+        self.queue = deque()
+        self.alive = True
+        # Failures since the last job completed, and when a dead board can be probed again
+        self.failures = 0
+        self.next_probe = 0.0
+        # The regex loaded on CICERO and the regex of the last job queued, used for the affinity scheduling
+        self.resident = None
+        self.last_queued = None
+        self.jobs_done = 0
+        self.regex_loads = 0
+
+    def queued_strings(self) -> int:
+        return sum(len(job.strings) for job in self.queue)
+
+class CiceroPool:
+    """Pool of CICERO drivers, one for each Arduino, that shards the strings to test across all of them.
+    Jobs are queued preferably on boards that already have their regex loaded, idle boards steal jobs from the
+    others and jobs of boards that fail are retried on the remaining ones. A regex that can't be executed (see RegexError)
+    fails only its own jobs, the board keeps working. A board that fails is recovered and keeps its job, it is given up
+    only after failing again, then it is probed when new jobs arrive and used again as soon as it answers."""
+    def __init__(self, cicero_compiler_path:str, ports:list[str], chunk_size:int=None, max_attempts:int=3, driver_factory:Callable[[str], CiceroOnArduino]=None,
+                 max_recoveries:int=2, probe_interval:float=60.0, **driver_kwargs) -> None:
+        """Creates a new pool, connecting to all the given ports.
+
+        :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
+        :param list[str] ports: the ports where to find the Arduino serial connections
+        :param int chunk_size: the number of strings in each job, if None it is chosen so that every board gets about 4 jobs, defaults to None
+        :param int max_attempts: the max number of boards on which a job is tried before failing, defaults to 3
+        :param Callable[[str], CiceroOnArduino] driver_factory: function that creates the driver for a port, defaults to creating a CiceroOnArduino with 'driver_kwargs'
+        :param int max_recoveries: the failures in a row after which a board is given up, each one is followed by a recovery and a retry on the same board, defaults to 2
+        :param float probe_interval: the min seconds between two probes of a board that has been given up, defaults to 60.0
+        """
+        if driver_factory is None:
+            driver_factory = lambda port: CiceroOnArduino(cicero_compiler_path, port, **driver_kwargs)
+
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.max_recoveries = max_recoveries
+        self.probe_interval = probe_interval
+
+        self._condition = threading.Condition()
+        self._closed = False
+        self.boards = [_Board(port, driver_factory(port)) for port in ports]
+
+        self._threads = []
+        for board in self.boards:
+            self._start_worker(board)
+
+    def _start_worker(self, board: _Board) -> None:
+        thread = threading.Thread(target=self._worker, args=(board,), name="CiceroPool-" + board.port, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _recover(self, board: _Board) -> bool:
+        """Brings the connection with a board back to command mode after a failure, its regex will be loaded again.
+
+        :param _Board board: the board, its worker must not be using it
+        :return bool: True if the board answered
+        """
+        board.resident = None
+        try:
+            board.driver.recover()
+            if board.driver.driver_status == CiceroOnArduino.DriverStatus.TEXT_MODE:
+                board.driver._exit_text_mode()
+        except Exception as exc:
+            print("WARN: Arduino on port", board.port, "could not be recovered:", exc)
+            return False
+        return True
+
+    def _probe_dead_boards(self) -> None:
+        """Tries to recover the boards that have been given up, at most once every 'probe_interval' seconds each,
+        and restarts the workers of the ones that answer."""
+        now = time.monotonic()
+        with self._condition:
+            boards = [board for board in self.boards if not board.alive and board.next_probe <= now]
+            for board in boards:
+                board.next_probe = now + self.probe_interval
+
+        for board in boards:
+            if not self._recover(board):
+                continue
+            print("WARN: Arduino on port", board.port, "answers again, it gets jobs again")
+            with self._condition:
+                if self._closed:
+                    return
+                board.alive = True
+                board.failures = 0
+                self._start_worker(board)
+
+    def _alive_boards(self) -> list[_Board]:
+        return [board for board in self.boards if board.alive]
+
+    def _enqueue(self, job: _Job, exclude: _Board=None) -> None:
+        """Queues a job on the best board, the lock must be held.
+        A board that already has the regex loaded or queued is preferred, unless it has much more work than the least loaded board.
+
+        :param _Job job: the job to queue
+        :param _Board exclude: a board that should not get the job, defaults to None
+        """
+        boards = [board for board in self._alive_boards() if board is not exclude] or self._alive_boards()
+        if not boards:
+            self._fail(job, Exception("No Arduino available"))
+            return
+
+        least_loaded = min(boards, key=_Board.queued_strings)
+        key = (job.regex, job.regex_format)
+        affine = [board for board in boards if key in (board.resident, board.last_queued)]
+        target = least_loaded
+        if affine:
+            best_affine = min(affine, key=_Board.queued_strings)
+            # Reloading a regex costs about as much as testing a chunk of strings
+            if best_affine.queued_strings() <= least_loaded.queued_strings() + len(job.strings):
+                target = best_affine
+
+        target.queue.append(job)
+        target.last_queued = key
+        self._condition.notify_all()
+
+    def _take(self, board: _Board) -> _Job|None:
+        """Takes the next job for a board, stealing from the most loaded board if its queue is empty; the lock must be held.
+
+        :param _Board board: the board that will execute the job
+        :return _Job|None: the job, None if there is nothing to do
+        """
+        if board.queue:
+            return board.queue.popleft()
+
+        victims = [other for other in self.boards if other is not board and other.queue]
+        if not victims:
+            return None
+
+        # Dead boards are drained first, then the most loaded one; jobs with the regex already loaded are preferred
+        victim = max(victims, key=lambda other: (not other.alive, other.queued_strings()))
+        for job in reversed(victim.queue):
+            if (job.regex, job.regex_format) == board.resident:
+                victim.queue.remove(job)
+                return job
+        return victim.queue.pop()
+
+    def _worker(self, board: _Board) -> None:
+        while True:
+            with self._condition:
+                job = None
+                while board.alive and not self._closed:
+                    job = self._take(board)
+                    if job is not None:
+                        break
+                    self._condition.wait()
+                if job is None:
+                    return
+                if job.group.exception is not None:
+                    # Another job of the same request failed, so its results would be discarded
+                    self._complete(job, [])
+                    continue
+
+            try:
+                if board.resident != (job.regex, job.regex_format):
+                    board.resident = None
+                    board.driver.load_regex(job.regex, job.regex_format)
+                    board.resident = (job.regex, job.regex_format)
+                    board.regex_loads += 1
+                results = board.driver.test_loaded_regex(job.regex, job.strings, job.regex_format, job.budgets)
+            except RegexError as exc:
+                # Nothing was sent to Arduino, the regex would fail on any board
+                with self._condition:
+                    self._fail(job, exc)
+                continue
+            except Exception as exc:
+                board.failures += 1
+                if board.failures <= self.max_recoveries and self._recover(board):
+                    # A single timeout or invalid result does not mean that the board is lost
+                    print("WARN: Arduino on port", board.port, "failed, the job will be retried on it:", exc)
+                    with self._condition:
+                        board.queue.appendleft(job)
+                    continue
+
+                print("WARN: Arduino on port", board.port, "failed, its jobs will be retried on the other boards:", exc)
+                with self._condition:
+                    board.alive = False
+                    board.next_probe = time.monotonic() + self.probe_interval
+                    board.resident = None
+                    job.attempts += 1
+                    if job.attempts >= self.max_attempts:
+                        self._fail(job, exc)
+                    else:
+                        self._enqueue(job, exclude=board)
+                    # Move the remaining jobs to the other boards
+                    while board.queue:
+                        self._enqueue(board.queue.popleft(), exclude=board)
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                board.failures = 0
+                board.jobs_done += 1
+                self._complete(job, results)
+
+    def _complete(self, job: _Job, results: list) -> None:
+        job.group.results[job.index] = results
+        job.group.remaining -= 1
+        self._condition.notify_all()
+
+    def _fail(self, job: _Job, exc: Exception) -> None:
+        if job.group.exception is None:
+            job.group.exception = exc
+        self._complete(job, [])
+
+    def map(self, jobs: list[tuple[str,list]], regex_format="pythonre", budgets: list[list[int]]=None) -> list[list[tuple[bool,int,float]]]:
+        """Tests many regexes, each one on its list of strings, using all the boards concurrently.
+
+        :param list[tuple[str,list]] jobs: the regexes with their list of strings to test
+        :param str regex_format: format of the regexes (see compiler), defaults to "pythonre"
+        :param list[list[int]] budgets: for each regex, the cycle budget of each of its strings, None for no limit, defaults to None
+        :raises Exception: if a job failed on too many boards or all the boards failed
+        :return list[list[tuple[bool,int,float]]]: for each regex the results in the same format as CiceroOnArduino.load_regex_and_test_strings()
+        """
+        self._probe_dead_boards()
+        with self._condition:
+            boards_num = max(1, len(self._alive_boards()))
+
+        slices = []
+        for job_index, (regex, strings) in enumerate(jobs):
+            chunk_size = self.chunk_size or max(1, math.ceil(len(strings) / (4 * boards_num)))
+            job_budgets = budgets[job_index] if budgets is not None else None
+            for start in range(0, len(strings), chunk_size):
+                slices.append((job_index, regex, strings[start:start + chunk_size], job_budgets[start:start + chunk_size] if job_budgets is not None else None))
+
+        group = _JobGroup(len(slices))
+        with self._condition:
+            for index, (_, regex, strings, slice_budgets) in enumerate(slices):
+                self._enqueue(_Job(regex, regex_format, strings, group, index, slice_budgets))
+            while group.remaining > 0:
+                self._condition.wait()
+
+        if group.exception is not None:
+            raise group.exception
+
+        results = [[] for _ in jobs]
+        for (job_index, _, _, _), slice_results in zip(slices, group.results):
+            results[job_index] += slice_results
+        return results
+
+    def load_regex_and_test_strings(self, regex: str, strings: list[str], regex_format="pythonre", budgets: list[int]=None) -> list[tuple[bool,int,float]]:
+        """Loads a regex and test all the given strings on it, splitting the strings across all the boards.
+
+        :param str regex: the regex to load
+        :param list[str] strings: a list of strings to test
+        :param str regex_format: format of the regex (see compiler), defaults to "pythonre"
+        :param list[int] budgets: the cycle budget of each string, None for no limit, defaults to None
+        :return list[tuple[bool,int,float]]: a list of tuples containing the following for each tested string: if a match was found, the elapsed clock cycles and the estimated execution time for that computation
+        """
+        return self.map([(regex, strings)], regex_format, [budgets] if budgets is not None else None)[0]
+
+    def stats(self) -> dict[str,dict]:
+        """Gets the status of each board.
+
+        :return dict[str,dict]: for each port, if the board is alive, the number of jobs done, the number of regex loads and the regex uploads done and skipped by its driver
+        """
+        with self._condition:
+            return {board.port: {"alive": board.alive, "jobs_done": board.jobs_done, "regex_loads": board.regex_loads, **board.driver.upload_stats()} for board in self.boards}
+
+    def close(self) -> None:
+        """Stops the workers and closes the serial connections."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        for board in self.boards:
+            board.driver.arduino.close()
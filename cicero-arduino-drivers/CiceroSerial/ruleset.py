@@ -0,0 +1,178 @@
+from CiceroSerial.driver import CiceroOnArduino, RegexError
+from CiceroSerial.isa import RAM_QWORDS, code_qwords
+
+def split_delimiters(regex: str, regex_format: str) -> tuple[str,str,str]:
+    """Splits a regex into delimiters and body, PCRE regexes are written as /body/flags.
+
+    :param str regex: the regex
+    :param str regex_format: the format of the regex (see compiler)
+    :return tuple[str,str,str]: the opening delimiter, the body and the closing delimiter with the flags
+    """
+    if regex_format == "pcre" and regex.startswith("/") and regex.rfind("/") > 0:
+        end = regex.rfind("/")
+        return "/", regex[1:end], regex[end:]
+    return "", regex, ""
+
+def union_regex(regexes: list[str], regex_format: str) -> str:
+    """Builds a regex that matches a string if any of the given regexes matches it.
+    PCRE regexes must all have the same flags.
+
+    :param list[str] regexes: the regexes
+    :param str regex_format: the format of the regexes (see compiler)
+    :return str: the alternation of all the regexes
+    """
+    if len(regexes) == 1:
+        return regexes[0]
+
+    parts = [split_delimiters(regex, regex_format) for regex in regexes]
+    opening, _, closing = parts[0]
+    return opening + "|".join("(" + body + ")" for _, body, _ in parts) + closing
+
+class CiceroRuleset:
+    """Matches a large set of regexes on the same strings with few executions of CICERO.
+    Regexes are packed into groups whose alternation fits in CICERO RAM, every string is tested once per group and
+    only the strings matched by the alternation are tested again on the single regexes of the group."""
+    def __init__(self, driver: CiceroOnArduino, regexes: list[str], regex_format: str="pythonre", min_text_length: int=1024) -> None:
+        """Creates a new ruleset, grouping its regexes.
+
+        :param CiceroOnArduino driver: the driver of the board where the ruleset will be executed
+        :param list[str] regexes: the regexes of the ruleset
+        :param str regex_format: the format of the regexes (see compiler), defaults to "pythonre"
+        :param int min_text_length: the length of the strings that must fit in RAM together with the code of a group, defaults to 1024
+        """
+        self.driver = driver
+        self.regexes = regexes
+        self.regex_format = regex_format
+        # One byte of RAM is needed for the string terminator
+        self.max_code_qwords = RAM_QWORDS - code_qwords(min_text_length + 1)
+
+        self.groups = self._build_groups()
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.group_executions = 0
+        self.fallback_executions = 0
+        self.regex_loads = 0
+        self.matched_group_strings = 0
+        self.errors = {}
+
+    def _fits(self, indexes: list[int]) -> bool:
+        """Checks if the alternation of the given regexes can be compiled and fits in RAM.
+
+        :param list[int] indexes: the indexes of the regexes
+        :return bool: if the alternation can be used as a group
+        """
+        try:
+            code = self.driver._compile_regex(union_regex([self.regexes[i] for i in indexes], self.regex_format), self.regex_format)
+        except Exception:
+            return False
+        return code_qwords(len(code)) <= self.max_code_qwords
+
+    def _split(self, indexes: list[int]) -> list[list[int]]:
+        """Splits a candidate group in halves until every part fits in RAM.
+
+        :param list[int] indexes: the indexes of the regexes of the candidate group
+        :return list[list[int]]: the groups
+        """
+        if len(indexes) == 1 or self._fits(indexes):
+            return [indexes]
+        middle = len(indexes) // 2
+        return self._split(indexes[:middle]) + self._split(indexes[middle:])
+
+    def _build_groups(self) -> list[list[int]]:
+        """Packs the regexes into groups, first estimating the size of the alternation as the sum of the size of the
+        single regexes, then checking the estimate by compiling the alternation.
+
+        :return list[list[int]]: the indexes of the regexes in each group
+        """
+        candidates = []
+        current = []
+        current_qwords = 0
+        current_key = None
+        for index, regex in enumerate(self.regexes):
+            try:
+                qwords = code_qwords(len(self.driver._compile_regex(regex, self.regex_format)))
+            except Exception:
+                # Regexes that can't be compiled stay alone, they will fail when they are loaded
+                qwords = self.max_code_qwords + 1
+
+            # Only PCRE regexes with the same flags can be put in the same alternation
+            key = split_delimiters(regex, self.regex_format)[2]
+            if current and (current_qwords + qwords > self.max_code_qwords or key != current_key):
+                candidates.append(current)
+                current = []
+                current_qwords = 0
+
+            current.append(index)
+            current_qwords += qwords
+            current_key = key
+        if current:
+            candidates.append(current)
+
+        groups = []
+        for candidate in candidates:
+            groups += self._split(candidate)
+        return groups
+
+    def match_strings(self, strings: list[str|bytes]) -> list[list[bool|None]]:
+        """Matches every regex of the ruleset on every string.
+        A string on which the alternation of a group returned CICERO_ERROR is tested again on the single regexes of the group,
+        like a match, but there an error is scored as a non-match, as an error on a regex alone always is.
+
+        :param list[str|bytes] strings: the strings to test
+        :return list[list[bool|None]]: for each regex, if it matched each string, None for the regexes that can't be executed (see errors)
+        """
+        self._reset_counters()
+        results = [[False] * len(strings) for _ in self.regexes]
+
+        for group in self.groups:
+            try:
+                self.driver.load_regex(union_regex([self.regexes[i] for i in group], self.regex_format), self.regex_format)
+            except RegexError as exc:
+                # Only a regex alone can fail, the alternation of a larger group has been compiled when it was built
+                for regex_index in group:
+                    results[regex_index] = [None] * len(strings)
+                    self.errors[regex_index] = str(exc)
+                continue
+            self.regex_loads += 1
+            group_results = self.driver.test_strings(strings)
+            self.group_executions += len(strings)
+
+            # An error of CICERO does not prove that there is no match, so the string is tested again
+            matched = [i for i, (result, _) in enumerate(group_results) if result in (CiceroOnArduino.MATCH_FOUND, CiceroOnArduino.CICERO_ERROR)]
+            if len(group) == 1:
+                for i, (result, _) in enumerate(group_results):
+                    results[group[0]][i] = result == CiceroOnArduino.MATCH_FOUND
+                continue
+            if not matched:
+                continue
+
+            self.matched_group_strings += len(matched)
+            matched_strings = [strings[i] for i in matched]
+            for regex_index in group:
+                self.driver.load_regex(self.regexes[regex_index], self.regex_format)
+                self.regex_loads += 1
+                for i, (result, _) in zip(matched, self.driver.test_strings(matched_strings)):
+                    results[regex_index][i] = result == CiceroOnArduino.MATCH_FOUND
+                self.fallback_executions += len(matched)
+
+        return results
+
+    def report(self, strings_num: int) -> dict[str,int|float|list|dict]:
+        """Gets the statistics of the last call to match_strings().
+
+        :param int strings_num: the number of strings tested
+        :return dict[str,int|float|list|dict]: the groups, the fallback rate (fraction of group executions that needed the single regexes),
+                                          the executions and regex loads compared to testing every regex separately
+                                          and the error of each regex that can't be executed
+        """
+        return {
+            "groups": self.groups,
+            "group_count": len(self.groups),
+            "fallback_rate": self.matched_group_strings / self.group_executions if self.group_executions else 0.0,
+            "executions": self.group_executions + self.fallback_executions,
+            "executions_without_groups": len(self.regexes) * strings_num,
+            "regex_loads": self.regex_loads,
+            "regex_loads_without_groups": len(self.regexes),
+            "errors": {self.regexes[index]: error for index, error in self.errors.items()},
+        }
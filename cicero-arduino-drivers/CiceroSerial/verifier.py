@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+def _init_worker(cicero_compiler_path: str) -> None:
+    """Adds CICERO compiler folder to PATH in the worker processes.
+
+    :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
+    """
+    if cicero_compiler_path not in sys.path:
+        sys.path.append(cicero_compiler_path)
+
+def _golden_model_result(regex: str, string: str|bytes, regex_format: str) -> tuple[bool,float]:
+    """Computes the expected result with the golden model, in a worker process.
+
+    :param str regex: the regex
+    :param str|bytes string: the string
+    :param str regex_format: the format of the regex (see compiler)
+    :return tuple[bool,float]: the result of the golden model and the seconds spent computing it
+    """
+    import golden_model
+
+    start = time.perf_counter()
+    result = golden_model.get_golden_model_result(regex, string, no_prefix=False, no_postfix=False, frontend=regex_format)
+    return result, time.perf_counter() - start
+
+class GoldenModelVerifier:
+    """Checks the results of CICERO against the golden model of the compiler on a pool of processes,
+    so that the check does not slow down the communication with Arduino.
+    Mismatches are printed and appended to a log with one JSON object per line."""
+    def __init__(self, cicero_compiler_path:str, sample_every:int=1, workers:int=None, mismatch_log:str=None, max_pending:int=4096) -> None:
+        """Creates a new verifier.
+
+        :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
+        :param int sample_every: verify one result every 'sample_every', 1 to verify all of them and 0 to disable verification, defaults to 1
+        :param int workers: the number of worker processes, defaults to the number of CPUs
+        :param str mismatch_log: path of the file where mismatches are appended, defaults to None
+        :param int max_pending: the max number of results waiting to be verified, submit() blocks when it is reached, defaults to 4096
+        """
+        self.sample_every = sample_every
+        self.mismatch_log = mismatch_log
+        self.max_pending = max_pending
+
+        self._executor = None
+        if sample_every > 0:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cicero_compiler_path,))
+
+        # Reentrant, as callbacks of futures that are already done run in the thread that adds them
+        self._lock = threading.RLock()
+        self._pending = deque()
+        self._log_file = None
+        if mismatch_log:
+            os.makedirs(os.path.dirname(mismatch_log) or ".", exist_ok=True)
+            self._log_file = open(mismatch_log, 'a')
+
+        self.submitted = 0
+        self.verified = 0
+        self.mismatches = 0
+        self.failures = 0
+        # Seconds spent computing the golden model in the workers and seconds the caller waited for the verifier
+        self.worker_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    def submit(self, regex: str, string: str|bytes, result: bool, regex_format: str="pythonre") -> None:
+        """Queues a result of CICERO to be verified, if it is sampled.
+
+        :param str regex: the regex
+        :param str|bytes string: the string
+        :param bool result: if CICERO found a match
+        :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+        """
+        with self._lock:
+            self.submitted += 1
+            if self._executor is None or (self.submitted - 1) % self.sample_every != 0:
+                return
+
+            future = self._executor.submit(_golden_model_result, regex, string, regex_format)
+            future.add_done_callback(lambda done: self._on_done(done, regex, string, result))
+            self._pending.append(future)
+
+            oldest = self._pending.popleft() if len(self._pending) > self.max_pending else None
+
+        if oldest is not None:
+            # Backpressure: the workers can't keep up with the results
+            start = time.perf_counter()
+            oldest.exception()
+            with self._lock:
+                self.blocked_seconds += time.perf_counter() - start
+
+    def _on_done(self, future: Future, regex: str, string: str|bytes, result: bool) -> None:
+        with self._lock:
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failures += 1
+                print("WARN: golden model failed on regex '", regex, "':", future.exception())
+                return
+
+            golden_model_res, seconds = future.result()
+            self.verified += 1
+            self.worker_seconds += seconds
+
+            if result != golden_model_res:
+                self.mismatches += 1
+                print("CICERO output (", result, ") is incorrect for regex '", regex, "', string '", string, "'")
+                if self._log_file:
+                    string_bytes = string.encode("utf-8") if isinstance(string, str) else bytes(string)
+                    self._log_file.write(json.dumps({"regex": regex, "string_hex": string_bytes.hex(), "cicero": result, "golden_model": golden_model_res}) + "\n")
+                    self._log_file.flush()
+
+    def close(self) -> None:
+        """Waits for all the pending verifications and stops the workers."""
+        start = time.perf_counter()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.blocked_seconds += time.perf_counter() - start
+
+        with self._lock:
+            self._pending.clear()
+            if self._log_file:
+                self._log_file.close()
+                self._log_file = None
+
+    def summary(self) -> dict[str,int|float]:
+        """Gets the counters of the verifier.
+
+        :return dict[str,int|float]: the number of submitted, verified and mismatching results, the seconds of golden model computation
+                                      in the workers and the seconds the caller had to wait for the verifier
+        """
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "verified": self.verified,
+                "mismatches": self.mismatches,
+                "failures": self.failures,
+                "worker_seconds": round(self.worker_seconds, 3),
+                "blocked_seconds": round(self.blocked_seconds, 3),
+            }
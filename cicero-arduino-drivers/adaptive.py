@@ -0,0 +1,265 @@
+import json
+import math
+import os
+from statistics import NormalDist
+
+import numpy as np
+
+# Names of the metrics, as written by parser_results.py
+AVG_TIME = "AVG_Time[ns]"
+WEIGHTED_TIME = "Weighted_AVG_Time[ns]"
+THROUGHPUT = "Thr_AVG_RE[char/ns]"
+# Value of the match of the pairs whose execution exceeded its cycle budget, as written by CiceroOnArduino
+# Results written before it had a False match and this value only as time
+TIMEOUT = "TIMEOUT"
+
+# Largest benchmark whose random order is kept in memory, the pairs of larger ones are shuffled by a Feistel network
+MAX_SHUFFLED_PAIRS = 1 << 24
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Finalizer of SplitMix64, used as the round function of the Feistel network.
+
+    :param np.ndarray values: uint64 values
+    :return np.ndarray: the mixed values
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+class FeistelPermutation:
+    """Seeded pseudo-random permutation of the integers from 0 to size - 1, that does not need memory for every integer.
+    A balanced Feistel network permutes the smallest power of 4 that contains them, the values that fall outside of the
+    range are permuted again (cycle walking) until they are inside it."""
+    ROUNDS = 6
+
+    def __init__(self, size: int, rng: np.random.Generator) -> None:
+        """Creates a new permutation.
+
+        :param int size: the number of integers
+        :param np.random.Generator rng: the generator of the keys of the rounds
+        """
+        self.size = size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = np.uint64((1 << self.half_bits) - 1)
+        self.keys = rng.integers(0, np.iinfo(np.uint64).max, size=self.ROUNDS, dtype=np.uint64, endpoint=True)
+
+    def _encrypt(self, values: np.ndarray) -> np.ndarray:
+        shift = np.uint64(self.half_bits)
+        left, right = values >> shift, values & self.mask
+        for key in self.keys:
+            left, right = right, (left ^ _mix(right ^ key)) & self.mask
+        return (left << shift) | right
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        values = self._encrypt(np.arange(*key.indices(self.size), dtype=np.uint64))
+        outside = values >= np.uint64(self.size)
+        while outside.any():
+            values[outside] = self._encrypt(values[outside])
+            outside[outside] = values[outside] >= np.uint64(self.size)
+        return values.astype(np.int64)
+
+class PrecisionTracker:
+    """Running estimates, with confidence intervals, of the metrics that parser_results.py computes from a sample of the
+    (regex, string) pairs of a benchmark: the average time, the time weighted by the characters and the characters per ns.
+    The two ratios use the delta method, all the intervals use the finite population correction, so that they shrink to
+    nothing when the whole benchmark is executed."""
+    # Running sums of time (t), characters (c) and their products
+    SUMS = ("t", "tt", "c", "cc", "ct", "cct", "cctt")
+
+    def __init__(self, population: int, confidence: float=0.95) -> None:
+        """Creates a new tracker without samples.
+
+        :param int population: the number of pairs of the benchmark
+        :param float confidence: the confidence level of the intervals, defaults to 0.95
+        """
+        self.population = population
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.n = 0
+        self.sums = dict.fromkeys(self.SUMS, 0.0)
+
+    def add(self, times: np.ndarray, chars: np.ndarray) -> None:
+        """Adds the measures of some pairs.
+
+        :param np.ndarray times: the time of each pair, in ns
+        :param np.ndarray chars: the characters of each pair, as parser_results.py counts them
+        """
+        t = np.asarray(times, dtype=np.float64)
+        c = np.asarray(chars, dtype=np.float64)
+        self.n += len(t)
+        for name, values in (("t", t), ("tt", t * t), ("c", c), ("cc", c * c), ("ct", c * t), ("cct", c * c * t), ("cctt", c * c * t * t)):
+            self.sums[name] += float(values.sum())
+
+    def _interval(self, estimate: float, residual_squares: float, scale: float) -> dict[str,float]:
+        """Builds the confidence interval of an estimate from the sum of the squares of its residuals.
+
+        :param float estimate: the estimate
+        :param float residual_squares: the sum of the squared residuals, whose mean is 0
+        :param float scale: the mean that divides the residuals, 1 for a mean
+        :return dict[str,float]: the estimate, the bounds of the interval and its half width relative to the estimate
+        """
+        variance = max(residual_squares, 0.0) / (self.n - 1)
+        correction = max(0.0, 1 - self.n / self.population) if self.population else 1.0
+        half_width = self.z * math.sqrt(variance / self.n * correction) / scale
+        return {
+            "estimate": estimate,
+            "low": estimate - half_width,
+            "high": estimate + half_width,
+            "relative_half_width": half_width / abs(estimate) if estimate else math.inf,
+        }
+
+    def estimates(self) -> dict[str,dict[str,float]]:
+        """Gets the estimates of the metrics.
+
+        :return dict[str,dict[str,float]]: for each metric, the estimate and its confidence interval, empty with less than 2 samples or no time
+        """
+        s = self.sums
+        if self.n < 2 or s["t"] <= 0 or s["c"] <= 0:
+            return {}
+        mean_t = s["t"] / self.n
+        mean_c = s["c"] / self.n
+        weighted = s["ct"] / s["c"]
+        throughput = s["c"] / s["t"]
+        return {
+            AVG_TIME: self._interval(mean_t, s["tt"] - self.n * mean_t * mean_t, 1.0),
+            # Residuals c * (t - weighted) and c - throughput * t
+            WEIGHTED_TIME: self._interval(weighted, s["cctt"] - 2 * weighted * s["cct"] + weighted * weighted * s["cc"], mean_c),
+            THROUGHPUT: self._interval(throughput, s["cc"] - 2 * throughput * s["ct"] + throughput * throughput * s["tt"], mean_t),
+        }
+
+    def precision(self) -> float:
+        """Gets the worst relative precision among the metrics.
+
+        :return float: the largest half width of the intervals relative to their estimate, inf if it can't be computed yet
+        """
+        estimates = self.estimates()
+        return max((metric["relative_half_width"] for metric in estimates.values()), default=math.inf)
+
+class AdaptiveSampler:
+    """Executes the (regex, string) pairs of a benchmark in a random order, interleaving regexes and strings,
+    until the metrics of parser_results.py are known with the target precision.
+    Pairs are handed out in blocks, the precision is checked before every block."""
+    def __init__(self, regexes_num: int, strings: list[bytes], target_precision: float, time_measure: str="CiceroOnArduino_exec[cc]", match_measure: str="CiceroOnArduino_match[bool]",
+                 cycles_per_ns: float|None=0.214, confidence: float=0.95, block_size: int=256, min_pairs: int=1000, seed: int=None) -> None:
+        """Creates a new sampler.
+
+        :param int regexes_num: the number of regexes of the benchmark
+        :param list[bytes] strings: the strings of the benchmark
+        :param float target_precision: the half width of the confidence intervals relative to the estimates at which the run stops, e.g. 0.05
+        :param str time_measure: the measure with the execution time, defaults to "CiceroOnArduino_exec[cc]"
+        :param str match_measure: the measure with the result of the match, defaults to "CiceroOnArduino_match[bool]"
+        :param float|None cycles_per_ns: the frequency used to convert clock cycles to ns (214 MHz is 0.214), None if the time measure is already in ns, defaults to 0.214
+        :param float confidence: the confidence level of the intervals, defaults to 0.95
+        :param int block_size: the number of pairs between two checks of the precision, defaults to 256
+        :param int min_pairs: the number of pairs executed before the precision is checked, defaults to 1000
+        :param int seed: the seed of the random order, None for a random seed, defaults to None
+        """
+        self.regexes_num = regexes_num
+        self.strings_num = len(strings)
+        # Characters are counted on the text of the string, as parser_results.py does
+        self.string_chars = np.fromiter((len(str(string)) for string in strings), dtype=np.int64, count=len(strings))
+        self.target_precision = target_precision
+        self.time_measure = time_measure
+        self.match_measure = match_measure
+        self.cycles_per_ns = cycles_per_ns
+        self.block_size = block_size
+        self.min_pairs = min_pairs
+
+        self.population = regexes_num * self.strings_num
+        self.tracker = PrecisionTracker(self.population, confidence)
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (1 << 32))
+        rng = np.random.default_rng(self.seed)
+        # Every order of the pairs is equally likely, a large benchmark uses a permutation that does not need memory for every pair
+        self._order = rng.permutation(self.population) if self.population <= MAX_SHUFFLED_PAIRS else FeistelPermutation(self.population, rng)
+
+        self.submitted = 0
+        self.missing = 0
+        self.timeouts = 0
+        self.stopped_early = False
+
+    def converged(self) -> bool:
+        """Checks if the target precision has been reached.
+
+        :return bool: True if the run can stop
+        """
+        return self.tracker.n >= min(self.min_pairs, self.population) and self.tracker.precision() <= self.target_precision
+
+    def blocks(self):
+        """Hands out the pairs to execute until the target precision is reached or all the pairs are executed.
+
+        :yield tuple[int,np.ndarray]: a regex and the indexes of the strings it must be tested on, all the regexes of a block are yielded together
+        """
+        while self.submitted < self.population:
+            if self.converged():
+                self.stopped_early = True
+                return
+
+            end = min(self.submitted + self.block_size, self.population)
+            pairs = self._order[self.submitted:end]
+            self.submitted = end
+
+            regex_indexes, string_indexes = np.divmod(pairs, self.strings_num)
+            order = np.lexsort((string_indexes, regex_indexes))
+            regex_indexes, string_indexes = regex_indexes[order], string_indexes[order]
+            for regex_index in np.unique(regex_indexes):
+                yield int(regex_index), string_indexes[regex_indexes == regex_index]
+
+    def observe(self, regex_index: int, string_indexes: np.ndarray, measure_names: list[str], results_per_string: list[list]) -> None:
+        """Updates the estimates with the results of a measurer, results of measurers without the time and match measures are ignored.
+
+        :param int regex_index: the index of the regex
+        :param np.ndarray string_indexes: the indexes of the strings
+        :param list[str] measure_names: the names of the measures of the measurer
+        :param list[list] results_per_string: for each string, the values of the measures
+        """
+        if self.time_measure not in measure_names or self.match_measure not in measure_names:
+            return
+        time_position = measure_names.index(self.time_measure)
+        match_position = measure_names.index(self.match_measure)
+
+        times, chars = [], []
+        for string_index, values in zip(string_indexes, results_per_string):
+            time = values[time_position] if len(values) > time_position else None
+            match = values[match_position] if len(values) > match_position else None
+            if match == TIMEOUT or time == TIMEOUT:
+                # Executions stopped by the cycle budget have no time, parser_results.py leaves them out of the metrics too
+                self.timeouts += 1
+                continue
+            if not isinstance(time, (int, float)) or isinstance(time, bool) or not isinstance(match, bool):
+                # Errors have no time
+                self.missing += 1
+                continue
+            times.append(time / self.cycles_per_ns if self.cycles_per_ns else time)
+            # Matched strings are counted as half of their characters, as parser_results.py does
+            chars.append(self.string_chars[string_index] // 2 if match else self.string_chars[string_index])
+        self.tracker.add(np.array(times), np.array(chars))
+
+    def report(self) -> dict:
+        """Gets the achieved precision of the run.
+
+        :return dict: the settings, the executed pairs and the estimate and confidence interval of each metric
+        """
+        return {
+            "target_precision": self.target_precision,
+            "confidence": self.tracker.confidence,
+            "seed": self.seed,
+            "pairs_total": self.population,
+            "pairs_executed": self.tracker.n,
+            "pairs_missing": self.missing,
+            "pairs_timeout": self.timeouts,
+            "stopped_early": self.stopped_early,
+            "precision": self.tracker.precision(),
+            "metrics": self.tracker.estimates(),
+        }
+
+    def export_json(self, path: str) -> None:
+        """Writes the report to a JSON file.
+
+        :param str path: the path of the file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
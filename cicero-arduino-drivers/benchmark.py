@@ -1,72 +1,108 @@
-from typing import Iterable
-from measurers import regular_expression_measurer, RESULT_measurer, CiceroOnArduino_measurer
+from measurers import regular_expression_measurer, RESULT_measurer, CiceroOnArduino_measurer, CiceroRuleset_measurer
+from CiceroSerial.bundle import Bundle
+from CiceroSerial.bytecode_cache import BytecodeCache, DEFAULT_CACHE_DIR
+from CiceroSerial.verifier import GoldenModelVerifier
+from CiceroSerial.instrumentation import PhaseRecorder
+from results_sink import ResultsSink, measurer_key
+from results_store import ResultsStore
+from results_db import ResultsDatabase
+from inputs import IndexedRegexes, IndexedStrings, open_regexes, open_strings, take
+from scheduler import MeasurerExecutors
+from sharding import Shard, parse_shard, write_manifest
+from adaptive import AdaptiveSampler
+from cost_model import BUDGET_FACTOR, CostEta, CostModel, regex_costs
+import results_sink
 
-import csv
 import argparse
 import os.path
-from itertools import chain, product
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+from itertools import product
 from tqdm import tqdm
 import numpy as np
 
 RESULTS_DIRECTORY = "results"
 INPUTS_DIRECTORY = "inputs"
+# Arguments that select the regexes and the strings of a benchmark, see load_inputs()
+INPUT_ARGUMENTS = ("benchmark", "startreg", "endreg", "reducedstr", "maxstrlen", "startstr", "endstr", "loadregexsample", "loadstringsample")
 
-def chunks(iterable: Iterable, chunk_size: int):
-    """Yield successive n-sized chunks from an iterable.
-
-    :param Iterable iterable: the iterable to split into chunks
-    :param int chunk_size: the size of the chunks
-    :yield any: the next chunk from the iterable
-    """
-    for i in range(0, len(iterable), chunk_size):
-        yield iterable[i:i + chunk_size]
-
-def load_regexes(benchmark_name:str, start_index:int, end_index:int) -> list[str]:
+def load_regexes(benchmark_name:str, start_index:int, end_index:int) -> IndexedRegexes:
     """Loads a list of regexes from a file.
+    The file is memory-mapped and regexes are read only when they are accessed, the position of each line is cached.
 
     :param str benchmark_name: the name of the benchmark for which to load regexes
     :param int start_index: the start index of the subset of regexes to return
     :param int end_index: the end index of the subset of regexes to return
-    :return list[str]: the list of regexes
+    :return IndexedRegexes: the list of regexes
     """
-    regexes = []
-    
     regex_file = INPUTS_DIRECTORY + "/" + benchmark_name + "/regex.txt"
-    # Read regexes from file
-    with open(regex_file, 'r') as f:
-        regexes = f.readlines()[start_index:end_index]
+    # Lines without their end of line
+    return open_regexes(regex_file)[start_index:end_index]
 
-        # Eliminate end of line 
-        regexes = list(map(lambda x: x[:-1], regexes))
-
-    return regexes
-
-def load_strings(benchmark_name:str, reduced_input:bool, start_index:int, end_index:int, max_length:int) -> list[bytes]:
+def load_strings(benchmark_name:str, reduced_input:bool, start_index:int, end_index:int, max_length:int) -> IndexedStrings:
     """Loads a list of strings from file.
+    The file is memory-mapped and strings are read only when they are accessed, the position of each chunk is cached.
 
     :param str benchmark_name: the name of the benchmark for which to load strings
     :param bool reduced_input: if strings should be loaded from the reduced version of the input
     :param int start_index: the start index of the subset of strings to return
     :param int end_index: the end index of the subset of strings to return
     :param int max_length: the max length of the strings, if there are longer strings they will be split into chunks and all chunks will be returned
-    :return list[bytes]: the list of bytestrings representing the strings
+    :return IndexedStrings: the list of bytestrings representing the strings
     """
-    strings = []
-    
     string_file = INPUTS_DIRECTORY + "/" + benchmark_name + "/"
     string_file += "reduced." if reduced_input else ""
     string_file += "input.txt"
-    # Read strings from file as bytestrings
-    with open(string_file, 'rb') as f:
-        strings = f.read().split(b'\n')
+    # Lines without their end of line, split in chunks of max length 'max_length'
+    return open_strings(string_file, max_length)[start_index:end_index]
 
-        # Eliminate end of line and split every string in chunks of max lenght 'max_length'
-        strings = list(chain.from_iterable(map(lambda x: chunks(x[:-1], max_length), strings)))[start_index:end_index]
+def load_inputs(args:argparse.Namespace) -> tuple[IndexedRegexes,IndexedStrings]:
+    """Loads the regexes and the strings selected by the arguments in INPUT_ARGUMENTS, keeping only the sampled ones if requested.
 
-    return strings
+    :param argparse.Namespace args: the arguments of the benchmark
+    :return tuple[IndexedRegexes,IndexedStrings]: the regexes and the strings
+    """
+    regexes = load_regexes(args.benchmark, args.startreg, args.endreg)
+    strings = load_strings(args.benchmark, args.reducedstr, args.startstr, args.endstr, args.maxstrlen)
 
-def execute_benchmark(measurer_list:list[regular_expression_measurer], progress_bar:tqdm, regexes:list[str], strings:list[bytes], regex_format:str, skip_exceptions:bool, debug:bool) -> dict[tuple,bool|str|int|float]:
+    # If the load sample argument is provided, keep in the regexes and/or strings list only the indexes loaded from file
+    if args.loadregexsample:
+        regexes_sampled_indexes = np.load(INPUTS_DIRECTORY + "/" + args.benchmark + "/rand.regex.index.npy")
+        regexes = regexes[regexes_sampled_indexes]
+
+    if args.loadstringsample:
+        strings_sampled_indexes = np.load(INPUTS_DIRECTORY + "/" + args.benchmark + "/rand.input.index.npy")
+        strings = strings[strings_sampled_indexes]
+
+    return regexes, strings
+
+def measures_of(measurer_list:list[regular_expression_measurer]) -> tuple[list[str],list[type]]:
+    """Gets the names and the types of the measures of all the measurers.
+
+    :param list[regular_expression_measurer] measurer_list: the measurers
+    :return tuple[list[str],list[type]]: the names and the types of the measures, in the order of the measurers
+    """
+    names = []
+    types = []
+    for measurer in measurer_list:
+        if isinstance(measurer.get_name(), list):
+            names += measurer.get_name()
+            types += measurer.get_types() or [None] * len(measurer.get_name())
+        else:
+            names.append(measurer.get_name())
+            types.append(measurer.get_types())
+    return names, types
+
+def execute_benchmark(measurer_list:list[regular_expression_measurer], progress_bar:tqdm, regexes:list[str], strings:list[bytes], regex_format:str, skip_exceptions:bool, debug:bool, sink:ResultsSink=None, concurrent:bool=False, cpu_workers:int=None, shard:Shard=None, sampler:AdaptiveSampler=None, costs:np.ndarray=None) -> ResultsStore:
     """Executes a benchmark.
+    If a sink is given, results are stored in it as soon as they are produced and the (regex, measurer) pairs already stored are skipped.
+    If concurrent, every measurer runs in its own executor (see MeasurerExecutors), results are stored in the same order anyway.
+    If a shard is given, every regex is tested only on the strings that belong to the shard together with it.
+    If a sampler is given, pairs are executed in the random order of the sampler until it reaches its target precision.
+    Otherwise, if the costs are given, the most expensive regexes are executed first and the progress bar shows the remaining time
+    according to them. Results are stored in the same order anyway.
 
     :param list[regular_expression_measurer] measurer_list: list of measurers to execute the benchmark with
     :param tqdm progress_bar: progress bar to update at each iteration
@@ -75,96 +111,192 @@ def execute_benchmark(measurer_list:list[regular_expression_measurer], progress_
     :param str regex_format: the format of given regexes
     :param bool skip_exceptions: if exceptions should not stop the computation, being only printed instead
     :param bool debug: if febug messages should be shown
-    :return dict[tuple,bool|str|int|float]: results will be in the form: (regex, string, measure_name): measure_value
+    :param ResultsSink sink: the storage where results are streamed, defaults to None
+    :param bool concurrent: if measurers should be executed at the same time, defaults to False
+    :param int cpu_workers: the number of processes of each measurer that is not io_bound, defaults to the number of CPUs
+    :param Shard shard: the slice of the (regex, string) pairs to execute, None for all of them, defaults to None
+    :param AdaptiveSampler sampler: the sampler that chooses the pairs to execute, None to execute all of them, defaults to None
+    :param np.ndarray costs: the predicted cost of each regex on all the strings (see cost_model.regex_costs()), defaults to None
+    :return ResultsStore: the results, indexed by regex, string and measure name
     """
-    # This dict will contain results in the form:
-    #   (regex, string, measure_name): measure_value
-    results = {}
+    results = ResultsStore(regexes, strings, *measures_of(measurer_list))
+    if sampler is not None:
+        pairs = _sampled_pairs(measurer_list, regexes, strings, sampler)
+    else:
+        pairs = _pending_pairs(measurer_list, progress_bar, regexes, strings, sink, shard, costs)
+    options = dict(O1=True, no_postfix=False, no_prefix=False, regex_format=regex_format, debug=debug, skipException=skip_exceptions)
+    store = partial(_store_results, results, sink, sampler)
+    if costs is not None and sampler is None:
+        # The pending pairs are known in advance, so that the remaining time is estimated on their whole cost
+        pending = list(pairs)
+        pair_cost = partial(_pair_cost, costs, len(strings))
+        eta = CostEta(sum(pair_cost(pair[0], pair[3]) for pair in pending))
+        pairs = iter(pending)
+        store = partial(_store_with_eta, store, progress_bar, eta, pair_cost)
+
+    try:
+        if concurrent:
+            _execute_pairs_concurrently(pairs, measurer_list, progress_bar, strings, options, skip_exceptions, cpu_workers, store)
+        else:
+            _execute_pairs(pairs, progress_bar, options, skip_exceptions, store)
+    finally:
+        # Whatever happens, results produced so far are written
+        if sink is not None:
+            sink.flush()
+
+    if sink is not None:
+        load_results_from_sink(results, sink, regexes)
+    return results
 
+def _pending_pairs(measurer_list:list[regular_expression_measurer], progress_bar:tqdm, regexes:list[str], strings:list[bytes], sink:ResultsSink, shard:Shard, costs:np.ndarray=None) -> Iterator[tuple[int,str,regular_expression_measurer,list[bytes],np.ndarray|None]]:
+    # Longest job first: a slow regex started last would leave the run waiting for it alone
+    order = np.argsort(-costs, kind="stable") if costs is not None else range(len(regexes))
     # Foreach tuple in the cartesian product of regexes and measurers
-    for regex, measurer in product(regexes, measurer_list) :
+    for regex_index, measurer in product(order, measurer_list) :
+        regex_index = int(regex_index)
+        regex = regexes[regex_index]
+        # Strings of the regex in this shard, with their indexes
+        string_indexes = shard.string_indexes(regex_index) if shard is not None else None
+        regex_strings = take(strings, string_indexes) if shard is not None else strings
+        if len(regex_strings) == 0:
+            continue
+
+        if sink is not None and sink.is_done(regex_index, measurer_key(measurer.get_name())):
+            # Already executed by the run that is being resumed
+            progress_bar.update(len(regex_strings))
+            continue
+        yield regex_index, regex, measurer, regex_strings, string_indexes
+
+def _sampled_pairs(measurer_list:list[regular_expression_measurer], regexes:list[str], strings:list[bytes], sampler:AdaptiveSampler) -> Iterator[tuple[int,str,regular_expression_measurer,list[bytes],np.ndarray]]:
+    for regex_index, string_indexes in sampler.blocks():
+        regex_strings = take(strings, string_indexes)
+        for measurer in measurer_list:
+            yield regex_index, regexes[regex_index], measurer, regex_strings, string_indexes
+
+def _execute_pairs(pairs:Iterator[tuple[int,str,regular_expression_measurer,list[bytes],np.ndarray|None]], progress_bar:tqdm, options:dict, skip_exceptions:bool, store:Callable) -> None:
+    for regex_index, regex, measurer, strings, string_indexes in pairs:
         try:
-            results_per_regex = measurer.execute_multiple_strings(regex=regex, strings=strings, O1=True, no_postfix=False, no_prefix=False, regex_format=regex_format, debug=debug, skipException=skip_exceptions)   
+            results_per_regex = measurer.execute_multiple_strings(regex=regex, strings=strings, **options)
         except KeyboardInterrupt:
             print ("[CTRL+C detected]")
             # Skip to save file
             break
         except Exception as exc:
-            print('error while executing regex', regex,'\n',  exc)
-            if not skip_exceptions:
-                raise exc
-            
-            # Put null values in the result to show that something went wrong
-            if isinstance(measurer.get_name(), list):
-                results_per_regex =  [[None for _ in strings] for _ in measurer.get_name()]
-            else:
-                results_per_regex =  [None for _ in strings]
+            results_per_regex = _failed_results(measurer, regex, strings, exc, skip_exceptions)
         
         # len(strings) computation have been done, update the progress bar
         progress_bar.update(len(strings))
+        store(regex_index, regex, measurer, strings, string_indexes, results_per_regex)
 
-        # If the measurer returns multiple measures, we need to correctly put all of them in the results
-        if isinstance(measurer.get_name(), list):
-            for string, result in zip(strings, results_per_regex):
-                for measure_name, measure_value in zip(measurer.get_name(), result):
-                    results[(regex, string, measure_name)] = measure_value
-        # If the measurer returns only one measure, put it directly in the results
-        else:
-            measure_name = measurer.get_name()
-            for string, result in zip(strings,results_per_regex):
-                    results[(regex,string,measure_name)]= result
+def _execute_pairs_concurrently(pairs:Iterator[tuple[int,str,regular_expression_measurer,list[bytes],np.ndarray|None]], measurer_list:list[regular_expression_measurer], progress_bar:tqdm, strings:list[bytes], options:dict, skip_exceptions:bool, cpu_workers:int, store:Callable) -> None:
+    executors = MeasurerExecutors(measurer_list, strings, options, cpu_workers)
+    # Pairs submitted but not stored yet, in the order of the serial execution
+    window = deque()
+    counted = set()
 
-    return results
+    def store_future(regex_index, regex, measurer, regex_strings, string_indexes, future):
+        try:
+            results_per_regex = future.result()
+        except Exception as exc:
+            results_per_regex = _failed_results(measurer, regex, regex_strings, exc, skip_exceptions)
+        store(regex_index, regex, measurer, regex_strings, string_indexes, results_per_regex)
+
+    try:
+        while True:
+            # Keep every executor busy: the slowest measurer always has pairs queued while the others run ahead
+            while len(window) < 4 * executors.workers:
+                pair = next(pairs, None)
+                if pair is None:
+                    break
+                _, regex, measurer, _, string_indexes = pair
+                window.append((pair, executors.submit(measurer, regex, string_indexes)))
+            if not window:
+                break
+
+            running = [future for _, future in window if not future.done()]
+            if running:
+                wait(running, return_when=FIRST_COMPLETED)
+            for pair, future in window:
+                if future.done() and future not in counted:
+                    counted.add(future)
+                    progress_bar.update(len(pair[3]))
+
+            # Results are stored in order, a pair waits for the ones before it
+            while window and window[0][1].done():
+                pair, future = window.popleft()
+                if future in counted:
+                    counted.discard(future)
+                else:
+                    # Completed after the progress bar was updated
+                    progress_bar.update(len(pair[3]))
+                store_future(*pair, future)
+    except KeyboardInterrupt:
+        print ("[CTRL+C detected]")
+        executors.shutdown(cancel=True)
+        # Keep the pairs that completed, then skip to save file
+        for pair, future in window:
+            if future.done() and not future.cancelled():
+                store_future(*pair, future)
+    finally:
+        executors.shutdown(cancel=True)
+
+def _pair_cost(costs:np.ndarray, strings_num:int, regex_index:int, regex_strings:list[bytes]) -> float:
+    # Costs are predicted on all the strings, the model is linear in their number
+    return costs[regex_index] * len(regex_strings) / strings_num if strings_num else 0.0
+
+def _store_with_eta(store:Callable, progress_bar:tqdm, eta:CostEta, pair_cost:Callable, regex_index:int, regex:str, measurer:regular_expression_measurer, strings:list[bytes], string_indexes:np.ndarray|None, results_per_regex:list) -> None:
+    store(regex_index, regex, measurer, strings, string_indexes, results_per_regex)
+    eta.done(pair_cost(regex_index, strings))
+    remaining = eta.remaining_seconds()
+    if remaining is not None:
+        progress_bar.set_postfix_str("cost ETA " + tqdm.format_interval(remaining), refresh=False)
+
+def _failed_results(measurer:regular_expression_measurer, regex:str, strings:list[bytes], exc:Exception, skip_exceptions:bool) -> list:
+    print('error while executing regex', regex,'\n',  exc)
+    if not skip_exceptions:
+        raise exc
+    
+    # Put null values in the result to show that something went wrong
+    if isinstance(measurer.get_name(), list):
+        return [[None for _ in strings] for _ in measurer.get_name()]
+    return [None for _ in strings]
+
+def _store_results(results:ResultsStore, sink:ResultsSink, sampler:AdaptiveSampler, regex_index:int, regex:str, measurer:regular_expression_measurer, strings:list[bytes], string_indexes:np.ndarray|None, results_per_regex:list) -> None:
+    # If the measurer returns only one measure, treat it as a list of one measure
+    names = measurer.get_name() if isinstance(measurer.get_name(), list) else [measurer.get_name()]
+    values = results_per_regex if isinstance(measurer.get_name(), list) else [[result] for result in results_per_regex]
+
+    if sampler is not None:
+        sampler.observe(regex_index, string_indexes, names, values)
+
+    if sink is not None:
+        # Results are read back from the sink at the end, so that they include the ones of the resumed run
+        sink.append(regex_index, measurer_key(measurer.get_name()), names, values, string_indexes)
+    else:
+        results.set_results(regex, string_indexes, names, values)
+
+def load_results_from_sink(results:ResultsStore, sink:ResultsSink, regexes:list[str]) -> None:
+    """Reads the results stored in a sink into a results store.
+
+    :param ResultsStore results: the store where the results are put
+    :param ResultsSink sink: the storage of the results
+    :param list[str] regexes: the regexes of the run, the strings are referenced by their index
+    """
+    table = sink.read_table()
+    columns = [table.column(name).to_numpy(zero_copy_only=False) for name in ("regex_index", "string_index", "measure", "value")]
+    results.set_text_results(regexes, *columns)
 
-def save_results_to_file(results:dict[tuple,bool|str|int|float], benchmark_name:str) -> None:
+def save_results_to_file(results:ResultsStore, benchmark_name:str) -> None:
     """Saves the results to a CSV file. They will be organized in sections, one for each string,
     and each section will have a list of all regexes with all the associated measures for that computation.
 
-    :param dict[tuple,bool | str | int | float] results: the results to save
+    :param ResultsStore results: the results to save
     :param str benchmark_name: the name of the benchmark that will be appended to the name of the file
     """
-    # Build an index of the results with this structure:
-    #   string1:
-    #     regex1: [measure1, measure2, ...]
-    #     regex2: [measure1, measure2, ...]
-    #     ...
-    #   ...
-    result_index = {}
-    for regex, string, measurer in results:
-        if not(string in result_index):
-            result_index[string]={}
-
-        if not(regex in result_index[string]):
-            result_index[string][regex]=[]
-
-        result_index[string][regex].append(measurer)
-
     if not os.path.isdir(RESULTS_DIRECTORY):
         os.mkdir(RESULTS_DIRECTORY)
 
-    # Write results to CSV file
-    with open(f'{RESULTS_DIRECTORY}/measure_{benchmark_name}.csv', 'w', newline='') as csvfile:
-        fout = csv.writer(csvfile, delimiter=',', quoting=csv.QUOTE_MINIMAL)
-
-        # Write a section for each string
-        for string in result_index:
-            # First, write the string
-            fout.writerow(['string: ', string, '', ''])
-
-            # Then write the headers of the columns of this section
-            # The headers will be all the measure names
-            names=[]
-            for measurer in measurer_list:
-                if isinstance(measurer.get_name(), list):
-                    names += [*measurer.get_name()]
-                else:
-                    names.append(measurer.get_name())
-            fout.writerow(['regex', *names])
-
-            # Then write the regexes and their associated results
-            for regex in result_index[string]:
-                result_line = [results[(regex,string,e)] if (regex,string,e) in results else None for e in names]
-                fout.writerow([regex,  *result_line ])
+    results.export_csv(f'{RESULTS_DIRECTORY}/measure_{benchmark_name}.csv')
 
 def get_sampled_indexes(original_array: list, size: int) -> list[int]:
     """Gets a list of randomly chosen indexes of the array.
@@ -211,45 +343,132 @@ if __name__ == "__main__":
     arg_parser.add_argument('-randomsample',      type=int,  help='generate a new random sample of the given size',                                    default=None)
     arg_parser.add_argument('-loadregexsample',              help='execute with the previously generated random regex sample',   action="store_true",  default=False)
     arg_parser.add_argument('-loadstringsample',             help='execute with the previously generated random string sample',  action="store_true",  default=False)
-    arg_parser.add_argument('-arduinoport',       type=str,  help='name of serial port where the Arduino running CICERO is',                           default='COM3')
+    arg_parser.add_argument('-arduinoport',       type=str,  help='name of serial port where the Arduino running CICERO is, comma separated for many',  default='COM3')
+    arg_parser.add_argument('-bytecodecache',     type=str,  help='directory of the persistent cache of compiled regexes',                             default=DEFAULT_CACHE_DIR)
+    arg_parser.add_argument('-bundle',            type=str,  help='bundle of precompiled regexes written by compile_for_arduino.py -regexfile',       default=None)
+    arg_parser.add_argument('-nodiskcache',                  help='keep the cache of compiled regexes only in memory',          action='store_true',  default=False)
+    arg_parser.add_argument('-instrument',                   help='measure the latency of each phase of the communication with CICERO', action='store_true', default=False)
+    arg_parser.add_argument('-resume',                       help='skip the regexes already measured by an interrupted run with the same arguments', action='store_true', default=False)
+    arg_parser.add_argument('-serial',                       help='execute one measurer at a time instead of overlapping them',  action='store_true',  default=False)
+    arg_parser.add_argument('-cpuworkers',        type=int,  help='processes of each CPU-bound measurer, defaults to the number of CPUs',               default=None)
+    arg_parser.add_argument('-shard',             type=str,  help='execute only the i-th of N slices of the (regex, string) pairs, as i/N, merge with merge_shards.py', default=None)
+    arg_parser.add_argument('-adaptive',          type=float, help='stop when the metrics of parser_results.py are known with this relative precision, e.g. 0.05', default=None)
+    arg_parser.add_argument('-confidence',        type=float, help='confidence level of the intervals of the adaptive mode',                          default=0.95)
+    arg_parser.add_argument('-freq',              type=int,  help='CICERO frequency in MHz, to convert clock cycles to ns in the adaptive mode',         default=214)
+    arg_parser.add_argument('-seed',              type=int,  help='seed of the random order of the pairs in the adaptive mode',                        default=None)
+    arg_parser.add_argument('-costmodel',         type=str,  help='cost model written by cost_model.py, to run the slowest regexes first and estimate the remaining time', default=None)
+    arg_parser.add_argument('-budgetfactor',      type=float, help='stop CICERO executions longer than this many times the cycles predicted by the cost model, 0 to disable', default=BUDGET_FACTOR)
+    arg_parser.add_argument('-cyclebudget',       type=int,  help='stop CICERO executions longer than this many cycles, when there is no cost model',  default=None)
+    arg_parser.add_argument('-resultsdb',         type=str,  help='results database where the results are ingested, see results_db.py',              default=None)
+    arg_parser.add_argument('-verify',            type=int,  help='verify 1 CICERO result every N against the golden model, 0 to disable',             default=1)
+    arg_parser.add_argument('-ruleset',                      help='match all the regexes together, in groups whose alternation fits in CICERO RAM', action='store_true', default=False)
 
     args = arg_parser.parse_args()
 
+    if args.adaptive and (args.shard or args.resume):
+        print("The adaptive mode can't be used together with -shard or -resume")
+        exit()
+    if args.ruleset and (args.shard or args.adaptive or ',' in args.arduinoport):
+        print("The ruleset mode can't be used together with -shard or -adaptive, or with more than one Arduino")
+        exit()
+
     # Any different method of regex matching is measured through an instance of a regular_expression_measurer subclass,
     # which expose method 'execute_multiple_strings()' that returns either one or a list of results.  
-    measurer_list = [RESULT_measurer(), CiceroOnArduino_measurer(args.arduinoport)]
+    # Always created, so that it can be enabled at runtime, but it records nothing unless requested
+    instrumentation = PhaseRecorder(enabled=args.instrument)
+    bytecode_cache = BytecodeCache(None if args.nodiskcache else args.bytecodecache)
+    verifier = GoldenModelVerifier("../cicero_compiler", sample_every=args.verify, mismatch_log=f"{RESULTS_DIRECTORY}/mismatches_{args.benchmark}.jsonl" if args.verify > 0 else None)
+    cost_model = CostModel.load(args.costmodel) if args.costmodel else None
+    bundle = Bundle(args.bundle) if args.bundle else None
+    # The ruleset measurer needs the regexes, it is created once they are loaded
+    cicero_measurer = None
+    if not args.ruleset:
+        cicero_measurer = CiceroOnArduino_measurer(args.arduinoport.split(','), bytecode_cache=bytecode_cache, verifier=verifier, instrumentation=instrumentation,
+                                                   cost_model=cost_model, budget_factor=args.budgetfactor, cycle_budget=args.cyclebudget, bundle=bundle)
+    # Overlapped measurers already run the reference measurer in a pool of processes, only serial runs split its batches among processes
+    reference_measurer = RESULT_measurer(workers=(args.cpuworkers or os.cpu_count()) if args.serial else None)
     
     # Check if the specified benchmark exists in the input folder
     if not os.path.isdir(INPUTS_DIRECTORY + "/" + args.benchmark):
         print(f"Benchmark '{args.benchmark}' does not exist!")
         exit()
     
-    # Load regexes and strings from file
-    regexes = load_regexes(args.benchmark, args.startreg, args.endreg)
-    strings = load_strings(args.benchmark, args.reducedstr, args.startstr, args.endstr, args.maxstrlen)
-
     # If the sample size is provided, generate two new array of randomly chosen indexes for the regexes and strings list respectively, and save them to file
     if args.randomsample:
-        generate_random_sample(args.benchmark, regexes, strings, args.randomsample)
+        generate_random_sample(args.benchmark, load_regexes(args.benchmark, args.startreg, args.endreg), load_strings(args.benchmark, args.reducedstr, args.startstr, args.endstr, args.maxstrlen), args.randomsample)
     
-    # If the load sample argument is provided, keep in the regexes and/or strings list only the indexes loaded from file
-    if args.loadregexsample:
-        regexes_sampled_indexes = np.load(INPUTS_DIRECTORY + "/" + args.benchmark + "/rand.regex.index.npy")
-        regexes = [regexes[i] for i in regexes_sampled_indexes]
+    # Load regexes and strings from file
+    regexes, strings = load_inputs(args)
 
-    if args.loadstringsample:
-        strings_sampled_indexes = np.load(INPUTS_DIRECTORY + "/" + args.benchmark + "/rand.input.index.npy")
-        strings = [strings[i] for i in strings_sampled_indexes]
+    file_name = f"{args.benchmark}_"
+    file_name += "rand_" if args.loadregexsample else f"{args.startreg}-{args.endreg}_"
+    file_name += "rand" if args.loadstringsample else f"{args.startstr}-{args.endstr}"
+
+    # Every shard executes a disjoint slice of the pairs and has its own results, merged by merge_shards.py
+    shard = None
+    if args.shard:
+        shard = Shard(*parse_shard(args.shard), regexes, strings)
+        file_name += f"_shard{shard.index}of{shard.count}"
+
+    # All the regexes are matched together, each string is tested once per group of regexes instead of once per regex
+    if args.ruleset:
+        cicero_measurer = CiceroRuleset_measurer(args.arduinoport, regexes, args.format, args.maxstrlen, bytecode_cache=bytecode_cache, bundle=bundle)
+        file_name += "_ruleset"
+    measurer_list = [reference_measurer, cicero_measurer]
+
+    # The pairs are executed in random order until the metrics reach the requested precision
+    sampler = None
+    if args.adaptive:
+        sampler = AdaptiveSampler(len(regexes), strings, args.adaptive, cycles_per_ns=args.freq / 1000, confidence=args.confidence, seed=args.seed)
+        file_name += "_adaptive"
+
+    # The predicted cost of each regex orders the execution and estimates the remaining time, it does not change the results
+    costs = None
+    if cost_model and not sampler:
+        costs = regex_costs(cost_model, regexes, strings, bytecode_cache, args.format)
+
+    # Results are streamed to disk while the benchmark runs, so that an interrupted run can be resumed
+    sink = None
+    if results_sink.pa is not None:
+        sink = ResultsSink(f"{RESULTS_DIRECTORY}/run_{file_name}", regexes, strings, resume=args.resume)
+    elif args.resume:
+        print("pyarrow is needed to resume a run, install it with 'pip install pyarrow'")
+        exit()
+    else:
+        print("WARN: pyarrow is not installed, results will be saved only at the end of the benchmark")
 
     # Calculate the total number of executions to initialize the progress bar
-    total_number_of_executions = len(strings)*len(regexes)*len(measurer_list)
+    total_number_of_executions = (shard.execution_count() if shard else len(strings)*len(regexes))*len(measurer_list)
     progress_bar = tqdm(total=total_number_of_executions)
 
     # Execute the benchmark with the given measurers
-    results = execute_benchmark(measurer_list, progress_bar, regexes, strings, args.format, args.skipException, args.debug)
+    try:
+        results = execute_benchmark(measurer_list, progress_bar, regexes, strings, args.format, args.skipException, args.debug, sink, not args.serial, args.cpuworkers, shard, sampler, costs)
+    finally:
+        if sink is not None:
+            sink.close()
 
-    # Finally, save the results to a CSV file args.loadstringsample
-    file_name = f"{args.benchmark}_"
-    file_name += "rand_" if args.loadregexsample else f"{args.startreg}-{args.endreg}_"
-    file_name += "rand" if args.loadstringsample else f"{args.startstr}-{args.endstr}"
+    # Finally, export the results to a CSV file
     save_results_to_file(results, file_name)
+    if args.resultsdb:
+        database = ResultsDatabase(args.resultsdb)
+        database.ingest(f"{RESULTS_DIRECTORY}/measure_{file_name}.csv", args.benchmark)
+        database.close()
+    if shard:
+        manifest = shard.manifest(regexes, strings, {name: getattr(args, name) for name in INPUT_ARGUMENTS}, *measures_of(measurer_list), f"measure_{file_name}.csv", int(results.present.sum()))
+        write_manifest(f"{RESULTS_DIRECTORY}/measure_{file_name}.shard.json", manifest)
+    if sampler:
+        sampler.export_json(f"{RESULTS_DIRECTORY}/adaptive_{file_name}.json")
+        report = sampler.report()
+        print(f"Adaptive run: {report['pairs_executed']} of {report['pairs_total']} pairs, precision {report['precision']:.4f} (target {report['target_precision']})")
+    if args.ruleset:
+        cicero_measurer.export_json(f"{RESULTS_DIRECTORY}/ruleset_{file_name}.json")
+    if args.instrument:
+        instrumentation.export_json(f"{RESULTS_DIRECTORY}/instrumentation_{file_name}.json")
+        instrumentation.export_csv(f"{RESULTS_DIRECTORY}/instrumentation_{file_name}.csv")
+
+    verifier.close()
+    reference_measurer.close()
+    print("Bytecode cache:", bytecode_cache.stats())
+    print("CICERO regex uploads:", cicero_measurer.stats())
+    print("Golden model verification:", verifier.summary())
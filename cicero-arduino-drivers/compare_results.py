@@ -0,0 +1,307 @@
+from adaptive import TIMEOUT
+from parser_results import MATCH_VALUES
+from results_loader import CHARS, REGEX, read_sections
+
+import argparse
+import glob
+import os.path
+import sys
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import stats
+except ImportError:
+    stats = None
+
+# Measures compared by default, as written by benchmark.py for CICERO
+CYCLES_MEASURE = "CiceroOnArduino_exec[cc]"
+MATCH_MEASURE = "CiceroOnArduino_match[bool]"
+
+# Percentiles of the cycles, the throughput is reported at the same tail, that is at 100 minus them
+PERCENTILES = (50, 90, 99, 100)
+
+# Name of the rows that aggregate all the regexes of a benchmark
+ALL_REGEXES = "*"
+
+class ResultSet:
+    """The cycles and the throughput of every (regex, string) pair of a results file, in compact arrays.
+    Pairs that are not a boolean match with a number of cycles are timeouts or errors: timeouts, with TIMEOUT as match or as cycles,
+    are kept as infinitely slow, errors are dropped."""
+    def __init__(self, path: str, cycles_measure: str=CYCLES_MEASURE, match_measure: str=MATCH_MEASURE, target_freq: int=214) -> None:
+        """Reads a results file.
+
+        :param str path: the path of the results file written by benchmark.py
+        :param str cycles_measure: the measure with the clock cycles, defaults to CYCLES_MEASURE
+        :param str match_measure: the measure with the result of the match, defaults to MATCH_MEASURE
+        :param int target_freq: the frequency of CICERO in MHz to convert clock cycles to ns, defaults to 214
+        :raises Exception: if the measures are not in the file
+        """
+        self.path = path
+        regexes, cycles, chars = [], [], []
+        for frame in read_sections(path):
+            for column in (cycles_measure, match_measure):
+                if column not in frame.columns:
+                    raise Exception("Measure '" + column + "' not found in '" + path + "', the measures are " + str(list(frame.columns[4:])))
+            matches = frame[match_measure]
+            # Older results have a False match and TIMEOUT only as cycles
+            is_timeout = ((matches == TIMEOUT) | (frame[cycles_measure] == TIMEOUT)).to_numpy()
+            is_valid = matches.isin(MATCH_VALUES).to_numpy() & frame[cycles_measure].str.isdecimal().to_numpy() & ~is_timeout
+            keep = is_valid | is_timeout
+
+            chunk_cycles = np.full(len(frame), np.inf)
+            chunk_cycles[is_valid] = frame[cycles_measure][is_valid].astype(np.float64).to_numpy()
+            # Matched strings are counted as half of their characters, as parser_results.py does
+            chunk_chars = frame[CHARS].to_numpy(dtype=np.int64)
+            chunk_chars = np.where(matches.to_numpy() == "True", chunk_chars // 2, chunk_chars)
+
+            regexes.append(frame[REGEX].to_numpy()[keep])
+            cycles.append(chunk_cycles[keep])
+            chars.append(chunk_chars[keep])
+
+        regexes = np.concatenate(regexes) if regexes else np.empty(0, dtype=object)
+        self.regex_names, regex_codes = np.unique(regexes, return_inverse=True) if len(regexes) else (np.empty(0, dtype=object), np.empty(0, dtype=np.int64))
+        # Pairs are sorted by regex, so that the pairs of a regex are a slice
+        order = np.argsort(regex_codes, kind="stable")
+        self.regex_starts = np.searchsorted(regex_codes[order], np.arange(len(self.regex_names) + 1))
+        self.cycles = np.concatenate(cycles)[order] if cycles else np.empty(0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.throughput = (np.concatenate(chars)[order] if chars else np.empty(0)) / (self.cycles * 1000 / target_freq)
+
+    def regex(self, regex: str) -> slice:
+        """Gets the pairs of a regex.
+
+        :param str regex: the regex
+        :return slice: the slice of the arrays with its pairs, empty if the regex has no results
+        """
+        position = int(np.searchsorted(self.regex_names, regex))
+        if position >= len(self.regex_names) or self.regex_names[position] != regex:
+            return slice(0, 0)
+        return slice(self.regex_starts[position], self.regex_starts[position + 1])
+
+def percentiles(cycles: np.ndarray, throughput: np.ndarray) -> dict[str,float]:
+    """Summarizes the tail of a distribution of pairs.
+
+    :param np.ndarray cycles: the cycles of the pairs, inf for timeouts
+    :param np.ndarray throughput: the characters per ns of the pairs, 0 for timeouts
+    :return dict[str,float]: the percentiles of the cycles and the throughput at the same tail, nan without pairs
+    """
+    summary = {}
+    for percentile in PERCENTILES:
+        name = "max" if percentile == 100 else f"p{percentile}"
+        # The inverted CDF never interpolates with inf, so a timeout in the tail makes the percentile inf
+        summary["cycles_" + name] = float(np.percentile(cycles, percentile, method="inverted_cdf")) if len(cycles) else np.nan
+        tail = "min" if percentile == 100 else f"p{100 - percentile}"
+        summary["thr_" + tail] = float(np.percentile(throughput, 100 - percentile, method="inverted_cdf")) if len(throughput) else np.nan
+    return summary
+
+def relative_change(candidate: float, baseline: float) -> float:
+    """Computes how much slower the candidate is than the baseline, handling timeouts.
+
+    :param float candidate: a statistic of the candidate
+    :param float baseline: the same statistic of the baseline
+    :return float: the relative increase, inf if only the candidate timed out, nan if it can't be computed
+    """
+    if np.isinf(candidate) and np.isinf(baseline):
+        return 0.0
+    if baseline == 0 or np.isnan(candidate) or np.isnan(baseline):
+        return np.nan
+    return candidate / baseline - 1
+
+def mann_whitney_pvalue(baseline: np.ndarray, candidate: np.ndarray, threshold: float) -> float:
+    """Tests if the candidate is slower than the baseline slowed down by the threshold, with the one-sided Mann-Whitney U test.
+
+    :param np.ndarray baseline: the cycles of the baseline
+    :param np.ndarray candidate: the cycles of the candidate
+    :param float threshold: the relative slowdown that is tolerated
+    :return float: the p-value
+    """
+    return float(stats.mannwhitneyu(candidate, baseline * (1 + threshold), alternative="greater", method="asymptotic").pvalue)
+
+def bootstrap_pvalue(baseline: np.ndarray, candidate: np.ndarray, threshold: float, percentile: float, resamples: int, rng: np.random.Generator, max_cells: int=10000000) -> float:
+    """Tests if a percentile of the candidate is larger than the same percentile of the baseline slowed down by the threshold,
+    resampling both with replacement. The log ratio of the resampled percentiles is approximately normal, so the p-value
+    is not limited by the number of resamples; with timeouts in the tail the ratio can be infinite and the p-value is
+    the fraction of resamples where the candidate is not slower.
+
+    :param np.ndarray baseline: the cycles of the baseline
+    :param np.ndarray candidate: the cycles of the candidate
+    :param float threshold: the relative slowdown that is tolerated
+    :param float percentile: the percentile that is compared
+    :param int resamples: the number of bootstrap resamples
+    :param np.random.Generator rng: the source of the resamples
+    :param int max_cells: the largest matrix of resampled values kept in memory, defaults to 10000000
+    :return float: the p-value
+    """
+    log_ratios = []
+    block = max(1, max_cells // max(len(baseline), len(candidate)))
+    for start in range(0, resamples, block):
+        size = min(block, resamples - start)
+        baseline_percentiles = np.percentile(baseline[rng.integers(0, len(baseline), (size, len(baseline)))], percentile, axis=1, method="inverted_cdf")
+        candidate_percentiles = np.percentile(candidate[rng.integers(0, len(candidate), (size, len(candidate)))], percentile, axis=1, method="inverted_cdf")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.log(candidate_percentiles) - np.log(baseline_percentiles)
+        # Both percentiles are timeouts: the candidate is not slower
+        log_ratios.append(np.where(np.isinf(candidate_percentiles) & np.isinf(baseline_percentiles), 0.0, ratios))
+    log_ratios = np.concatenate(log_ratios) - np.log1p(threshold)
+
+    finite = np.isfinite(log_ratios)
+    if not finite.all() or len(log_ratios) < 2:
+        # The observed samples count as a resample, so that the p-value is never 0
+        return (int(np.count_nonzero(~(log_ratios > 0))) + 1) / (len(log_ratios) + 1)
+    deviation = float(log_ratios.std(ddof=1))
+    if deviation == 0:
+        return 0.0 if log_ratios[0] > 0 else 1.0
+    return 1 - NormalDist().cdf(float(log_ratios.mean()) / deviation)
+
+def holm(pvalues: np.ndarray) -> np.ndarray:
+    """Adjusts p-values for multiple comparisons with the Holm-Bonferroni method.
+
+    :param np.ndarray pvalues: the p-values, nan for comparisons that were not tested
+    :return np.ndarray: the adjusted p-values
+    """
+    adjusted = np.full(len(pvalues), np.nan)
+    tested = np.flatnonzero(~np.isnan(pvalues))
+    order = tested[np.argsort(pvalues[tested], kind="stable")]
+    steps = np.maximum.accumulate((len(order) - np.arange(len(order))) * pvalues[order]) if len(order) else order
+    adjusted[order] = np.minimum(steps, 1.0)
+    return adjusted
+
+def compare(name: str, baseline: ResultSet, candidate: ResultSet, threshold: float, percentile: float, test: str, resamples: int, min_pairs: int, rng: np.random.Generator, per_regex: bool=True) -> list[dict]:
+    """Compares the results of a benchmark, as a whole and for each regex.
+
+    :param str name: the name of the benchmark
+    :param ResultSet baseline: the reference results
+    :param ResultSet candidate: the results to check
+    :param float threshold: the relative slowdown that is tolerated
+    :param float percentile: the percentile of the cycles that is compared
+    :param str test: the significance test, "mannwhitney" or "bootstrap"
+    :param int resamples: the number of bootstrap resamples
+    :param int min_pairs: the pairs that both results need for a comparison to be tested
+    :param np.random.Generator rng: the source of the bootstrap resamples
+    :param bool per_regex: if each regex is compared too, defaults to True
+    :return list[dict]: a row for the whole benchmark followed by a row for each regex
+    """
+    groups = [(ALL_REGEXES, slice(None), slice(None))]
+    if per_regex:
+        regexes = np.union1d(baseline.regex_names, candidate.regex_names)
+        groups += [(regex, baseline.regex(regex), candidate.regex(regex)) for regex in regexes]
+
+    rows = []
+    for regex, baseline_pairs, candidate_pairs in groups:
+        baseline_cycles, candidate_cycles = baseline.cycles[baseline_pairs], candidate.cycles[candidate_pairs]
+        row = {"benchmark": name, "regex": regex, "pairs_baseline": len(baseline_cycles), "pairs_candidate": len(candidate_cycles),
+               "timeouts_baseline": int(np.isinf(baseline_cycles).sum()), "timeouts_candidate": int(np.isinf(candidate_cycles).sum())}
+        baseline_summary = percentiles(baseline_cycles, baseline.throughput[baseline_pairs])
+        candidate_summary = percentiles(candidate_cycles, candidate.throughput[candidate_pairs])
+        for key in baseline_summary:
+            row[key + "_baseline"] = baseline_summary[key]
+            row[key + "_candidate"] = candidate_summary[key]
+
+        row["slowdown"] = np.nan
+        row["pvalue"] = np.nan
+        if min(len(baseline_cycles), len(candidate_cycles)) >= min_pairs:
+            row["slowdown"] = relative_change(float(np.percentile(candidate_cycles, percentile, method="inverted_cdf")), float(np.percentile(baseline_cycles, percentile, method="inverted_cdf")))
+            if test == "mannwhitney":
+                row["pvalue"] = mann_whitney_pvalue(baseline_cycles, candidate_cycles, threshold)
+            else:
+                row["pvalue"] = bootstrap_pvalue(baseline_cycles, candidate_cycles, threshold, percentile, resamples, rng)
+        rows.append(row)
+    return rows
+
+def results_files(path: str) -> dict[str,str]:
+    """Finds the results files of a result set.
+
+    :param str path: a results file or a directory with the results files of many benchmarks (measure_<name>.csv)
+    :raises Exception: if no results file is found
+    :return dict[str,str]: the path of each results file, by the name of its benchmark
+    """
+    paths = sorted(glob.glob(os.path.join(glob.escape(path), "measure_*.csv"))) if os.path.isdir(path) else [path]
+    if not paths:
+        raise Exception("No results file found in '" + path + "'")
+    names = {}
+    for file_path in paths:
+        name = os.path.basename(file_path)
+        name = name[len("measure_"):] if name.startswith("measure_") else name
+        names[os.path.splitext(name)[0]] = file_path
+    return names
+
+def compare_result_sets(baseline_path: str, candidate_path: str, threshold: float=0.05, alpha: float=0.01, percentile: float=90, test: str=None, resamples: int=1000,
+                        min_pairs: int=20, per_regex: bool=True, cycles_measure: str=CYCLES_MEASURE, match_measure: str=MATCH_MEASURE, target_freq: int=214, seed: int=None) -> pd.DataFrame:
+    """Compares two result sets, benchmark by benchmark, and finds the statistically significant slowdowns.
+
+    :param str baseline_path: the reference results file, or directory of results files
+    :param str candidate_path: the results file, or directory of results files, to check
+    :param float threshold: the relative slowdown that is tolerated, defaults to 0.05
+    :param float alpha: the significance level, after the Holm-Bonferroni correction over all the tests, defaults to 0.01
+    :param float percentile: the percentile of the cycles that is compared, defaults to 90
+    :param str test: "mannwhitney" (needs scipy) or "bootstrap", None for Mann-Whitney if scipy is installed, defaults to None
+    :param int resamples: the number of bootstrap resamples, defaults to 1000
+    :param int min_pairs: the pairs that both results need for a comparison to be tested, defaults to 20
+    :param bool per_regex: if each regex is compared too, defaults to True
+    :param str cycles_measure: the measure with the clock cycles, defaults to CYCLES_MEASURE
+    :param str match_measure: the measure with the result of the match, defaults to MATCH_MEASURE
+    :param int target_freq: the frequency of CICERO in MHz to convert clock cycles to ns, defaults to 214
+    :param int seed: the seed of the bootstrap resamples, defaults to None
+    :raises Exception: if the Mann-Whitney test is requested without scipy or the result sets have no benchmark in common
+    :return pd.DataFrame: a row for each benchmark and each regex, with the percentiles, the slowdown, the p-value and if it is a regression
+    """
+    if test is None:
+        test = "mannwhitney" if stats is not None else "bootstrap"
+    if test == "mannwhitney" and stats is None:
+        raise Exception("scipy is needed for the Mann-Whitney test, install it with 'pip install scipy' or use the bootstrap test")
+
+    baseline_files, candidate_files = results_files(baseline_path), results_files(candidate_path)
+    if len(baseline_files) == 1 and len(candidate_files) == 1:
+        # Two files are compared even if their names are different
+        candidate_files = dict(zip(baseline_files, candidate_files.values()))
+    names = [name for name in baseline_files if name in candidate_files]
+    if not names:
+        raise Exception("No benchmark in common between '" + baseline_path + "' and '" + candidate_path + "'")
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name in names:
+        baseline = ResultSet(baseline_files[name], cycles_measure, match_measure, target_freq)
+        candidate = ResultSet(candidate_files[name], cycles_measure, match_measure, target_freq)
+        rows += compare(name, baseline, candidate, threshold, percentile, test, resamples, min_pairs, rng, per_regex)
+
+    report = pd.DataFrame(rows)
+    report["pvalue_adjusted"] = holm(report["pvalue"].to_numpy(dtype=np.float64))
+    report["regression"] = (report["slowdown"] > threshold) & (report["pvalue_adjusted"] < alpha)
+    return report
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='compare the tail latency of two result sets and fail on significant slowdowns')
+    arg_parser.add_argument('baseline',           type=str,  help='reference results file, or directory of results files')
+    arg_parser.add_argument('candidate',          type=str,  help='results file, or directory of results files, to check')
+    arg_parser.add_argument('-threshold',         type=float, help='relative slowdown that is tolerated',                                              default=0.05)
+    arg_parser.add_argument('-alpha',             type=float, help='significance level, after correcting for the number of tests',                     default=0.01)
+    arg_parser.add_argument('-percentile',        type=float, help='percentile of the cycles that is compared',                                        default=90)
+    arg_parser.add_argument('-test',              type=str,  help='significance test, defaults to mannwhitney if scipy is installed', choices=['mannwhitney', 'bootstrap'], default=None)
+    arg_parser.add_argument('-resamples',         type=int,  help='resamples of the bootstrap test',                                                   default=1000)
+    arg_parser.add_argument('-minpairs',          type=int,  help='pairs needed in both result sets to test a comparison',                             default=20)
+    arg_parser.add_argument('-benchmarkonly',                help='compare only whole benchmarks, not each regex',              action='store_true',  default=False)
+    arg_parser.add_argument('-cycles',            type=str,  help='measure with the clock cycles',                                                     default=CYCLES_MEASURE)
+    arg_parser.add_argument('-match',             type=str,  help='measure with the result of the match',                                              default=MATCH_MEASURE)
+    arg_parser.add_argument('-freq',              type=int,  help='CICERO frequency in MHz, to convert clock cycles to ns',                            default=214)
+    arg_parser.add_argument('-seed',              type=int,  help='seed of the bootstrap resamples',                                                   default=None)
+    arg_parser.add_argument('-output',            type=str,  help='CSV file where the full report is written',                                         default=None)
+
+    args = arg_parser.parse_args()
+
+    report = compare_result_sets(args.baseline, args.candidate, args.threshold, args.alpha, args.percentile, args.test, args.resamples, args.minpairs,
+                                 not args.benchmarkonly, args.cycles, args.match, args.freq, args.seed)
+    if args.output is not None:
+        report.to_csv(args.output, index=False)
+
+    columns = ["benchmark", "regex", "cycles_p50_baseline", "cycles_p50_candidate", "cycles_p99_baseline", "cycles_p99_candidate",
+               "cycles_max_baseline", "cycles_max_candidate", "timeouts_baseline", "timeouts_candidate", "slowdown", "pvalue_adjusted"]
+    with pd.option_context("display.width", None, "display.max_columns", None, "display.max_colwidth", 40):
+        print(report[report["regex"] == ALL_REGEXES][columns].to_string(index=False))
+        regressions = report[report["regression"]]
+        if len(regressions):
+            print(f"\n{len(regressions)} significant slowdowns beyond {args.threshold:.1%} at p{args.percentile:g}:")
+            print(regressions[columns].to_string(index=False))
+    sys.exit(1 if report["regression"].any() else 0)
@@ -0,0 +1,298 @@
+from CiceroSerial.bytecode_cache import BytecodeCache, DEFAULT_CACHE_DIR
+from CiceroSerial.driver import compile_regex
+from CiceroSerial.isa import Opcode, decode_bytecode
+
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Measure with the clock cycles of CICERO in the results files
+CYCLES_MEASURE = "CiceroOnArduino_exec[cc]"
+
+# Features of a (regex, string) pair: the instructions of the program matter once for every character of the string
+FEATURE_NAMES = (
+    "bias",
+    "string_length",
+    "length_x_instructions",
+    "length_x_splits",
+    "length_x_closures",
+    "length_x_alternations",
+    "length_x_match_any",
+    "length_x_not_match",
+    "instructions",
+)
+
+# Budgets are this many times the predicted cycles, but never less than the minimum
+BUDGET_FACTOR = 8.0
+MIN_BUDGET_CYCLES = 10000
+
+def regex_features(code: bytes) -> dict[str,int]:
+    """Extracts the features of a compiled regex from its bytecode.
+    Splits and jumps to a previous instruction are closures (loops), splits to a following instruction are alternations.
+
+    :param bytes code: the bytecode
+    :return dict[str,int]: the number of instructions, splits, closures, alternations and instructions that match any or a negated character
+    """
+    instructions = decode_bytecode(code)
+    features = dict.fromkeys(("instructions", "splits", "closures", "alternations", "match_any", "not_match"), 0)
+    features["instructions"] = len(instructions)
+    for address, (opcode, data) in enumerate(instructions):
+        if opcode == Opcode.SPLIT:
+            features["splits"] += 1
+            features["closures" if data <= address else "alternations"] += 1
+        elif opcode == Opcode.JMP and data <= address:
+            features["closures"] += 1
+        elif opcode == Opcode.MATCH_ANY:
+            features["match_any"] += 1
+        elif opcode == Opcode.NOT_MATCH:
+            features["not_match"] += 1
+    return features
+
+def pair_features(features: dict[str,int], string_lengths: np.ndarray) -> np.ndarray:
+    """Combines the features of a regex with the length of the strings.
+
+    :param dict[str,int] features: the features of the regex (see regex_features())
+    :param np.ndarray string_lengths: the length in bytes of each string
+    :return np.ndarray: the features of each pair, shaped [strings, FEATURE_NAMES]
+    """
+    lengths = np.asarray(string_lengths, dtype=np.float64)
+    return np.column_stack((
+        np.ones_like(lengths),
+        lengths,
+        lengths * features["instructions"],
+        lengths * features["splits"],
+        lengths * features["closures"],
+        lengths * features["alternations"],
+        lengths * features["match_any"],
+        lengths * features["not_match"],
+        np.full_like(lengths, features["instructions"]),
+    ))
+
+class CostModel:
+    """Linear model of the clock cycles that CICERO needs to execute a regex on a string, from the features of the bytecode
+    and the length of the string. It is fit on the results of previous runs, minimizing the relative error of the predictions."""
+    def __init__(self, coefficients: list[float], regex_format: str="pcre", stats: dict=None) -> None:
+        """Creates a model.
+
+        :param list[float] coefficients: the coefficient of each feature in FEATURE_NAMES
+        :param str regex_format: the format of the regexes the model was fit on, defaults to "pcre"
+        :param dict stats: statistics of the fit, defaults to None
+        """
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.regex_format = regex_format
+        self.stats = stats or {}
+
+    @classmethod
+    def fit(cls, codes: list[bytes], string_lengths: list[np.ndarray], cycles: list[np.ndarray], regex_format: str="pcre") -> "CostModel":
+        """Fits a model on measured executions.
+
+        :param list[bytes] codes: the bytecode of each regex
+        :param list[np.ndarray] string_lengths: for each regex, the length of the strings it was executed on
+        :param list[np.ndarray] cycles: for each regex, the measured cycles on each string
+        :param str regex_format: the format of the regexes, defaults to "pcre"
+        :raises Exception: if there are no measures
+        :return CostModel: the model
+        """
+        features = [pair_features(regex_features(code), lengths) for code, lengths in zip(codes, string_lengths)]
+        if not features or sum(len(f) for f in features) == 0:
+            raise Exception("No measures of " + CYCLES_MEASURE + " to fit the cost model on")
+        x = np.concatenate(features)
+        y = np.concatenate([np.asarray(c, dtype=np.float64) for c in cycles])
+
+        # Dividing by the measure minimizes the relative error, so that short executions count as much as long ones
+        weights = 1 / np.maximum(y, 1)
+        coefficients, *_ = np.linalg.lstsq(x * weights[:, None], y * weights, rcond=None)
+
+        relative_error = np.abs(np.maximum(x @ coefficients, 1) - y) * weights
+        stats = {
+            "pairs": int(len(y)),
+            "regexes": len(codes),
+            "median_relative_error": float(np.median(relative_error)),
+            "p90_relative_error": float(np.percentile(relative_error, 90)),
+        }
+        return cls(coefficients, regex_format, stats)
+
+    def predict(self, code: bytes, string_lengths: np.ndarray) -> np.ndarray:
+        """Predicts the cycles of the executions of a regex.
+
+        :param bytes code: the bytecode of the regex
+        :param np.ndarray string_lengths: the length of each string
+        :return np.ndarray: the predicted cycles on each string, at least 1
+        """
+        return np.maximum(pair_features(regex_features(code), string_lengths) @ self.coefficients, 1)
+
+    def regex_cost(self, code: bytes, strings_num: int, total_length: int) -> float:
+        """Predicts the total cycles of a regex on a set of strings, the model being linear in the length of the strings.
+
+        :param bytes code: the bytecode of the regex
+        :param int strings_num: the number of strings
+        :param int total_length: the sum of the length of the strings
+        :return float: the predicted cycles, at least 1 for each string
+        """
+        per_string, per_char = pair_features(regex_features(code), [0, 1]) @ self.coefficients
+        return max(float(strings_num * per_string + total_length * (per_char - per_string)), float(strings_num))
+
+    def budgets(self, code: bytes, string_lengths: np.ndarray, factor: float=BUDGET_FACTOR, min_cycles: int=MIN_BUDGET_CYCLES) -> np.ndarray:
+        """Gets the cycles after which the execution of a regex can be considered runaway.
+
+        :param bytes code: the bytecode of the regex
+        :param np.ndarray string_lengths: the length of each string
+        :param float factor: how many times the prediction an execution may last, defaults to BUDGET_FACTOR
+        :param int min_cycles: the min budget, defaults to MIN_BUDGET_CYCLES
+        :return np.ndarray: the budget of each string, as int64
+        """
+        return np.maximum(np.ceil(self.predict(code, string_lengths) * factor), min_cycles).astype(np.int64)
+
+    def save(self, path: str) -> None:
+        """Writes the model to a JSON file.
+
+        :param str path: the path of the file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"features": list(FEATURE_NAMES), "coefficients": self.coefficients.tolist(), "regex_format": self.regex_format, "stats": self.stats}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "CostModel":
+        """Reads a model from a JSON file.
+
+        :param str path: the path of the file
+        :raises Exception: if the model uses different features
+        :return CostModel: the model
+        """
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data["features"] != list(FEATURE_NAMES):
+            raise Exception("The cost model in '" + path + "' was fit with different features")
+        return cls(data["coefficients"], data["regex_format"], data.get("stats"))
+
+def read_cycles(path: str) -> dict[str,tuple[list[int],list[int]]]:
+    """Reads the measured cycles from a results file written by benchmark.py.
+
+    :param str path: the path of the file
+    :return dict[str,tuple[list[int],list[int]]]: for each regex, the length of the strings and the cycles measured on them
+    """
+    measures = {}
+    string_length = None
+    column = None
+    with open(path, 'r', newline='') as csvfile:
+        rows = csv.reader(csvfile, delimiter=',')
+        for row in rows:
+            if len(row) == 4 and row[0] == 'string: ':
+                # Strings are written as the text of a bytestring
+                string_length = len(ast.literal_eval(row[1]))
+                headers = next(rows, [])
+                column = headers.index(CYCLES_MEASURE) if CYCLES_MEASURE in headers else None
+                continue
+            if column is None or string_length is None or len(row) <= column or not row[column].isdecimal():
+                # Missing measures, as errors and timeouts, are not used
+                continue
+            lengths, cycles = measures.setdefault(row[0], ([], []))
+            lengths.append(string_length)
+            cycles.append(int(row[column]))
+    return measures
+
+def _add_compiler_path(cicero_compiler_path: str) -> None:
+    if cicero_compiler_path not in sys.path:
+        sys.path.append(cicero_compiler_path)
+
+def fit_from_results(paths: list[str], bytecode_cache: BytecodeCache, regex_format: str="pcre", cicero_compiler_path: str="../cicero_compiler") -> CostModel:
+    """Fits a model on the results of previous runs.
+
+    :param list[str] paths: the results files
+    :param BytecodeCache bytecode_cache: the cache of the compiled regexes
+    :param str regex_format: the format of the regexes, defaults to "pcre"
+    :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler, defaults to "../cicero_compiler"
+    :return CostModel: the model
+    """
+    _add_compiler_path(cicero_compiler_path)
+
+    measures = {}
+    for path in paths:
+        for regex, (lengths, cycles) in read_cycles(path).items():
+            all_lengths, all_cycles = measures.setdefault(regex, ([], []))
+            all_lengths += lengths
+            all_cycles += cycles
+
+    codes, lengths, cycles = [], [], []
+    for regex, (regex_lengths, regex_cycles) in measures.items():
+        try:
+            codes.append(compile_regex(regex, bytecode_cache, regex_format))
+        except Exception as exc:
+            print("WARN: skipping regex", regex, "that can't be compiled:", exc)
+            continue
+        lengths.append(np.array(regex_lengths))
+        cycles.append(np.array(regex_cycles))
+    return CostModel.fit(codes, lengths, cycles, regex_format)
+
+def regex_costs(model: CostModel, regexes: list[str], strings: list[bytes], bytecode_cache: BytecodeCache, regex_format: str="pcre", cicero_compiler_path: str="../cicero_compiler") -> np.ndarray:
+    """Predicts the cycles that each regex needs to be tested on all the strings.
+
+    :param CostModel model: the model
+    :param list[str] regexes: the regexes
+    :param list[bytes] strings: the strings
+    :param BytecodeCache bytecode_cache: the cache of the compiled regexes
+    :param str regex_format: the format of the regexes, defaults to "pcre"
+    :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler, defaults to "../cicero_compiler"
+    :return np.ndarray: the cost of each regex, 0 for the regexes that can't be compiled as they fail right away
+    """
+    _add_compiler_path(cicero_compiler_path)
+    if model.regex_format != regex_format:
+        print("WARN: the cost model was fit on", model.regex_format, "regexes, not", regex_format)
+
+    total_length = sum(len(string) for string in strings)
+    costs = np.zeros(len(regexes), dtype=np.float64)
+    for regex_index, regex in enumerate(regexes):
+        try:
+            code = compile_regex(regex, bytecode_cache, regex_format)
+        except Exception:
+            continue
+        costs[regex_index] = model.regex_cost(code, len(strings), total_length)
+    return costs
+
+class CostEta:
+    """Estimates the remaining time of a run from the predicted cost of the work still to do,
+    which is more accurate than counting executions when some regexes are much slower than others."""
+    def __init__(self, total_cost: float) -> None:
+        """Starts the estimate.
+
+        :param float total_cost: the predicted cost of the whole run
+        """
+        self.total_cost = total_cost
+        self.done_cost = 0.0
+        self.start = time.monotonic()
+
+    def done(self, cost: float) -> None:
+        """Records completed work.
+
+        :param float cost: the predicted cost of the work
+        """
+        self.done_cost += cost
+
+    def remaining_seconds(self) -> float|None:
+        """Gets the estimated time to complete the run.
+
+        :return float|None: the seconds, None if nothing has been completed yet
+        """
+        if self.done_cost <= 0:
+            return None
+        elapsed = time.monotonic() - self.start
+        return elapsed * max(self.total_cost - self.done_cost, 0) / self.done_cost
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='fit the model of the clock cycles of CICERO on the results of previous runs')
+    arg_parser.add_argument('results',            type=str,  help='results files written by benchmark.py', nargs='+')
+    arg_parser.add_argument('-output',            type=str,  help='path of the model',                                                                  default='results/cost_model.json')
+    arg_parser.add_argument('-format',            type=str,  help='regex input format',                                                                 default='pcre')
+    arg_parser.add_argument('-bytecodecache',     type=str,  help='directory of the persistent cache of compiled regexes',                              default=DEFAULT_CACHE_DIR)
+
+    args = arg_parser.parse_args()
+
+    model = fit_from_results(args.results, BytecodeCache(args.bytecodecache), args.format)
+    model.save(args.output)
+    print("Cost model written to", args.output, model.stats)
@@ -1,16 +1,23 @@
 #!/bin/bash
 arduinoport=/dev/ttyACM0
+shard=
 declare -a BenchmarksArray=("poweren" "poweren4" "brill" "brill4" "snort" "snort4" "protomata" "protomata4")
-while getopts p:a: flag
+while getopts p:a:s: flag
 do
     case "${flag}" in
         p) arduinoport=${OPTARG};;
+        s) shard=${OPTARG};;
     esac
 done
 echo "ARDUINO PORT: $arduinoport"
 
 for val in ${BenchmarksArray[@]}; do
     echo "BENCHMARK: $val"
+    if [ -n "$shard" ]; then
+        # Each host runs a different shard, results are aggregated after merging them with merge_shards.py -name ${val}_rand_0-None
+        python3.10 benchmark.py -benchmark=$val -format=pcre -loadregexsample -reducedstr -skipException -arduinoport=$arduinoport -shard=$shard
+        continue
+    fi
     python3.10 benchmark.py -benchmark=$val -format=pcre -loadregexsample -reducedstr -skipException -arduinoport=$arduinoport
     python parser_results.py -irf ./results/measure_${val}_rand_0-None.csv -gv 1 -orf ./results_aggr/${val}_output_comp_data_1MB_1000_0.csv -copro -freq 48
 done
\ No newline at end of file
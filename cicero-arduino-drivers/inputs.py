@@ -0,0 +1,230 @@
+import hashlib
+import locale
+import mmap
+import os
+from collections.abc import Sequence
+
+import numpy as np
+
+# Default location of the cached indexes, can be overridden with the CICERO_INPUT_INDEX_CACHE environment variable
+DEFAULT_INDEX_CACHE_DIR = os.environ.get("CICERO_INPUT_INDEX_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "cicero-input-index"))
+
+# Bytes of the file scanned at a time when looking for the end of the lines, so that memory does not depend on the size of the file
+SCAN_BLOCK_SIZE = 64 * 1024 * 1024
+
+# Each entry of an index is the position and the length in bytes of an item of the file
+INDEX_DTYPE = np.dtype([("start", "<i8"), ("length", "<i8")])
+
+def _map_file(path: str) -> mmap.mmap|bytes:
+    """Memory-maps a file in read-only mode.
+
+    :param str path: the path of the file
+    :return mmap.mmap|bytes: the mapped file, empty bytes if the file is empty (it can't be mapped)
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _line_bounds(mapped: mmap.mmap|bytes) -> tuple[np.ndarray,np.ndarray]:
+    """Finds the lines of a file, like bytes.split(b'\\n') does.
+
+    :param mmap.mmap|bytes mapped: the content of the file
+    :return tuple[np.ndarray,np.ndarray]: the position of the first byte of each line and the position of its end (the newline or the end of the file)
+    """
+    size = len(mapped)
+    newlines = []
+    for position in range(0, size, SCAN_BLOCK_SIZE):
+        block = np.frombuffer(mapped, dtype=np.uint8, count=min(SCAN_BLOCK_SIZE, size - position), offset=position)
+        newlines.append(np.flatnonzero(block == ord('\n')) + position)
+    newlines = np.concatenate(newlines) if newlines else np.empty(0, dtype=np.int64)
+
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, size)
+    return starts, ends
+
+def _cached_index(path: str, kind: str, build: callable, cache_dir: str|None) -> np.ndarray:
+    """Gets the index of a file from the cache, building it if the file changed since it was cached.
+
+    :param str path: the path of the file
+    :param str kind: what the index contains, with the parameters used to build it
+    :param callable build: function that builds the index
+    :param str|None cache_dir: the directory of the cache, None to always build the index
+    :return np.ndarray: the index, memory-mapped if it comes from the cache
+    """
+    if cache_dir is None:
+        return build()
+
+    stat = os.stat(path)
+    key = "\0".join((os.path.abspath(path), str(stat.st_size), str(stat.st_mtime_ns), kind))
+    cache_path = os.path.join(cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".npy")
+    if os.path.exists(cache_path):
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError):
+            # Corrupted file, it will be overwritten
+            pass
+
+    index = build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, index)
+        os.replace(tmp_path, cache_path)
+    except OSError as exc:
+        print("WARN: could not cache the index of", path, ":", exc)
+    return index
+
+class IndexedInput(Sequence):
+    """Lazy sequence of the items of a memory-mapped file, described by an index of their positions.
+    Slicing or indexing with an array of indexes returns a new sequence on the same file without reading it,
+    the bytes of an item are read only when the item is accessed.
+    When it is pickled, to be sent to another process, only the path and the index are copied and the file is mapped again."""
+    def __init__(self, path: str, mapped: mmap.mmap|bytes, index: np.ndarray) -> None:
+        """Creates a new sequence.
+
+        :param str path: the path of the file
+        :param mmap.mmap|bytes mapped: the content of the file
+        :param np.ndarray index: the position and the length of each item, with dtype INDEX_DTYPE
+        """
+        self.path = path
+        self._mapped = mapped
+        self.index = index
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_mapped"]
+        # A memory-mapped index would be pickled as a copy anyway
+        state["index"] = np.asarray(state["index"])
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._mapped = _map_file(self.path)
+
+    def _view(self, index: np.ndarray) -> "IndexedInput":
+        return IndexedInput(self.path, self._mapped, index)
+
+    def _item(self, position: int) -> bytes:
+        start, length = self.index[position]
+        return self._mapped[start:start + length]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, key: int|slice|np.ndarray|list[int]) -> "bytes|str|IndexedInput":
+        if isinstance(key, (slice, np.ndarray, list)):
+            return self._view(self.index[key])
+        return self._item(key)
+
+    def __iter__(self):
+        for position in range(len(self.index)):
+            yield self._item(position)
+
+class IndexedStrings(IndexedInput):
+    """The strings of a benchmark input: every line without its last byte, split into chunks of at most 'max_length' bytes.
+    Empty lines have no chunks."""
+    def _view(self, index: np.ndarray) -> "IndexedStrings":
+        return IndexedStrings(self.path, self._mapped, index)
+
+class IndexedRegexes(IndexedInput):
+    """The regexes of a benchmark: every line of the file decoded as text, without the end of line.
+    Like readlines(), a file that ends with a newline has no empty last line, and the last character of a last line that does
+    not end with a newline is dropped."""
+    def __init__(self, path: str, mapped: mmap.mmap|bytes, index: np.ndarray, chop: np.ndarray, encoding: str) -> None:
+        """Creates a new sequence.
+
+        :param str path: the path of the file
+        :param mmap.mmap|bytes mapped: the content of the file
+        :param np.ndarray index: the position and the length of each line, without the end of line
+        :param np.ndarray chop: for each line, if its last character must be dropped
+        :param str encoding: the encoding of the file
+        """
+        super().__init__(path, mapped, index)
+        self.chop = chop
+        self.encoding = encoding
+
+    def __getitem__(self, key: int|slice|np.ndarray|list[int]) -> "str|IndexedRegexes":
+        if isinstance(key, (slice, np.ndarray, list)):
+            return IndexedRegexes(self.path, self._mapped, self.index[key], self.chop[key], self.encoding)
+        return self._item(key)
+
+    def _item(self, position: int) -> str:
+        regex = super()._item(position).decode(self.encoding)
+        return regex[:-1] if self.chop[position] else regex
+
+def take(items: list|IndexedInput, indexes: np.ndarray) -> list|IndexedInput:
+    """Selects some items of a list or of a lazy sequence, without reading them if the sequence is lazy.
+
+    :param list|IndexedInput items: the items
+    :param np.ndarray indexes: the indexes of the items to select
+    :return list|IndexedInput: the selected items
+    """
+    if isinstance(items, IndexedInput):
+        return items[np.asarray(indexes)]
+    return [items[i] for i in indexes]
+
+def open_strings(path: str, max_length: int, cache_dir: str|None=DEFAULT_INDEX_CACHE_DIR) -> IndexedStrings:
+    """Opens a file of strings, with the same content as splitting it on b'\\n', removing the last byte of every line
+    and splitting every line in chunks of 'max_length' bytes.
+
+    :param str path: the path of the file
+    :param int max_length: the max length of the strings, longer lines are split into chunks
+    :param str|None cache_dir: the directory where the index is cached, None to disable the cache, defaults to DEFAULT_INDEX_CACHE_DIR
+    :return IndexedStrings: the lazy sequence of the strings
+    """
+    mapped = _map_file(path)
+
+    def build() -> np.ndarray:
+        starts, ends = _line_bounds(mapped)
+        # The last byte of every line is removed
+        lengths = np.maximum(ends - starts - 1, 0)
+        chunks_per_line = -(-lengths // max_length)
+
+        line_of_chunk = np.repeat(np.arange(len(starts)), chunks_per_line)
+        # Position of every chunk inside its line
+        first_chunk = np.cumsum(chunks_per_line) - chunks_per_line
+        offsets = (np.arange(len(line_of_chunk)) - first_chunk[line_of_chunk]) * max_length
+
+        index = np.empty(len(line_of_chunk), dtype=INDEX_DTYPE)
+        index["start"] = starts[line_of_chunk] + offsets
+        index["length"] = np.minimum(max_length, lengths[line_of_chunk] - offsets)
+        return index
+
+    return IndexedStrings(path, mapped, _cached_index(path, "strings:" + str(max_length), build, cache_dir))
+
+def open_regexes(path: str, cache_dir: str|None=DEFAULT_INDEX_CACHE_DIR, encoding: str=None) -> IndexedRegexes:
+    """Opens a file of regexes, one for each line, with the same content as readlines() removing the last character of every line.
+
+    :param str path: the path of the file
+    :param str|None cache_dir: the directory where the index is cached, None to disable the cache, defaults to DEFAULT_INDEX_CACHE_DIR
+    :param str encoding: the encoding of the file, defaults to the one used by open()
+    :return IndexedRegexes: the lazy sequence of the regexes
+    """
+    mapped = _map_file(path)
+
+    def build() -> np.ndarray:
+        starts, ends = _line_bounds(mapped)
+        # readlines() does not return an empty line after the last newline
+        if len(starts) > 0 and starts[-1] == len(mapped):
+            starts, ends = starts[:-1], ends[:-1]
+
+        # Text mode translates '\r\n' into '\n'
+        lengths = ends - starts
+        if len(mapped) > 0:
+            carriage_return = np.frombuffer(mapped, dtype=np.uint8)[np.maximum(ends - 1, 0)] == ord('\r')
+            lengths = lengths - ((lengths > 0) & carriage_return & (ends < len(mapped)))
+
+        index = np.empty(len(starts), dtype=INDEX_DTYPE)
+        index["start"] = starts
+        index["length"] = lengths
+        return index
+
+    index = _cached_index(path, "regexes", build, cache_dir)
+    # Only a last line without newline has no end of line to remove, so its last character is removed
+    chop = np.zeros(len(index), dtype=np.bool_)
+    if len(index) > 0 and index[-1]["start"] + index[-1]["length"] == len(mapped):
+        chop[-1] = True
+
+    return IndexedRegexes(path, mapped, index, chop, encoding or locale.getpreferredencoding(False))
@@ -1,14 +1,32 @@
-from CiceroSerial.driver import CiceroOnArduino
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from CiceroSerial.driver import CiceroOnArduino, compile_regex
+from CiceroSerial.bundle import Bundle
+from CiceroSerial.bytecode_cache import BytecodeCache, find_compiler_version
+from CiceroSerial.instrumentation import PhaseRecorder
+from CiceroSerial.pool import CiceroPool
+from CiceroSerial.ruleset import CiceroRuleset
+from CiceroSerial.verifier import GoldenModelVerifier
+from cost_model import BUDGET_FACTOR, CostModel
 
 class regular_expression_measurer():
     """Base class for a measurer: a wrapper for some form of regex matching device that returns some kind of measures"""
-    def __init__(self, name:str|list[str]):
+    # If the measurer spends its time waiting for a device instead of using the CPU, see scheduler.MeasurerExecutors
+    io_bound = False
+
+    def __init__(self, name:str|list[str], types:type|list[type]=None):
         """Creates a new measurer, a single measure name or a list of measures names should be provided.
 
         :param str | list[str] name: name(s) of the measure(s)
+        :param type | list[type] types: Python type(s) of the measure(s) (bool, int or float), None for any type, defaults to None
         """
         super().__init__()
         self.name = name
+        self.types = types
 
     def get_name(self) -> str|list[str]:
         """Gets the name(s) of the measure(s).
@@ -17,6 +35,13 @@ class regular_expression_measurer():
         """
         return self.name
 
+    def get_types(self) -> type|list[type]|None:
+        """Gets the type(s) of the measure(s), in the same order as the names.
+
+        :return type|list[type]|None: the measure(s) type(s), None if they are not declared
+        """
+        return self.types
+
     def execute(self, regex:str, string:bytes, O1=True, no_prefix=False, no_postfix=False, debug=False, regex_format="pythonre") -> any:
         """Measures the matching of a regex on a string.
 
@@ -49,7 +74,7 @@ class regular_expression_measurer():
         for string in strings:
             try:
                 result = None
-                result = self.execute(regex=regex, string=string, no_postfix = False, no_prefix=False, O1=True, debug=debug, regex_format=regex_format)   
+                result = self.execute(regex=regex, string=string, no_postfix=no_postfix, no_prefix=no_prefix, O1=O1, debug=debug, regex_format=regex_format)   
             except Exception as exc:
                 print('error while executing regex', regex,'\nstring [', len(string), 'chars]', string, exc)
                 if not skipException:
@@ -59,16 +84,60 @@ class regular_expression_measurer():
         return results
 
 class CiceroOnArduino_measurer(regular_expression_measurer):
-    """Measurer for CICERO on Arduino, measures are: match found (bool), number of clock cycles elapsed on the FPGA for the execution (int) and estimated execution time in microseconds on the FPGA (float)"""
-    def __init__(self, arduino_port:str):
-        super().__init__(["CiceroOnArduino_match[bool]", "CiceroOnArduino_exec[cc]", "CiceroOnArduino_time[micros]"])
+    """Measurer for CICERO on Arduino, measures are: match found (bool), number of clock cycles elapsed on the FPGA for the execution (int) and estimated execution time in microseconds on the FPGA (float)
+    Executions that exceed their cycle budget are stopped by Arduino and have CiceroOnArduino.TIMEOUT as match, clock cycles and execution time."""
+    io_bound = True
+
+    def __init__(self, arduino_port:str|list[str], bytecode_cache:BytecodeCache=None, verifier:GoldenModelVerifier=None, instrumentation:PhaseRecorder=None, cost_model:CostModel=None, budget_factor:float=BUDGET_FACTOR, cycle_budget:int=None, bundle:Bundle=None):
+        """Creates a new measurer, connecting to the Arduino.
+
+        :param str | list[str] arduino_port: the serial port of the Arduino, with more than one the strings are sharded across all the boards
+        :param BytecodeCache bytecode_cache: the cache for compiled regexes, defaults to None
+        :param GoldenModelVerifier verifier: the verifier that checks the results against the golden model, defaults to None
+        :param PhaseRecorder instrumentation: the recorder of the latency of each phase of the communication, defaults to None
+        :param CostModel cost_model: the model that gives the cycle budget of each string, defaults to None
+        :param float budget_factor: how many times the predicted cycles an execution may last, see CostModel.budgets(), defaults to BUDGET_FACTOR
+        :param int cycle_budget: the cycle budget of every string when there is no cost model, None for no limit, defaults to None
+        :param Bundle bundle: the precompiled programs of the regexes, used instead of the compiler, defaults to None
+        """
+        super().__init__(["CiceroOnArduino_match[bool]", "CiceroOnArduino_exec[cc]", "CiceroOnArduino_time[micros]"], [bool, int, float])
         self.debug = False
-        self.cicero = CiceroOnArduino("../cicero_compiler", arduino_port, debug=self.debug, timeout=5)
+        self.bytecode_cache = bytecode_cache if bytecode_cache is not None else BytecodeCache()
+        self.cost_model = cost_model
+        self.budget_factor = budget_factor
+        self.cycle_budget = cycle_budget
+        self.bundle = bundle
+        # With more than one port the strings are sharded across all the boards
+        if isinstance(arduino_port, list) and len(arduino_port) > 1:
+            self.cicero = CiceroPool("../cicero_compiler", arduino_port, debug=self.debug, timeout=5, bytecode_cache=self.bytecode_cache, verifier=verifier, instrumentation=instrumentation, bundle=bundle)
+        else:
+            if isinstance(arduino_port, list):
+                arduino_port = arduino_port[0]
+            self.cicero = CiceroOnArduino("../cicero_compiler", arduino_port, debug=self.debug, timeout=5, bytecode_cache=self.bytecode_cache, verifier=verifier, instrumentation=instrumentation, bundle=bundle)
+        # The drivers added the compiler to the path
+        self.compiler_version = find_compiler_version() if bundle is not None else None
     
+    def budgets(self, regex:str, strings:list, regex_format:str="pythonre") -> list[int]|None:
+        """Gets the cycle budget of each string, from the cost model or the fixed budget.
+
+        :param str regex: the regex
+        :param list strings: the strings
+        :param str regex_format: the format of the regex (see compiler), defaults to "pythonre"
+        :return list[int]|None: the budgets, None for no limit
+        """
+        if self.cost_model is not None and self.budget_factor:
+            index = self.bundle.find(regex) if self.bundle is not None and self.bundle.matches_options(regex_format, compiler_version=self.compiler_version) else None
+            code = self.bundle.code(index) if index is not None else compile_regex(regex, self.bytecode_cache, regex_format)
+            lengths = [len(string.encode("utf-8") if isinstance(string, str) else string) for string in strings]
+            return self.cost_model.budgets(code, lengths, self.budget_factor).tolist()
+        if self.cycle_budget:
+            return [self.cycle_budget] * len(strings)
+        return None
+
     def execute_multiple_strings(self, regex, strings:list, O1=True, no_prefix=True, no_postfix=True, debug=False, regex_format="pythonre", skipException=True):
         self.debug = debug
         try:
-            result = self.cicero.load_regex_and_test_strings(regex, strings, regex_format=regex_format)
+            result = self.cicero.load_regex_and_test_strings(regex, strings, regex_format=regex_format, budgets=self.budgets(regex, strings, regex_format))
         except Exception as exc:
             print('error while executing regex', regex, exc)
             if not skipException:
@@ -76,15 +145,174 @@ class CiceroOnArduino_measurer(regular_expression_measurer):
             result = []
         return result
 
+    def stats(self) -> dict:
+        """Gets the statistics of the regex uploads, see CiceroOnArduino.upload_stats() and CiceroPool.stats().
+
+        :return dict: the statistics of the driver or of each board of the pool
+        """
+        return self.cicero.stats() if isinstance(self.cicero, CiceroPool) else self.cicero.upload_stats()
+
+class CiceroRuleset_measurer(regular_expression_measurer):
+    """Measurer for CICERO on Arduino that matches all the regexes of the benchmark as a ruleset (see CiceroRuleset), the measure is: match found (bool)
+    The whole ruleset is executed the first time one of its regexes is measured on a list of strings, the other regexes get the results
+    of that execution, so the strings must be the same for every regex. A string on which a group returned CICERO_ERROR is scored as
+    a non-match by the fallback to the single regexes."""
+    io_bound = True
+
+    def __init__(self, arduino_port:str, regexes:list[str], regex_format:str="pythonre", min_text_length:int=1024, bytecode_cache:BytecodeCache=None, bundle:Bundle=None):
+        """Creates a new measurer, connecting to the Arduino and grouping the regexes.
+
+        :param str arduino_port: the serial port of the Arduino
+        :param list[str] regexes: the regexes of the benchmark
+        :param str regex_format: the format of the regexes (see compiler), defaults to "pythonre"
+        :param int min_text_length: the length of the strings that must fit in RAM together with the code of a group, defaults to 1024
+        :param BytecodeCache bytecode_cache: the cache for compiled regexes, defaults to None
+        :param Bundle bundle: the precompiled programs of the regexes, used instead of the compiler, defaults to None
+        """
+        super().__init__("CiceroRuleset_match[bool]", bool)
+        self.cicero = CiceroOnArduino("../cicero_compiler", arduino_port, timeout=5, bytecode_cache=bytecode_cache, bundle=bundle)
+        self.ruleset = CiceroRuleset(self.cicero, list(regexes), regex_format, min_text_length)
+        self.regex_indexes = {}
+        for index, regex in enumerate(self.ruleset.regexes):
+            self.regex_indexes.setdefault(regex, index)
+        self._strings = None
+        self._results = None
+
+    def execute_multiple_strings(self, regex, strings:list, O1=True, no_prefix=True, no_postfix=True, debug=False, regex_format="pythonre", skipException=True):
+        self.cicero.debug = debug
+        if regex_format != self.ruleset.regex_format:
+            raise Exception("The ruleset was built for regexes in format '" + self.ruleset.regex_format + "', not '" + regex_format + "'")
+        if strings is not self._strings:
+            self._results = self.ruleset.match_strings(list(strings))
+            self._strings = strings
+        return self._results[self.regex_indexes[regex]]
+
+    def export_json(self, path: str) -> None:
+        """Writes the report of the ruleset (see CiceroRuleset.report()) to a JSON file.
+
+        :param str path: the path of the file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.ruleset.report(len(self._strings) if self._strings is not None else 0), f, indent=2)
+
+    def stats(self) -> dict:
+        """Gets the statistics of the regex uploads, see CiceroOnArduino.upload_stats().
+
+        :return dict: the statistics of the driver
+        """
+        return self.cicero.upload_stats()
+
+def _add_compiler_path(cicero_compiler_path: str) -> None:
+    """Adds CICERO compiler folder to PATH, also used as initializer of the worker processes.
+
+    :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler
+    """
+    if cicero_compiler_path not in sys.path:
+        sys.path.append(cicero_compiler_path)
+
+@lru_cache(maxsize=1024)
+def _golden_model_pattern(regex: str, regex_format: str, no_prefix: bool, no_postfix: bool) -> any:
+    """Translates a regex through the frontend of the golden model, once for every combination of the arguments.
+
+    :param str regex: the regex
+    :param str regex_format: the format of the regex (see compiler)
+    :param bool no_prefix: if the regex can match only at the start of the strings
+    :param bool no_postfix: if the regex can match only at the end of the strings
+    :return any: the compiled pattern, whose search() finds a match exactly when the golden model does,
+    None if the golden model does not expose its translation
+    """
+    import golden_model
+
+    if not hasattr(golden_model, "translate_regex"):
+        return None
+    return golden_model.translate_regex(regex, no_prefix=no_prefix, no_postfix=no_postfix, frontend=regex_format)
+
+def _golden_model_results(regex: str, strings: list[bytes], no_prefix: bool, no_postfix: bool, regex_format: str, skipException: bool) -> list[bool|None]:
+    """Computes the results of the golden model on a batch of strings, equal strings are computed once.
+    The regex is translated once and its pattern is reused for every batch, if the golden model exposes its translation.
+
+    :param str regex: the regex
+    :param list[bytes] strings: the strings
+    :param bool no_prefix: if the regex can match only at the start of the strings
+    :param bool no_postfix: if the regex can match only at the end of the strings
+    :param str regex_format: the format of the regex (see compiler)
+    :param bool skipException: if exception should be only printed, without interrupting the execution
+    :return list[bool|None]: the result of each string, None if the golden model failed on it
+    """
+    import golden_model
+
+    try:
+        pattern = _golden_model_pattern(regex, regex_format, no_prefix, no_postfix)
+    except Exception as exc:
+        print('error while translating regex', regex, exc)
+        if not skipException:
+            raise exc
+        return [None] * len(strings)
+
+    results = {}
+    for string in strings:
+        if string in results:
+            continue
+        try:
+            if pattern is not None:
+                results[string] = pattern.search(string) is not None
+            else:
+                results[string] = golden_model.get_golden_model_result(regex, string, no_prefix=no_prefix, no_postfix=no_postfix, frontend=regex_format)
+        except Exception as exc:
+            print('error while executing regex', regex,'\nstring [', len(string), 'chars]', string, exc)
+            if not skipException:
+                raise exc
+            results[string] = None
+    return [results[string] for string in strings]
+
 class RESULT_measurer(regular_expression_measurer):
-    """Reference measurer to test if execution of other measurers is okay, the measure is: match found (bool)"""
-    def __init__(self):
-        super().__init__("Reference_match[bool]")
+    """Reference measurer to test if execution of other measurers is okay, the measure is: match found (bool)
+    Every string is matched by the golden model, that is the reference of all the other measurers. The golden model is imported
+    once and called on whole batches, equal strings of a batch are matched once; large batches can be split among processes.
+    Each regex is translated once by the frontend of the golden model, when the golden model exposes translate_regex()."""
+    def __init__(self, cicero_compiler_path:str="../cicero_compiler", workers:int=None, min_strings_per_worker:int=1024):
+        """Creates a new reference measurer.
+
+        :param str cicero_compiler_path: the path (relative or absolute) where to find CICERO compiler, defaults to "../cicero_compiler"
+        :param int workers: the number of processes among which the strings are split, None to match them in this process, defaults to None
+        :param int min_strings_per_worker: the min number of strings sent to each process, defaults to 1024
+        """
+        super().__init__("Reference_match[bool]", bool)
+        self.cicero_compiler_path = cicero_compiler_path
+        self.workers = workers
+        self.min_strings_per_worker = min_strings_per_worker
+        self._executor = None
+
+    def __getstate__(self) -> dict:
+        # The pool of processes can't be sent to another process
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        return state
 
     def execute(self, regex, string, O1=True, no_prefix=True, no_postfix=True, debug=False, regex_format="pythonre"):
-        import sys
-        sys.path.append('../cicero_compiler')
+        _add_compiler_path(self.cicero_compiler_path)
         import golden_model
         golden_model_res = golden_model.get_golden_model_result(regex, string, no_prefix=no_prefix, no_postfix=no_postfix, frontend=regex_format)
         
-        return golden_model_res
\ No newline at end of file
+        return golden_model_res
+
+    def execute_multiple_strings(self, regex:str, strings:list[bytes], O1=True, no_prefix=False, no_postfix=False, debug=False, regex_format="pythonre", skipException=True) -> list[bool|None]:
+        workers = min(self.workers or 1, len(strings) // self.min_strings_per_worker)
+        if workers <= 1:
+            _add_compiler_path(self.cicero_compiler_path)
+            return _golden_model_results(regex, strings, no_prefix, no_postfix, regex_format, skipException)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_add_compiler_path, initargs=(self.cicero_compiler_path,))
+        chunk_size = -(-len(strings) // workers)
+        batches = [strings[i:i + chunk_size] for i in range(0, len(strings), chunk_size)]
+        results = self._executor.map(_golden_model_results, [regex] * len(batches), batches, [no_prefix] * len(batches), [no_postfix] * len(batches),
+                                     [regex_format] * len(batches), [skipException] * len(batches))
+        return [result for batch in results for result in batch]
+
+    def close(self) -> None:
+        """Stops the processes among which the strings are split, if any."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
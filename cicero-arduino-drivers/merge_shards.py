@@ -0,0 +1,170 @@
+from benchmark import RESULTS_DIRECTORY, load_inputs
+from results_sink import digest_items
+from results_store import ResultsStore
+from sharding import Shard
+
+import argparse
+import ast
+import csv
+import glob
+import json
+import os.path
+import numpy as np
+
+# Types of the measures, as written in the manifests
+MEASURE_TYPES = {"bool": bool, "int": int, "float": float}
+
+# Fields that must be the same in the manifests of all the shards of a run
+SHARED_FIELDS = ("shards", "inputs", "regexes", "regexes_sha256", "strings", "strings_sha256", "measures", "measure_types")
+
+def load_manifests(name: str) -> list[dict]:
+    """Loads the manifests of all the shards of a run.
+
+    :param str name: the name of the results of the run, without the shard (e.g. protomata_rand_0-None)
+    :raises Exception: if no shard is found
+    :return list[dict]: the manifests, ordered by shard
+    """
+    manifests = []
+    for path in glob.glob(f"{RESULTS_DIRECTORY}/measure_{glob.escape(name)}_shard*of*.shard.json"):
+        with open(path, 'r') as f:
+            manifests.append(json.load(f))
+    if not manifests:
+        raise Exception("No shard of '" + name + "' found in '" + RESULTS_DIRECTORY + "'")
+    return sorted(manifests, key=lambda manifest: manifest["shard"])
+
+def check_manifests(manifests: list[dict], allow_incomplete: bool) -> None:
+    """Checks that the shards belong to the same run, that each of them is there once and that they completed.
+
+    :param list[dict] manifests: the manifests of the shards
+    :param bool allow_incomplete: if missing or interrupted shards should only be reported
+    :raises Exception: if the shards can't be merged
+    """
+    first = manifests[0]
+    for manifest in manifests[1:]:
+        for field in SHARED_FIELDS:
+            if manifest[field] != first[field]:
+                raise Exception(f"Shard {manifest['shard']} has a different '{field}' than shard {first['shard']}, they are not from the same run")
+
+    indexes = [manifest["shard"] for manifest in manifests]
+    duplicated = sorted({index for index in indexes if indexes.count(index) > 1})
+    if duplicated:
+        raise Exception(f"Shards {duplicated} found more than once")
+
+    problems = []
+    missing = sorted(set(range(first["shards"])) - set(indexes))
+    if missing:
+        problems.append(f"shards {missing} of {first['shards']} are missing")
+    for manifest in manifests:
+        if manifest["stored_pairs"] != manifest["pairs"]:
+            problems.append(f"shard {manifest['shard']} has results for {manifest['stored_pairs']} of its {manifest['pairs']} pairs")
+    for problem in problems:
+        if not allow_incomplete:
+            raise Exception("Incomplete run: " + problem)
+        print("WARN: incomplete run:", problem)
+
+def read_shard_results(path: str, measure_names: list[str]) -> tuple[list[str],list[str],list[str],list[str|None]]:
+    """Reads the CSV file written by a shard.
+
+    :param str path: the path of the file
+    :param list[str] measure_names: the names of the measures, in the order of the columns
+    :raises Exception: if the file does not have the format of the results
+    :return tuple[list[str],list[str],list[str],list[str|None]]: for each measure, its regex, its string as text, its name and its value (None if empty)
+    """
+    regexes, strings, names, texts = [], [], [], []
+    string = None
+    with open(path, 'r', newline='') as csvfile:
+        rows = csv.reader(csvfile, delimiter=',')
+        for row in rows:
+            # Every section starts with the string and the headers
+            if len(row) == 4 and row[0] == 'string: ' and row[2:] == ['', '']:
+                string = row[1]
+                if next(rows, None) != ['regex', *measure_names]:
+                    raise Exception("Unexpected headers after string " + string + " in '" + path + "'")
+                continue
+            if string is None or len(row) != len(measure_names) + 1:
+                raise Exception("Unexpected row " + str(row) + " in '" + path + "'")
+
+            for name, text in zip(measure_names, row[1:]):
+                regexes.append(row[0])
+                strings.append(string)
+                names.append(name)
+                texts.append(text if text != "" else None)
+    return regexes, strings, names, texts
+
+def _string_ids(results: ResultsStore, texts: list[str]) -> np.ndarray:
+    """Finds the IDs of strings written in the CSV file as text, reading only the strings that have results.
+
+    :param ResultsStore results: the results, with the strings of the run
+    :param list[str] texts: the strings, as written in the CSV file
+    :raises KeyError: if a string is not one of the strings of the run
+    :return np.ndarray: the ID of each string
+    """
+    if not texts:
+        return np.empty(0, dtype=np.int64)
+    distinct, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+    ids = np.empty(len(distinct), dtype=np.int64)
+    for position, text in enumerate(distinct):
+        try:
+            # Strings are written as the text of their bytes
+            string = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            raise KeyError(text)
+        if not isinstance(string, bytes):
+            raise KeyError(text)
+        ids[position] = results.string_id(string)
+    return ids[inverse.reshape(-1)]
+
+def merge_shards(name: str, allow_incomplete: bool=False) -> str:
+    """Merges the results of all the shards of a run into the CSV file that the run would have written without shards.
+
+    :param str name: the name of the results of the run, without the shard (e.g. protomata_rand_0-None)
+    :param bool allow_incomplete: if missing or interrupted shards should only be reported, defaults to False
+    :raises Exception: if the shards can't be merged or a pair has results in more than one shard
+    :return str: the path of the merged file
+    """
+    manifests = load_manifests(name)
+    check_manifests(manifests, allow_incomplete)
+    first = manifests[0]
+
+    # The regexes and strings are loaded again, to write them in the same order as the run without shards
+    regexes, strings = load_inputs(argparse.Namespace(**first["inputs"]))
+    if digest_items(regexes) != first["regexes_sha256"] or digest_items(strings) != first["strings_sha256"]:
+        raise Exception("The inputs of '" + first["inputs"]["benchmark"] + "' changed since the shards were executed")
+
+    measure_names = first["measures"]
+    results = ResultsStore(regexes, strings, measure_names, [MEASURE_TYPES.get(measure_type) for measure_type in first["measure_types"]])
+    seen = np.zeros((len(results.regexes), len(results.strings)), dtype=np.bool_)
+
+    for manifest in manifests:
+        shard = Shard(manifest["shard"], manifest["shards"], results.regexes, results.strings)
+        shard_regexes, shard_strings, names, texts = read_shard_results(os.path.join(RESULTS_DIRECTORY, manifest["csv"]), measure_names)
+        try:
+            regex_indexes = np.array([results.regex_ids[regex] for regex in shard_regexes], dtype=np.int64)
+            string_indexes = _string_ids(results, shard_strings)
+        except KeyError as exc:
+            raise Exception(f"Shard {manifest['shard']} has results for {exc}, that is not in the inputs")
+
+        # Every pair must belong to the shard and must not have been seen in another shard
+        pairs = np.unique(np.column_stack((regex_indexes, string_indexes)), axis=0) if len(regex_indexes) else np.empty((0, 2), dtype=np.int64)
+        if seen[pairs[:, 0], pairs[:, 1]].any():
+            regex_id, string_id = pairs[seen[pairs[:, 0], pairs[:, 1]]][0]
+            raise Exception(f"Shard {manifest['shard']} duplicates the results of regex '{results.regexes[regex_id]}' on string {results.strings[string_id]}")
+        seen[pairs[:, 0], pairs[:, 1]] = True
+        for regex_id in np.unique(pairs[:, 0]):
+            if not np.isin(pairs[pairs[:, 0] == regex_id, 1], shard.string_indexes(regex_id)).all():
+                raise Exception(f"Shard {manifest['shard']} has results of regex '{results.regexes[regex_id]}' on strings of other shards")
+
+        results.set_text_results(results.regexes, regex_indexes, results.first_indexes[string_indexes], np.array(names, dtype=object), np.array(texts, dtype=object))
+
+    path = f"{RESULTS_DIRECTORY}/measure_{name}.csv"
+    results.export_csv(path)
+    return path
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='merge the results of the shards of a benchmark executed with -shard')
+    arg_parser.add_argument('-name',              type=str,  help='name of the results without the shard, e.g. protomata_rand_0-None',            required=True)
+    arg_parser.add_argument('-allowincomplete',              help='merge even if some shards are missing or were interrupted',  action='store_true',  default=False)
+
+    args = arg_parser.parse_args()
+
+    print("Merged results written to", merge_shards(args.name, args.allowincomplete))
@@ -1,94 +1,201 @@
-import csv
-import pandas as pd
-import numpy as np 
+from adaptive import AVG_TIME, THROUGHPUT, TIMEOUT, WEIGHTED_TIME
+from results_db import ResultsDatabase
+from results_loader import CHARS, DEFAULT_CHUNK_ROWS, SECTION, read_sections
+
 import argparse
+import numpy as np
+import pandas as pd
+
+# Values of the match measure of the pairs that are aggregated, the others (errors, timeouts) are skipped
+MATCH_VALUES = ("True", "False")
+
+class RegexMetrics:
+    """Aggregation, for each regex, of its time and of the characters of the strings over all the sections of a results file.
+    The i-th valid pair of every section is aggregated with the i-th of the others: the files have the regexes in the same order in every section.
+    Chunks of pairs are added as they are read, the sums are done in the order of the sections, so that they are the same
+    as those of the original row-by-row parser.
+    Pairs that exceeded their cycle budget keep their position, so that the regexes stay aligned, but their time is unknown:
+    they are counted as timeouts and the metrics of their regex are computed on the other sections."""
+    def __init__(self, time_column: str, match_column: str, convert_cc: bool=False, target_freq: int=214) -> None:
+        """Creates an empty aggregation.
+
+        :param str time_column: the measure with the execution time
+        :param str match_column: the measure with the result of the match
+        :param bool convert_cc: if the time is in clock cycles and must be converted to ns, defaults to False
+        :param int target_freq: the frequency of CICERO in MHz to convert clock cycles, defaults to 214
+        """
+        self.time_column = time_column
+        self.match_column = match_column
+        self.convert_cc = convert_cc
+        self.target_freq = target_freq
+
+        # Largest time in clock cycles seen so far, it replaces the times that are not a number
+        self.maximum_unmatched_time = 0.0
+        self.sections = 0
+        self.timeouts = 0
+        # Valid pairs of each section and sums over the sections for each position
+        self.pairs_per_section = np.zeros(0, dtype=np.int64)
+        self.completed = np.zeros(0, dtype=np.int64)
+        self.weighted_time = np.zeros(0, dtype=np.float64)
+        self.time = np.zeros(0, dtype=np.float64)
+        self.chars = np.zeros(0, dtype=np.int64)
+
+    def _times(self, texts: pd.Series) -> np.ndarray:
+        """Converts the times of the valid pairs of a chunk to ns.
+
+        :param pd.Series texts: the times as written in the file
+        :return np.ndarray: the times in ns
+        """
+        if not self.convert_cc:
+            return texts.astype(np.float64).to_numpy()
+
+        is_number = texts.str.isdecimal().to_numpy()
+        cycles = np.zeros(len(texts), dtype=np.float64)
+        cycles[is_number] = texts[is_number].astype(np.float64).to_numpy()
+        # Times that are not a number take the largest time before them
+        running_max = np.maximum.accumulate(np.where(is_number, cycles, 0.0)) if len(cycles) else cycles
+        running_max = np.maximum(running_max, self.maximum_unmatched_time)
+        cycles = np.where(is_number, cycles, running_max)
+        if len(running_max):
+            self.maximum_unmatched_time = float(running_max[-1])
+        return cycles * 1000 / self.target_freq
+
+    def add(self, frame: pd.DataFrame) -> None:
+        """Adds a chunk of pairs, the chunks must be added in the order of the file.
+
+        :param pd.DataFrame frame: the pairs, as read by results_loader.read_sections()
+        :raises Exception: if the time or the match measure is not in the frame
+        """
+        for column in (self.time_column, self.match_column):
+            if column not in frame.columns:
+                raise Exception("Measure '" + column + "' not found, the measures are " + str(list(frame.columns[4:])))
+
+        self.sections = max(self.sections, frame.attrs.get("sections", 0), int(frame[SECTION].max()) + 1 if len(frame) else 0)
+        if len(self.pairs_per_section) < self.sections:
+            self.pairs_per_section = np.concatenate((self.pairs_per_section, np.zeros(self.sections - len(self.pairs_per_section), dtype=np.int64)))
+
+        matches = frame[self.match_column]
+        is_timeout = ((matches == TIMEOUT) | (frame[self.time_column] == TIMEOUT)).to_numpy()
+        kept = matches.isin(MATCH_VALUES).to_numpy() | is_timeout
+        valid = frame[kept]
+        if not len(valid):
+            return
+        completed = ~is_timeout[kept]
+        self.timeouts += int(len(valid) - completed.sum())
+
+        # Timeouts add nothing to the sums of their position
+        times = np.zeros(len(valid), dtype=np.float64)
+        times[completed] = self._times(valid[self.time_column][completed])
+        # Matched strings are counted as half of their characters
+        chars = valid[CHARS].to_numpy(dtype=np.int64)
+        chars = np.where(valid[self.match_column].to_numpy() == "False", chars, chars // 2)
+        chars = np.where(completed, chars, 0)
+
+        # Position of each pair in its section, continuing the section of the previous chunk
+        sections = valid[SECTION].to_numpy(dtype=np.int64)
+        positions = valid.groupby(SECTION, sort=False).cumcount().to_numpy() + self.pairs_per_section[sections]
+        self.pairs_per_section += np.bincount(sections, minlength=self.sections)
+
+        positions_num = int(positions.max()) + 1
+        if positions_num > len(self.time):
+            grow = positions_num - len(self.time)
+            self.weighted_time = np.concatenate((self.weighted_time, np.zeros(grow)))
+            self.time = np.concatenate((self.time, np.zeros(grow)))
+            self.chars = np.concatenate((self.chars, np.zeros(grow, dtype=np.int64)))
+            self.completed = np.concatenate((self.completed, np.zeros(grow, dtype=np.int64)))
+
+        # A row for each section of the chunk, reduced along the sections after the sums so far, to keep the order of the additions
+        rows = sections - sections.min()
+        for sums, values in ((self.weighted_time, times * chars), (self.time, times), (self.chars, chars), (self.completed, completed.astype(np.int64))):
+            table = np.zeros((int(rows.max()) + 2, len(sums)), dtype=sums.dtype)
+            table[0] = sums
+            table[rows + 1, positions] = values
+            sums[:] = np.add.reduce(table, axis=0)
+
+    def metrics(self) -> pd.DataFrame:
+        """Computes the metrics of each regex.
+
+        :raises Exception: if there are no pairs or a section has fewer valid pairs than the first one
+        :return pd.DataFrame: for each regex, the average time weighted by the characters, the average time and the characters per ns, over the sections where it did not time out
+        """
+        if not self.sections:
+            raise Exception("No results to aggregate")
+        regexes_num = int(self.pairs_per_section[0])
+        short = np.flatnonzero(self.pairs_per_section < regexes_num)
+        if len(short):
+            raise Exception(f"Section {short[0]} has {self.pairs_per_section[short[0]]} valid results, but the first one has {regexes_num}")
+
+        # Sections with more pairs than the first one have their extra pairs ignored
+        weighted_time, time, chars = self.weighted_time[:regexes_num], self.time[:regexes_num], self.chars[:regexes_num]
+        # Without timeouts every position is completed in all the sections
+        completed = self.completed[:regexes_num] if self.timeouts else self.sections
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return pd.DataFrame({
+                WEIGHTED_TIME: weighted_time / chars,
+                AVG_TIME: time / completed,
+                THROUGHPUT: chars / time,
+            })
+
+def aggregate_file(path: str, offset: int=None, convert_cc: bool=False, target_freq: int=214, time_column: str=None, match_column: str=None, chunk_rows: int=DEFAULT_CHUNK_ROWS) -> pd.DataFrame:
+    """Computes the metrics of each regex of a results file, reading it in chunks.
+
+    :param str path: the path of the results file
+    :param int offset: the position of the time counting from the right, the match is the column before it, used if the columns are not named, defaults to None
+    :param bool convert_cc: if the time is in clock cycles and must be converted to ns, defaults to False
+    :param int target_freq: the frequency of CICERO in MHz to convert clock cycles, defaults to 214
+    :param str time_column: the name of the measure with the execution time, defaults to None
+    :param str match_column: the name of the measure with the result of the match, defaults to None
+    :param int chunk_rows: the number of rows of the file read at a time, defaults to DEFAULT_CHUNK_ROWS
+    :raises Exception: if the time and match measures can't be found
+    :return pd.DataFrame: the metrics of each regex, with the number of pairs that exceeded their cycle budget in attrs["timeouts"]
+    """
+    metrics = None
+    for frame in read_sections(path, chunk_rows):
+        if metrics is None:
+            measures = list(frame.columns[4:])
+            if time_column is None or match_column is None:
+                if offset is None or offset + 2 > len(measures):
+                    raise Exception("The time and match measures must be given by name or by a valid offset, the measures are " + str(measures))
+                time_column = time_column or measures[-offset - 1]
+                match_column = match_column or measures[-offset - 2]
+            metrics = RegexMetrics(time_column, match_column, convert_cc, target_freq)
+        metrics.add(frame)
+    if metrics is None:
+        raise Exception("No results to aggregate in '" + path + "'")
+    result = metrics.metrics()
+    result.attrs["timeouts"] = metrics.timeouts
+    return result
+
+def write_metrics(metrics: pd.DataFrame, path: str) -> None:
+    """Writes the metrics of each regex to a CSV file, with the shortest representation of the floats.
+
+    :param pd.DataFrame metrics: the metrics
+    :param str path: the path of the file
+    """
+    with open(path, "w") as f:
+        print(",".join(metrics.columns), file=f)
+        for weighted_time, avg_time, throughput in zip(*(metrics[column].tolist() for column in metrics.columns)):
+            print(f'{weighted_time},{avg_time},{throughput}', file=f)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CICERO output parsing script')
+    parser.add_argument("-irf", "--input_res_file", help="input file name to aggregate", type=str, required=True)
+    parser.add_argument("-gv", "--giovanna", help="offset a partire da dx nella riga res regex 1 per re2 0  per copro", type=int, default=None)
+    parser.add_argument("-orf", "--output_res_file", help="output aggregation file name", type=str, required=True)
+    parser.add_argument("-copro", "--convert_cc",action='store_true', help="convert cc into freq")
+    parser.add_argument("-freq", "--target_freq", help="copro freq in MHz", type=int, default=214)
+    parser.add_argument("-time", "--time_measure", help="name of the time measure, instead of -gv", type=str, default=None)
+    parser.add_argument("-match", "--match_measure", help="name of the match measure, instead of -gv", type=str, default=None)
+    parser.add_argument("-chunk", "--chunk_rows", help="rows of the input file read at a time", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("-db", "--results_db", help="results database where the output is ingested", type=str, default=None)
 
-parser = argparse.ArgumentParser(description='CICERO output parsing script')
-parser.add_argument("-irf", "--input_res_file", help="input file name to aggregate", type=str, required=True)
-parser.add_argument("-gv", "--giovanna", help="offset a partire da dx nella riga res regex 1 per re2 0  per copro", type=int, required=True)
-parser.add_argument("-orf", "--output_res_file", help="output aggregation file name", type=str, required=True)
-parser.add_argument("-copro", "--convert_cc",action='store_true', help="convert cc into freq")
-parser.add_argument("-freq", "--target_freq", help="copro freq in MHz", type=int, default=214)
-
-args = parser.parse_args()
-
-re_avg_list = []
-state = 0
-char_count = 0
-line_count = 0
-init_decrement=3
-giovanna=args.giovanna# 1#offset a partire da dx nella riga res regex 1 per re2 0  per copro
-maximum_unmatched_time = 0
-with open(args.input_res_file) as csv_file: #'measure_pcrebrill_queue_1_O1.csv') as csv_file:
-    csv_reader = csv.reader(csv_file, delimiter=',')
-    for row in csv_reader:
-        #if line_count == 1:
-            #print( row[-1] )
-
-        if state == 0:
-            if "string:" in row[0]:
-                char_count = 0 #i-1 * init_decrement
-                for i in range(1,len(row)-2):
-                    char_count += len(row[i])
-                #print(f' toto count {char_count}')
-                state = 1
-                re_avg_list.append(list())
-                #print(row[1])
-                #print(len(row))
-                #print(len(row[1]))
-                continue
-                #line_count +=1
-            else:
-                line_count = 0
-                time=row[-giovanna-1]
-                match=row[-giovanna-2]
-                if match != 'False' and match != 'True':
-                    continue
-                if args.convert_cc:
-                    if time.isdecimal() :
-                        maximum_unmatched_time = float(time) if maximum_unmatched_time < float(time) else maximum_unmatched_time
-                    else:
-                        time = maximum_unmatched_time
-                    time = float(time)*1000/args.target_freq
-                else:
-                    time = float(time)
-                re_avg_list[-1].append((time, char_count if match == 'False' else char_count//2))
-
-        if state == 1:
-            state = 0
-            line_count += 1
-            continue
-
-
-################
-#aggregation
-###############
-avg_time_w = 0
-avg_time = 0
-denom = 0
-regex_weighted_time = []
-regex_avg_time = []
-thr_avg_regex = []
-for i in range(len(re_avg_list[0])):
-        avg_time = 0
-        avg_time_w = 0
-        denom = 0
-        for j in range(len(re_avg_list)):
-           avg_time_w += re_avg_list[j][i][0]*re_avg_list[j][i][1]
-
-           avg_time += re_avg_list[j][i][0]
-
-           denom += re_avg_list[j][i][1]
-           
-        regex_weighted_time.append(avg_time_w/denom)
-
-        regex_avg_time.append(avg_time/len(re_avg_list))
-
-        thr_avg_regex.append(denom/avg_time)
-
-with open(args.output_res_file,"w") as f:
-    print("Weighted_AVG_Time[ns],AVG_Time[ns],Thr_AVG_RE[char/ns]",file=f)
-    for i in range(len(regex_weighted_time)):
-        print(f'{regex_weighted_time[i]},{regex_avg_time[i]},{thr_avg_regex[i]}',file=f)
+    args = parser.parse_args()
 
+    metrics = aggregate_file(args.input_res_file, args.giovanna, args.convert_cc, args.target_freq, args.time_measure, args.match_measure, args.chunk_rows)
+    write_metrics(metrics, args.output_res_file)
+    if metrics.attrs["timeouts"]:
+        print(f"WARN: {metrics.attrs['timeouts']} executions exceeded their cycle budget and are not part of the metrics")
+    if args.results_db:
+        database = ResultsDatabase(args.results_db)
+        database.ingest(args.output_res_file)
+        database.close()
@@ -0,0 +1,313 @@
+from results_loader import REGEX, STRING, CHARS, SECTION, STRING_MARKER, read_sections
+
+import argparse
+import math
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATABASE = "results/results.sqlite"
+
+# Kinds of runs: the results of every (regex, string) pair, or a row of metrics for each regex
+PAIRS = "pairs"
+AGGREGATE = "aggregate"
+
+# Platform and engine of the results written by benchmark.py and parser_results.py
+DEFAULT_PLATFORM = "fpga-arduino"
+DEFAULT_ENGINE = "cicero"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS benchmarks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS engines (
+    id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (platform, name)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    benchmark_id INTEGER NOT NULL REFERENCES benchmarks(id),
+    engine_id INTEGER NOT NULL REFERENCES engines(id),
+    file_size TEXT,
+    chunk_size TEXT,
+    match_mode TEXT,
+    source_size INTEGER NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS regexes (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS strings (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE TABLE IF NOT EXISTS measures (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    regex_position INTEGER NOT NULL,
+    regex_id INTEGER REFERENCES regexes(id),
+    string_position INTEGER,
+    name TEXT NOT NULL,
+    value TEXT,
+    number REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_benchmark ON runs (benchmark_id, engine_id);
+CREATE INDEX IF NOT EXISTS measures_by_run ON measures (run_id, name);
+CREATE INDEX IF NOT EXISTS measures_by_regex ON measures (regex_id, name);
+"""
+
+# Layouts of the names of the results files, from the most specific
+# <platform>/<engine>/<benchmark>/output_comp_data_<file size>_<chunk size>_<match mode>.csv, used by the plotting scripts
+CHARTS_LAYOUT = re.compile(r"(?P<platform>[^/]+)/(?P<engine>[^/]+)/(?P<benchmark>[^/]+)/output_comp_data_(?P<file_size>[^_]+)_(?P<chunk_size>[^_]+)_(?P<match_mode>[^_.]+)\.csv$")
+# <benchmark>_output_comp_data_<file size>_<chunk size>_<match mode>.csv, written by parser_results.py
+AGGREGATE_LAYOUT = re.compile(r"(?:^|/)(?P<benchmark>[^/]+?)_output_comp_data_(?P<file_size>[^_]+)_(?P<chunk_size>[^_]+)_(?P<match_mode>[^_.]+)\.csv$")
+# measure_<benchmark>_<regexes>_<strings>[_shard...].csv, written by benchmark.py, where regexes and strings are "rand" or a range
+PAIRS_LAYOUT = re.compile(r"(?:^|/)measure_(?P<benchmark>[^/]+?)_(?:rand|\d+-\w+)_(?:rand|\d+-\w+)[^/]*\.csv$")
+
+def describe_file(path: str) -> dict[str,str]:
+    """Finds the benchmark, the engine and the settings of a results file from its path.
+
+    :param str path: the path of the results file
+    :return dict[str,str]: the fields found in the path, empty if the path has none of the known layouts
+    """
+    path = path.replace(os.sep, "/")
+    for layout, defaults in ((CHARTS_LAYOUT, {}), (AGGREGATE_LAYOUT, {"platform": DEFAULT_PLATFORM, "engine": DEFAULT_ENGINE}),
+                             (PAIRS_LAYOUT, {"platform": DEFAULT_PLATFORM, "engine": DEFAULT_ENGINE})):
+        found = layout.search(path)
+        if found:
+            return {**defaults, **found.groupdict()}
+    return {}
+
+def _numbers(values: pd.Series) -> list[float|None]:
+    """Converts measures written as text to numbers, booleans are 1 and 0.
+
+    :param pd.Series values: the measures as text
+    :return list[float|None]: the numbers, None for the measures that are not numbers
+    """
+    numbers = pd.to_numeric(values.replace({"True": "1", "False": "0"}), errors="coerce").astype(np.float64)
+    return [None if math.isnan(number) else number for number in numbers.tolist()]
+
+class ResultsDatabase:
+    """SQLite database of the results of many runs, of CICERO and of other engines, to query them without parsing the CSV files again.
+    A run is a results file: files are ingested again only if they changed since the last time."""
+    def __init__(self, path: str=DEFAULT_DATABASE) -> None:
+        """Opens the database, creating it if needed.
+
+        :param str path: the path of the database, defaults to DEFAULT_DATABASE
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._regex_ids = {}
+
+    def _id(self, table: str, **fields) -> int:
+        """Gets the id of a row of a lookup table, inserting it if it is not there.
+
+        :param str table: the table
+        :return int: the id of the row
+        """
+        names = list(fields)
+        condition = " AND ".join(name + " = ?" for name in names)
+        row = self.connection.execute(f"SELECT id FROM {table} WHERE {condition}", list(fields.values())).fetchone()
+        if row is not None:
+            return row[0]
+        return self.connection.execute(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})", list(fields.values())).lastrowid
+
+    def _regex_id(self, regex: str) -> int:
+        if regex not in self._regex_ids:
+            self._regex_ids[regex] = self._id("regexes", text=regex)
+        return self._regex_ids[regex]
+
+    def _start_run(self, path: str, kind: str, benchmark: str, engine: str, platform: str, file_size: str|None, chunk_size: str|None, match_mode: str|None) -> int|None:
+        """Creates the run of a file, replacing the previous ingestion of the file if it changed.
+
+        :return int|None: the id of the run, None if the file did not change since it was ingested
+        """
+        source = os.path.realpath(path)
+        stat = os.stat(source)
+        row = self.connection.execute("SELECT id, source_size, source_mtime_ns FROM runs WHERE source = ?", (source,)).fetchone()
+        if row is not None:
+            if row[1:] == (stat.st_size, stat.st_mtime_ns):
+                return None
+            # Measures and strings are deleted in cascade
+            self.connection.execute("DELETE FROM runs WHERE id = ?", (row[0],))
+
+        return self.connection.execute(
+            "INSERT INTO runs (source, kind, benchmark_id, engine_id, file_size, chunk_size, match_mode, source_size, source_mtime_ns, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (source, kind, self._id("benchmarks", name=benchmark.lower()), self._id("engines", platform=platform, name=engine),
+             file_size, chunk_size, match_mode, stat.st_size, stat.st_mtime_ns, time.strftime("%Y-%m-%dT%H:%M:%S"))).lastrowid
+
+    def _insert_pairs(self, run_id: int, path: str) -> None:
+        """Inserts the results of every (regex, string) pair of a file with a section for each string.
+
+        :param int run_id: the id of the run
+        :param str path: the path of the file
+        """
+        regex_positions = {}
+        last_section = -1
+        for frame in read_sections(path):
+            strings = frame.drop_duplicates(SECTION)
+            strings = strings[strings[SECTION] > last_section]
+            self.connection.executemany("INSERT INTO strings (run_id, position, text, chars) VALUES (?, ?, ?, ?)",
+                                        zip([run_id] * len(strings), strings[SECTION].tolist(), strings[STRING].tolist(), strings[CHARS].tolist()))
+            if len(frame):
+                last_section = int(frame[SECTION].iloc[-1])
+
+            # Regexes are numbered in the order in which they first appear in the file
+            regexes = frame[REGEX]
+            regex_ids = {}
+            for regex in pd.unique(regexes):
+                regex_positions.setdefault(regex, len(regex_positions))
+                regex_ids[regex] = self._regex_id(regex)
+            positions = regexes.map(regex_positions).tolist()
+            regex_ids = regexes.map(regex_ids).tolist()
+
+            for name in frame.columns[4:]:
+                values = frame[name]
+                self.connection.executemany("INSERT INTO measures (run_id, regex_position, regex_id, string_position, name, value, number) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                            zip([run_id] * len(frame), positions, regex_ids, frame[SECTION].tolist(), [name] * len(frame),
+                                                values.where(values != "", None).tolist(), _numbers(values)))
+
+    def _insert_aggregate(self, run_id: int, path: str) -> None:
+        """Inserts the metrics of a file with a row for each regex and a header, like those of parser_results.py or of other engines.
+
+        :param int run_id: the id of the run
+        :param str path: the path of the file
+        """
+        with open(path, 'r') as f:
+            header = f.readline()
+        # Files of other engines have their columns separated by spaces
+        table = pd.read_csv(path, sep="," if "," in header else " ", dtype=str, keep_default_na=False)
+        positions = list(range(len(table)))
+        for name in table.columns:
+            values = table[name]
+            self.connection.executemany("INSERT INTO measures (run_id, regex_position, name, value, number) VALUES (?, ?, ?, ?, ?)",
+                                        zip([run_id] * len(table), positions, [name] * len(table), values.where(values != "", None).tolist(), _numbers(values)))
+
+    def ingest(self, path: str, benchmark: str=None, engine: str=None, platform: str=None, file_size: str=None, chunk_size: str=None, match_mode: str=None) -> bool:
+        """Ingests a results file, either written by benchmark.py, by parser_results.py or by another engine.
+        The fields that are not given are found from the path of the file (see describe_file()).
+
+        :param str path: the path of the results file
+        :param str benchmark: the name of the benchmark, defaults to None
+        :param str engine: the engine that executed the benchmark, defaults to None
+        :param str platform: the platform where the benchmark was executed, defaults to None
+        :param str file_size: the overall size of the strings, defaults to None
+        :param str chunk_size: the size of the chunks of the strings, defaults to None
+        :param str match_mode: the match mode, defaults to None
+        :raises Exception: if the benchmark is not given and can't be found from the path
+        :return bool: True if the file was ingested, False if it did not change since the last time
+        """
+        fields = describe_file(path)
+        benchmark = benchmark or fields.get("benchmark")
+        if benchmark is None:
+            raise Exception("Can't find the benchmark of '" + path + "' from its path, give it explicitly")
+
+        with open(path, 'r', newline='') as f:
+            kind = PAIRS if STRING_MARKER in f.readline().split(",")[0] else AGGREGATE
+
+        try:
+            with self.connection:
+                run_id = self._start_run(path, kind, benchmark, engine or fields.get("engine", DEFAULT_ENGINE), platform or fields.get("platform", DEFAULT_PLATFORM),
+                                         file_size or fields.get("file_size"), chunk_size or fields.get("chunk_size"), match_mode or fields.get("match_mode"))
+                if run_id is None:
+                    return False
+                if kind == PAIRS:
+                    self._insert_pairs(run_id, path)
+                else:
+                    self._insert_aggregate(run_id, path)
+        except Exception:
+            # The regexes inserted by the failed ingestion were rolled back
+            self._regex_ids.clear()
+            raise
+        return True
+
+    def ingest_tree(self, root: str) -> tuple[int,int]:
+        """Ingests all the results files under a directory whose path has one of the known layouts.
+
+        :param str root: the directory
+        :return tuple[int,int]: the number of files ingested and of files that did not change
+        """
+        ingested, unchanged = 0, 0
+        for directory, _, file_names in os.walk(root):
+            for file_name in sorted(file_names):
+                path = os.path.join(directory, file_name)
+                if not describe_file(path):
+                    continue
+                if self.ingest(path):
+                    ingested += 1
+                else:
+                    unchanged += 1
+        return ingested, unchanged
+
+    def averages(self, measure: str=None) -> pd.DataFrame:
+        """Computes the average of the positive values of the measures of every run, as the plotting scripts do.
+
+        :param str measure: the measure, None for all of them, defaults to None
+        :return pd.DataFrame: the platform, the engine, the benchmark, the settings and the measure of the run, with the average and the number of values
+        """
+        query = """
+            SELECT e.platform, e.name AS engine, b.name AS benchmark, r.file_size, r.chunk_size, r.match_mode, m.name AS measure,
+                   AVG(m.number) AS average, COUNT(m.number) AS count
+            FROM measures m JOIN runs r ON r.id = m.run_id JOIN benchmarks b ON b.id = r.benchmark_id JOIN engines e ON e.id = r.engine_id
+            WHERE m.number > 0""" + (" AND m.name = ?" if measure is not None else "") + """
+            GROUP BY m.run_id, m.name"""
+        return pd.read_sql_query(query, self.connection, params=[measure] if measure is not None else None)
+
+    def measure_values(self, benchmark: str, measure: str, engine: str=DEFAULT_ENGINE) -> pd.DataFrame:
+        """Gets the values of a measure of every pair of the runs of a benchmark.
+
+        :param str benchmark: the name of the benchmark
+        :param str measure: the measure
+        :param str engine: the engine, defaults to DEFAULT_ENGINE
+        :return pd.DataFrame: the run, the regex, the string with its characters and the value of every pair
+        """
+        query = """
+            SELECT m.run_id, x.text AS regex, s.text AS string, s.chars, m.value, m.number
+            FROM measures m JOIN runs r ON r.id = m.run_id JOIN benchmarks b ON b.id = r.benchmark_id JOIN engines e ON e.id = r.engine_id
+            LEFT JOIN regexes x ON x.id = m.regex_id LEFT JOIN strings s ON s.run_id = m.run_id AND s.position = m.string_position
+            WHERE b.name = ? AND e.name = ? AND m.name = ?
+            ORDER BY m.run_id, m.string_position, m.regex_position"""
+        return pd.read_sql_query(query, self.connection, params=[benchmark.lower(), engine, measure])
+
+    def close(self) -> None:
+        self.connection.close()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='ingest results files in the results database, files already ingested are skipped if they did not change')
+    arg_parser.add_argument('paths',              type=str,  help='results files, or directories where the results files are searched', nargs='+')
+    arg_parser.add_argument('-db',                type=str,  help='path of the database',                                                              default=DEFAULT_DATABASE)
+    arg_parser.add_argument('-benchmark',         type=str,  help='benchmark of the files, instead of finding it from their path',                    default=None)
+    arg_parser.add_argument('-engine',            type=str,  help='engine of the files, instead of finding it from their path',                       default=None)
+    arg_parser.add_argument('-platform',          type=str,  help='platform of the files, instead of finding it from their path',                     default=None)
+
+    args = arg_parser.parse_args()
+
+    database = ResultsDatabase(args.db)
+    ingested, unchanged = 0, 0
+    for path in args.paths:
+        if os.path.isdir(path):
+            counts = database.ingest_tree(path)
+            ingested, unchanged = ingested + counts[0], unchanged + counts[1]
+        elif database.ingest(path, args.benchmark, args.engine, args.platform):
+            ingested += 1
+        else:
+            unchanged += 1
+    database.close()
+    print(f"Ingested {ingested} files in '{args.db}', {unchanged} did not change")
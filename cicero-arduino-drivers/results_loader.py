@@ -0,0 +1,162 @@
+import csv
+import glob
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from results_sink import MANIFEST_FILE, SEGMENT_PREFIX, SEGMENT_SUFFIX, digest_items
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Text that marks the first row of a section of the CSV files, as written by ResultsStore.export_csv()
+STRING_MARKER = "string:"
+
+# Columns of the tidy frames that are not measures
+SECTION = "section"
+STRING = "string"
+CHARS = "chars"
+REGEX = "regex"
+
+DEFAULT_CHUNK_ROWS = 1000000
+
+def _csv_width(path: str) -> tuple[int,list[str]]:
+    """Reads the first section of a CSV file of results to know its columns.
+
+    :param str path: the path of the file
+    :return tuple[int,list[str]]: the number of fields of the widest row and the name of each column of measures
+    """
+    with open(path, 'r', newline='') as csvfile:
+        rows = csv.reader(csvfile, delimiter=',')
+        first = next(rows, [])
+        headers = next(rows, [])
+    width = max(len(first), len(headers), 1)
+
+    # Measures without a header, or with a duplicated one, are named by their column
+    # The row of the string has 4 fields even when there are fewer measures, its empty fields are not measures
+    names = []
+    for column in range(1, len(headers) if headers else width):
+        name = headers[column] if headers else ""
+        names.append(name if name and name not in names else str(column))
+    return width, names
+
+def read_sections(path: str, chunk_rows: int|None=DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Reads a CSV file of results, made of a section for each string, into tidy frames with a row for each (string, regex) pair.
+    Sections are recognized as parser_results.py always did: a row whose first field contains "string:" starts a section,
+    the row after it contains the headers and is skipped, the characters of the string are the length of its text.
+
+    The frames have the columns "section" (the position of the section in the file), "string" (the text of the string),
+    "chars" (the characters of the string), "regex" and one column for each measure, named as in the headers of the first section.
+    Measures are kept as text, exactly as they are written in the file.
+
+    :param str path: the path of the file
+    :param int|None chunk_rows: the number of rows of the file read at a time, None to read the whole file at once, defaults to DEFAULT_CHUNK_ROWS
+    :raises Exception: if the file has results before the first section
+    :yield pd.DataFrame: the pairs of a chunk of the file, a section can span two chunks
+    """
+    width, measure_columns = _csv_width(path)
+
+    # Everything is read as text, without guessing types or missing values
+    chunks = pd.read_csv(path, header=None, names=range(width), dtype=object, keep_default_na=False, na_filter=False, chunksize=chunk_rows)
+    if chunk_rows is None:
+        chunks = [chunks]
+
+    section = -1
+    previous_is_string = False
+    string, chars = None, 0
+    for chunk in chunks:
+        first = chunk[0]
+        marked = first.str.contains(STRING_MARKER, regex=False).to_numpy()
+        # The row after the string contains the headers, even if it contains the marker too
+        is_headers = np.concatenate(([previous_is_string], marked[:-1]))
+        is_string = marked & ~is_headers
+        previous_is_string = bool(is_string[-1]) if len(is_string) else previous_is_string
+
+        sections = section + np.cumsum(is_string)
+        is_pair = ~is_string & ~is_headers
+        if (sections[is_pair] < 0).any():
+            raise Exception("Results found before the first string in '" + path + "'")
+
+        # The text and the characters of the string are carried to the pairs of its section
+        string_rows = chunk[is_string]
+        texts = pd.Series(string_rows[1].to_numpy(), index=sections[is_string])
+        lengths = pd.Series(sum(string_rows[column].str.len() for column in range(1, width - 2)).to_numpy() if width > 3 else np.zeros(len(string_rows), dtype=np.int64),
+                            index=sections[is_string])
+        if section >= 0:
+            texts = pd.concat((pd.Series([string], index=[section]), texts))
+            lengths = pd.concat((pd.Series([chars], index=[section]), lengths))
+        if len(texts):
+            string, chars = texts.iloc[-1], int(lengths.iloc[-1])
+        section = int(sections[-1]) if len(sections) else section
+
+        pairs = chunk[is_pair]
+        pair_sections = sections[is_pair]
+        frame = pd.DataFrame({
+            SECTION: pair_sections,
+            STRING: texts.reindex(pair_sections).to_numpy(),
+            CHARS: lengths.reindex(pair_sections).to_numpy(dtype=np.int64),
+            REGEX: pairs[0].to_numpy(),
+        })
+        for column, name in enumerate(measure_columns, start=1):
+            frame[name] = pairs[column].to_numpy()
+        frame.attrs["sections"] = section + 1
+        yield frame
+
+def load_sections(path: str) -> pd.DataFrame:
+    """Reads a whole CSV file of results into a tidy frame, see read_sections().
+
+    :param str path: the path of the file
+    :return pd.DataFrame: the pairs of the file
+    """
+    frames = list(read_sections(path, chunk_rows=None))
+    frame = pd.concat(frames, ignore_index=True)
+    frame.attrs["sections"] = frames[-1].attrs["sections"]
+    return frame
+
+def load_run(run_directory: str, regexes: list[str], strings: list[bytes]) -> pd.DataFrame:
+    """Reads the results stored by ResultsSink in a run directory into a tidy frame, with the same columns as read_sections().
+    Sections are the strings, in the order of the inputs, and pairs are in the order of the regexes, as in the CSV files.
+    Measures are kept as text, as they would be written in the CSV file.
+
+    :param str run_directory: the directory of the run
+    :param list[str] regexes: the regexes of the run, the segments only have their indexes
+    :param list[bytes] strings: the strings of the run, the segments only have their indexes
+    :raises Exception: if pyarrow is not installed or the run used different regexes or strings
+    :return pd.DataFrame: the pairs of the run
+    """
+    if pa is None:
+        raise Exception("pyarrow is needed to read the results of a run, install it with 'pip install pyarrow'")
+
+    with open(os.path.join(run_directory, MANIFEST_FILE), 'r') as f:
+        manifest = json.load(f)
+    if manifest["regexes_sha256"] != digest_items(regexes) or manifest["strings_sha256"] != digest_items(strings):
+        raise Exception("The results in '" + run_directory + "' are of different regexes or strings")
+
+    tables = [pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+              for path in sorted(glob.glob(os.path.join(glob.escape(run_directory), SEGMENT_PREFIX + "*" + SEGMENT_SUFFIX)))]
+    measures = pa.concat_tables(tables).to_pandas() if tables else pd.DataFrame(columns=["regex_index", "string_index", "measure", "value"])
+
+    # A pair executed again after a crash appears twice, the latest results are kept
+    measure_names = list(dict.fromkeys(measures["measure"]))
+    measures = measures.drop_duplicates(["string_index", "regex_index", "measure"], keep="last")
+    pairs = measures.pivot(index=["string_index", "regex_index"], columns="measure", values="value").sort_index()
+    pairs = pairs.reindex(columns=measure_names).fillna("").reset_index()
+
+    string_texts = np.array([str(string) for string in strings], dtype=object)
+    string_indexes = pairs["string_index"].to_numpy(dtype=np.int64)
+    frame = pd.DataFrame({
+        SECTION: np.unique(string_indexes, return_inverse=True)[1] if len(string_indexes) else string_indexes,
+        STRING: string_texts[string_indexes],
+        CHARS: np.fromiter((len(text) for text in string_texts), dtype=np.int64, count=len(string_texts))[string_indexes],
+        REGEX: np.array(regexes, dtype=object)[pairs["regex_index"].to_numpy(dtype=np.int64)],
+    })
+    for name in measure_names:
+        frame[name] = pairs[name].to_numpy()
+    frame.attrs["sections"] = len(np.unique(string_indexes))
+    return frame
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".arrow"
+JOURNAL_FILE = "journal.jsonl"
+MANIFEST_FILE = "run.json"
+
+def _schema() -> "pa.Schema":
+    """Gets the schema of the segments: one row for each measure of a regex on a string.
+    The value is stored as text, exactly as it is written in the CSV, and as a number when it is numeric.
+
+    :return pa.Schema: the schema
+    """
+    return pa.schema([
+        ("regex_index", pa.int32()),
+        ("string_index", pa.int32()),
+        ("measure", pa.string()),
+        ("value", pa.string()),
+        ("number", pa.float64()),
+    ])
+
+def digest_items(items: list[str|bytes]) -> str:
+    """Computes a digest of a list of regexes or strings, to check that a resumed run uses the same inputs.
+
+    :param list[str|bytes] items: the regexes or the strings
+    :return str: the hex digest
+    """
+    digest = hashlib.sha256()
+    for item in items:
+        data = item.encode("utf-8") if isinstance(item, str) else bytes(item)
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def measurer_key(names: str|list[str]) -> str:
+    """Gets the key that identifies a measurer in the journal.
+
+    :param str|list[str] names: the name(s) of the measure(s) of the measurer
+    :return str: the key
+    """
+    return json.dumps(names)
+
+class ResultsSink:
+    """Append-only storage of the results of a benchmark run, so that a crash or an interruption does not lose them.
+    Results are buffered and periodically written to a new Arrow IPC segment in the run directory. After a segment is written,
+    the (regex, measurer) pairs that it completes are appended to the journal, which is used to resume the run."""
+    def __init__(self, run_directory: str, regexes: list[str], strings: list[bytes], resume: bool=False, flush_rows: int=100000, flush_seconds: float=60.0) -> None:
+        """Opens the storage of a run.
+
+        :param str run_directory: the directory where segments and journal are stored
+        :param list[str] regexes: the regexes of the run, results refer to them by index
+        :param list[bytes] strings: the strings of the run, results refer to them by index
+        :param bool resume: if the results already in the directory should be kept, otherwise they are deleted, defaults to False
+        :param int flush_rows: write a segment when this many rows are buffered, defaults to 100000
+        :param float flush_seconds: write a segment when this many seconds passed since the last one, defaults to 60.0
+        :raises Exception: if pyarrow is not installed or the run to resume used different regexes or strings
+        """
+        if pa is None:
+            raise Exception("pyarrow is needed to store the results incrementally, install it with 'pip install pyarrow'")
+
+        self.run_directory = run_directory
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+
+        manifest = {"regexes": len(regexes), "regexes_sha256": digest_items(regexes), "strings": len(strings), "strings_sha256": digest_items(strings)}
+        manifest_path = os.path.join(run_directory, MANIFEST_FILE)
+        os.makedirs(run_directory, exist_ok=True)
+
+        if resume and os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                previous = json.load(f)
+            if previous != manifest:
+                raise Exception("Cannot resume the run in '" + run_directory + "': regexes or strings are different")
+        else:
+            for file_name in self._segment_files() + [JOURNAL_FILE]:
+                path = os.path.join(run_directory, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_atomically(manifest_path, json.dumps(manifest).encode("utf-8"))
+
+        self.done = set()
+        journal_path = os.path.join(run_directory, JOURNAL_FILE)
+        if os.path.exists(journal_path):
+            with open(journal_path, 'r') as f:
+                for line in f:
+                    # A line truncated by a crash is ignored, its pair will be executed again
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.done.add((entry["regex_index"], entry["measurer"]))
+
+        self._journal = open(journal_path, 'a')
+        self._next_segment = len(self._segment_files())
+        self._clear_buffer()
+        self._last_flush = time.monotonic()
+
+    def _segment_files(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.run_directory) if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+    def _clear_buffer(self) -> None:
+        self._columns = {name: [] for name in _schema().names}
+        self._pending_pairs = []
+
+    @staticmethod
+    def _write_atomically(path: str, data: bytes) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def is_done(self, regex_index: int, measurer: str) -> bool:
+        """Checks if a regex has already been measured by a measurer in this run.
+
+        :param int regex_index: the index of the regex
+        :param str measurer: the key of the measurer (see measurer_key())
+        :return bool: True if the results of the pair are stored
+        """
+        return (regex_index, measurer) in self.done
+
+    def append(self, regex_index: int, measurer: str, measure_names: list[str], results_per_string: list[list], string_indexes: list[int]=None) -> None:
+        """Stores the results of a regex on all the strings for a measurer, the pair will be done once they are written.
+
+        :param int regex_index: the index of the regex
+        :param str measurer: the key of the measurer (see measurer_key())
+        :param list[str] measure_names: the names of the measures of the measurer
+        :param list[list] results_per_string: for each string, the values of the measures
+        :param list[int] string_indexes: the index of the string of each result, if the regex was tested only on some strings, defaults to None
+        """
+        if string_indexes is None:
+            string_indexes = range(len(results_per_string))
+        for string_index, values in zip(string_indexes, results_per_string):
+            for measure_name, value in zip(measure_names, values):
+                self._columns["regex_index"].append(regex_index)
+                self._columns["string_index"].append(int(string_index))
+                self._columns["measure"].append(measure_name)
+                self._columns["value"].append(None if value is None else str(value))
+                self._columns["number"].append(float(value) if isinstance(value, (bool, int, float)) else None)
+        self._pending_pairs.append((regex_index, measurer))
+
+        if len(self._columns["measure"]) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered results to a new segment and marks their pairs as done in the journal."""
+        self._last_flush = time.monotonic()
+        if not self._pending_pairs:
+            return
+
+        table = pa.table(self._columns, schema=_schema())
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        segment_name = SEGMENT_PREFIX + str(self._next_segment).zfill(6) + SEGMENT_SUFFIX
+        self._write_atomically(os.path.join(self.run_directory, segment_name), sink.getvalue().to_pybytes())
+        self._next_segment += 1
+
+        # The journal is written after the segment, so a pair is never marked as done without its results
+        for regex_index, measurer in self._pending_pairs:
+            self._journal.write(json.dumps({"regex_index": regex_index, "measurer": measurer}) + "\n")
+            self.done.add((regex_index, measurer))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        self._clear_buffer()
+
+    def read_table(self) -> "pa.Table":
+        """Reads all the results written so far.
+        If a run crashed after writing a segment but before updating the journal, the results of its pairs appear twice:
+        the latest ones are those of the resumed run.
+
+        :return pa.Table: the results, in the order in which they were produced
+        """
+        tables = []
+        for segment_name in self._segment_files():
+            # Memory-mapped, the table references the file without copying it
+            source = pa.memory_map(os.path.join(self.run_directory, segment_name), 'r')
+            tables.append(pa.ipc.open_file(source).read_all())
+        if not tables:
+            return _schema().empty_table()
+        return pa.concat_tables(tables)
+
+    def close(self) -> None:
+        """Writes the buffered results and closes the journal."""
+        self.flush()
+        self._journal.close()
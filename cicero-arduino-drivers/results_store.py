@@ -0,0 +1,233 @@
+import csv
+import hashlib
+
+import numpy as np
+
+from inputs import take
+
+# NumPy types used to store the measures, measurers declare the Python type of each measure
+MEASURE_DTYPES = {bool: np.bool_, int: np.int64, float: np.float64}
+
+# 128 bit digest of the content of a string, equal strings have the same digest
+DIGEST_DTYPE = np.dtype([("high", "<u8"), ("low", "<u8")])
+
+def _string_digest(string: bytes) -> tuple[int,int]:
+    digest = hashlib.blake2b(bytes(string), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+def intern_strings(strings: list[bytes]) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Gives the same ID to equal strings, numbered in order of first appearance, reading the strings one at a time
+    and keeping only a digest of each distinct one, so that a lazy sequence of strings is never materialized.
+
+    :param list[bytes] strings: the strings
+    :return tuple[np.ndarray,np.ndarray,np.ndarray]: the ID of each string, the index of the first string of each ID
+                                                    and the sorted digests of the distinct strings with their IDs
+    """
+    digests = np.empty(len(strings), dtype=DIGEST_DTYPE)
+    for position, string in enumerate(strings):
+        digests[position] = _string_digest(string)
+    sorted_digests, first_indexes, inverse = np.unique(digests, return_index=True, return_inverse=True)
+    # np.unique numbers the strings by digest, renumber them by first appearance
+    order = np.argsort(first_indexes, kind="stable")
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.arange(len(order), dtype=np.int64)
+    return ids[inverse.reshape(-1)], first_indexes[order], (sorted_digests, ids)
+
+class ResultsStore:
+    """Compact in-memory storage of the results of a benchmark.
+    Regexes and strings are interned to integer IDs, equal regexes or strings share the same ID like they shared the same key
+    in the results dict. Strings are interned by a digest of their content, so that memory-mapped strings are not
+    copied on the heap, and are referenced by their index among the strings of the benchmark. Measures are stored in a NumPy structured array shaped [regex, string] with a field for each measure.
+    Measures whose type is not declared, or that get a value of a different type, are stored as Python objects."""
+    def __init__(self, regexes: list[str], strings: list[bytes], measure_names: list[str], measure_types: list[type]=None) -> None:
+        """Creates a new empty store.
+
+        :param list[str] regexes: the regexes of the benchmark
+        :param list[bytes] strings: the strings of the benchmark
+        :param list[str] measure_names: the names of all the measures, in the order of the columns of the CSV file
+        :param list[type] measure_types: the type of each measure (bool, int or float), None for any type, defaults to None
+        """
+        self.regex_ids = {}
+        for regex in regexes:
+            self.regex_ids.setdefault(regex, len(self.regex_ids))
+        self.regexes = list(self.regex_ids)
+        # The ID of each string of the benchmark, by index, and the first string of each ID
+        self.string_ids, self.first_indexes, (self._digests, self._digest_ids) = intern_strings(strings)
+        self.strings = take(strings, self.first_indexes)
+
+        self.measure_names = list(measure_names)
+        self.measure_indexes = {name: index for index, name in enumerate(self.measure_names)}
+        measure_types = measure_types or [None] * len(self.measure_names)
+        self.measure_types = dict(zip(self.measure_names, measure_types))
+        dtype = np.dtype([(name, MEASURE_DTYPES.get(measure_type, object)) for name, measure_type in zip(self.measure_names, measure_types)])
+
+        shape = (len(self.regexes), len(self.strings))
+        self.values = np.zeros(shape, dtype=dtype)
+        # If a (regex, string) pair has any result, even a null one, and if each measure has a value
+        self.present = np.zeros(shape, dtype=np.bool_)
+        self.filled = np.zeros(shape + (len(self.measure_names),), dtype=np.bool_)
+
+    def _promote_to_object(self, measure_name: str) -> None:
+        """Changes the type of a measure to Python objects, keeping its values.
+
+        :param str measure_name: the name of the measure
+        """
+        dtype = np.dtype([(name, object if name == measure_name else self.values.dtype[name]) for name in self.measure_names])
+        values = np.zeros(self.values.shape, dtype=dtype)
+        for name in self.measure_names:
+            values[name] = self.values[name]
+        self.values = values
+
+    def string_id(self, string: bytes) -> int:
+        """Gets the ID of a string.
+
+        :param bytes string: the string
+        :raises KeyError: if the string is not one of the strings of the benchmark
+        :return int: the ID of the string
+        """
+        digest = np.array(_string_digest(string), dtype=DIGEST_DTYPE)
+        position = int(np.searchsorted(self._digests, digest))
+        if position == len(self._digests) or self._digests[position] != digest:
+            raise KeyError(string)
+        return int(self._digest_ids[position])
+
+    def set_results(self, regex: str, string_indexes: np.ndarray|None, measure_names: list[str], results: list[list]) -> None:
+        """Stores the measures of a regex on a list of strings.
+
+        :param str regex: the regex
+        :param np.ndarray|None string_indexes: the indexes of the strings among the strings of the benchmark, None for all of them,
+                                               results beyond the length of this list are ignored
+        :param list[str] measure_names: the names of the measures, in the same order as in 'results'
+        :param list[list] results: for each string, the values of the measures, None for a missing value
+        """
+        regex_id = self.regex_ids[regex]
+        if string_indexes is None:
+            string_indexes = np.arange(len(self.string_ids))
+        pairs = list(zip(string_indexes, results))
+        if not pairs:
+            return
+        string_ids = self.string_ids[np.asarray(string_indexes, dtype=np.int64)[:len(pairs)]]
+        # A pair has results if it has at least one measure, even if its value is None
+        self.present[regex_id, string_ids[[len(values) > 0 for _, values in pairs]]] = True
+
+        for position, measure_name in enumerate(measure_names):
+            # Results can be shorter than the measures, like zip() does
+            column = [values[position] if len(values) > position else None for _, values in pairs]
+            present = np.fromiter((len(values) > position for _, values in pairs), dtype=np.bool_, count=len(pairs))
+            valid = np.fromiter((value is not None for value in column), dtype=np.bool_, count=len(column))
+
+            measure_index = self.measure_indexes[measure_name]
+            field = self.values.dtype[measure_name]
+            # Values of a different type would be formatted differently in the CSV file
+            if field != object and any(type(value) is not self.measure_types[measure_name] for value in column if value is not None):
+                self._promote_to_object(measure_name)
+                field = self.values.dtype[measure_name]
+
+            ids = string_ids[present]
+            self.filled[regex_id, ids, measure_index] = valid[present]
+            valid_ids = string_ids[valid]
+            if len(valid_ids) > 0:
+                if field == object:
+                    target = np.empty(len(valid_ids), dtype=object)
+                    target[:] = [value for value in column if value is not None]
+                else:
+                    target = np.array([value for value in column if value is not None], dtype=field)
+                self.values[measure_name][regex_id, valid_ids] = target
+
+    def set_text_results(self, regexes: list[str], regex_indexes: np.ndarray, string_indexes: np.ndarray, measure_names: np.ndarray, texts: np.ndarray) -> None:
+        """Stores measures given as the text written in the CSV file, like the ones read from a ResultsSink.
+        Measures that can't be parsed back to their type with the same text are stored as text.
+
+        :param list[str] regexes: the regexes of the benchmark, referenced by 'regex_indexes'
+        :param np.ndarray regex_indexes: for each measure, the index of its regex
+        :param np.ndarray string_indexes: for each measure, the index of its string among the strings of the benchmark
+        :param np.ndarray measure_names: for each measure, its name
+        :param np.ndarray texts: for each measure, its value as text, None if it is missing
+        """
+        if len(texts) == 0:
+            return
+        regex_ids = np.array([self.regex_ids[regex] for regex in regexes], dtype=np.int64)[regex_indexes]
+        string_ids = self.string_ids[np.asarray(string_indexes, dtype=np.int64)]
+        self.present[regex_ids, string_ids] = True
+
+        measure_names = np.asarray(measure_names, dtype=object)
+        texts = np.asarray(texts, dtype=object)
+        valid = np.fromiter((text is not None for text in texts), dtype=np.bool_, count=len(texts))
+        for measure_index, measure_name in enumerate(self.measure_names):
+            rows = measure_names == measure_name
+            self.filled[regex_ids[rows], string_ids[rows], measure_index] = valid[rows]
+
+            rows &= valid
+            if not rows.any():
+                continue
+            measure_texts = texts[rows].astype(str)
+
+            field = self.values.dtype[measure_name]
+            parsed = None
+            try:
+                if field == np.bool_:
+                    parsed = measure_texts == "True"
+                elif field != object:
+                    parsed = measure_texts.astype(field)
+            except ValueError:
+                parsed = None
+            if field != object and (parsed is None or not (parsed.astype(str) == measure_texts).all()):
+                self._promote_to_object(measure_name)
+                field = self.values.dtype[measure_name]
+
+            if field == object:
+                parsed = np.empty(len(measure_texts), dtype=object)
+                parsed[:] = measure_texts.tolist()
+            self.values[measure_name][regex_ids[rows], string_ids[rows]] = parsed
+
+    def get(self, regex: str, string: bytes, measure_name: str) -> bool|int|float|None:
+        """Gets a measure.
+
+        :param str regex: the regex
+        :param bytes string: the string
+        :param str measure_name: the name of the measure
+        :return bool|int|float|None: the value of the measure, None if it is missing
+        """
+        regex_id = self.regex_ids[regex]
+        string_id = self.string_id(string)
+        if not self.filled[regex_id, string_id, self.measure_indexes[measure_name]]:
+            return None
+        value = self.values[measure_name][regex_id, string_id]
+        # Convert NumPy scalars to Python values, objects are stored as they are
+        return value.item() if isinstance(value, np.generic) else value
+
+    def column_text(self, measure_name: str) -> np.ndarray:
+        """Formats all the values of a measure as they are written in the CSV file.
+
+        :param str measure_name: the name of the measure
+        :return np.ndarray: array of strings shaped [regex, string], empty for missing values
+        """
+        values = self.values[measure_name]
+        if values.dtype == object:
+            text = np.vectorize(str, otypes=[object])(values) if values.size else values.astype(object)
+        else:
+            # NumPy formats floats with the shortest representation, as str() does
+            text = values.astype(str).astype(object)
+        text[~self.filled[:, :, self.measure_indexes[measure_name]]] = ""
+        return text
+
+    def export_csv(self, path: str) -> None:
+        """Writes the results to a CSV file, in sections, one for each string with results, where each row contains a regex with all its measures.
+
+        :param str path: the path of the file
+        """
+        columns = np.stack([self.column_text(name) for name in self.measure_names], axis=-1) if self.measure_names else np.empty(self.present.shape + (0,), dtype=object)
+        regexes = np.array(self.regexes, dtype=object)
+
+        with open(path, 'w', newline='') as csvfile:
+            fout = csv.writer(csvfile, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+
+            for string_id in np.flatnonzero(self.present.any(axis=0)):
+                # First, write the string, then the headers of the columns, that are all the measure names
+                fout.writerow(['string: ', self.strings[string_id], '', ''])
+                fout.writerow(['regex', *self.measure_names])
+
+                # Then write the regexes and their associated results
+                regex_ids = np.flatnonzero(self.present[:, string_id])
+                rows = np.column_stack((regexes[regex_ids], columns[regex_ids, string_id]))
+                fout.writerows(rows.tolist())
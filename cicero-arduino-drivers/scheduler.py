@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from inputs import take
+from measurers import regular_expression_measurer
+
+# The measurer and the strings of a worker process, sent once when the process starts instead of with every regex
+_worker_measurer = None
+_worker_strings = None
+
+def _init_worker(measurer: regular_expression_measurer, strings: list[bytes]) -> None:
+    global _worker_measurer, _worker_strings
+    _worker_measurer = measurer
+    _worker_strings = strings
+
+def _execute_in_worker(regex: str, string_indexes: list[int]|None, options: dict) -> list[any]:
+    strings = _worker_strings if string_indexes is None else take(_worker_strings, string_indexes)
+    return _worker_measurer.execute_multiple_strings(regex=regex, strings=strings, **options)
+
+class MeasurerExecutors:
+    """Runs every measurer in its own executor, so that measurers overlap instead of waiting for each other.
+    Measurers that wait for a device (io_bound) get a single thread, so that the device is used by one regex at a time,
+    the others get a pool of processes that execute different regexes in parallel."""
+    def __init__(self, measurer_list: list[regular_expression_measurer], strings: list[bytes], options: dict, cpu_workers: int=None) -> None:
+        """Starts the executors.
+
+        :param list[regular_expression_measurer] measurer_list: the measurers
+        :param list[bytes] strings: the strings that every regex is matched on
+        :param dict options: the keyword arguments of execute_multiple_strings(), except for the regex and the strings
+        :param int cpu_workers: the number of processes of each measurer that is not io_bound, defaults to the number of CPUs
+        """
+        self.strings = strings
+        self.options = options
+        self.executors = {}
+        self.workers = 0
+        for measurer in measurer_list:
+            if measurer.io_bound:
+                executor = ThreadPoolExecutor(max_workers=1)
+                self.workers += 1
+            else:
+                workers = cpu_workers or os.cpu_count() or 1
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(measurer, strings))
+                self.workers += workers
+            self.executors[id(measurer)] = executor
+
+    def submit(self, measurer: regular_expression_measurer, regex: str, string_indexes: list[int]=None) -> Future:
+        """Schedules the measure of a regex on the strings.
+
+        :param regular_expression_measurer measurer: the measurer
+        :param str regex: the regex
+        :param list[int] string_indexes: the indexes of the strings to test, None for all of them, defaults to None
+        :return Future: the future of the results of execute_multiple_strings()
+        """
+        executor = self.executors[id(measurer)]
+        if isinstance(executor, ProcessPoolExecutor):
+            # Only the indexes are sent, the worker already has the strings
+            return executor.submit(_execute_in_worker, regex, string_indexes, self.options)
+        strings = self.strings if string_indexes is None else take(self.strings, string_indexes)
+        return executor.submit(measurer.execute_multiple_strings, regex=regex, strings=strings, **self.options)
+
+    def shutdown(self, cancel: bool=False) -> None:
+        """Stops the executors, waiting for the measures in execution.
+
+        :param bool cancel: if the measures not yet started should be cancelled, defaults to False
+        """
+        for executor in self.executors.values():
+            executor.shutdown(wait=True, cancel_futures=cancel)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from results_sink import digest_items
+
+_MASK64 = (1 << 64) - 1
+# Odd constant used to combine the hash of the regex with the one of the string
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+def parse_shard(text: str) -> tuple[int,int]:
+    """Parses a shard given as 'i/N', the i-th of N shards counting from 0.
+
+    :param str text: the shard
+    :raises Exception: if the shard is not valid
+    :return tuple[int,int]: the index of the shard and the number of shards
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise Exception("Shard must be given as 'i/N', found '" + text + "'")
+    if count < 1 or not 0 <= index < count:
+        raise Exception("Shard index must be between 0 and " + str(count - 1) + ", found '" + text + "'")
+    return index, count
+
+def item_hashes(items: list[str|bytes]) -> np.ndarray:
+    """Computes a stable 64 bit hash of each regex or string, the same on every host and Python version.
+
+    :param list[str|bytes] items: the regexes or the strings
+    :return np.ndarray: the hashes, as uint64
+    """
+    hashes = np.empty(len(items), dtype=np.uint64)
+    for position, item in enumerate(items):
+        data = item.encode("utf-8") if isinstance(item, str) else bytes(item)
+        hashes[position] = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+    return hashes
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Finalizer of SplitMix64, so that every bit of the input affects the shard.
+
+    :param np.ndarray values: uint64 values
+    :return np.ndarray: the mixed values
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+class Shard:
+    """Deterministic slice of the (regex, string) pairs of a benchmark.
+    A pair belongs to a shard depending only on the content of its regex and string, so that hosts running
+    different shards with the same inputs execute disjoint slices whose union is the whole benchmark."""
+    def __init__(self, index: int, count: int, regexes: list[str], strings: list[bytes]) -> None:
+        """Creates a shard.
+
+        :param int index: the index of the shard, from 0 to count - 1
+        :param int count: the number of shards
+        :param list[str] regexes: the regexes of the benchmark
+        :param list[bytes] strings: the strings of the benchmark
+        """
+        self.index = index
+        self.count = count
+        self.regex_hashes = item_hashes(regexes)
+        self.string_hashes = item_hashes(strings)
+
+    def _in_shard(self, regex_hash: int, string_hashes: np.ndarray) -> np.ndarray:
+        combined = np.uint64((int(regex_hash) * _GOLDEN_GAMMA) & _MASK64) ^ string_hashes
+        return _mix(combined) % np.uint64(self.count) == np.uint64(self.index)
+
+    def string_indexes(self, regex_index: int) -> np.ndarray:
+        """Gets the strings that a regex must be tested on in this shard.
+
+        :param int regex_index: the index of the regex
+        :return np.ndarray: the indexes of the strings
+        """
+        return np.flatnonzero(self._in_shard(self.regex_hashes[regex_index], self.string_hashes))
+
+    def execution_count(self) -> int:
+        """Counts the executions of a measurer in this shard, one for each regex and each of its strings.
+
+        :return int: the number of executions
+        """
+        return sum(len(self.string_indexes(regex_index)) for regex_index in range(len(self.regex_hashes)))
+
+    def pair_count(self) -> int:
+        """Counts the distinct (regex, string) pairs in this shard, equal regexes or strings are counted once like in the results.
+
+        :return int: the number of pairs
+        """
+        string_hashes = np.unique(self.string_hashes)
+        return int(sum(np.count_nonzero(self._in_shard(regex_hash, string_hashes)) for regex_hash in np.unique(self.regex_hashes)))
+
+    def manifest(self, regexes: list[str], strings: list[bytes], inputs: dict, measure_names: list[str], measure_types: list[type], csv_file: str, stored_pairs: int) -> dict:
+        """Describes the output of this shard, for merge_shards.py.
+
+        :param list[str] regexes: the regexes of the benchmark
+        :param list[bytes] strings: the strings of the benchmark
+        :param dict inputs: the arguments of benchmark.py that select the regexes and the strings (see load_inputs())
+        :param list[str] measure_names: the names of the measures
+        :param list[type] measure_types: the types of the measures
+        :param str csv_file: the name of the CSV file with the results of this shard
+        :param int stored_pairs: the number of pairs with results in the CSV file
+        :return dict: the manifest
+        """
+        return {
+            "shard": self.index,
+            "shards": self.count,
+            "inputs": inputs,
+            "regexes": len(regexes),
+            "regexes_sha256": digest_items(regexes),
+            "strings": len(strings),
+            "strings_sha256": digest_items(strings),
+            "measures": measure_names,
+            "measure_types": [measure_type.__name__ if measure_type else None for measure_type in measure_types],
+            "pairs": self.pair_count(),
+            "stored_pairs": stored_pairs,
+            "csv": csv_file,
+        }
+
+def write_manifest(path: str, manifest: dict) -> None:
+    """Writes the manifest of a shard next to its results.
+
+    :param str path: the path of the file
+    :param dict manifest: the manifest (see Shard.manifest())
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the drivers import each other as top-level modules, as when the scripts are run from their folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+import numpy as np
+
+import adaptive
+from adaptive import AdaptiveSampler, FeistelPermutation
+
+def sampled_pairs(sampler: AdaptiveSampler) -> np.ndarray:
+    pairs = [regex_index * sampler.strings_num + string_indexes for regex_index, string_indexes in sampler.blocks()]
+    return np.concatenate(pairs)
+
+def test_feistel_permutation_is_a_permutation():
+    for size in (1, 2, 7, 1000, 4097):
+        permutation = FeistelPermutation(size, np.random.default_rng(size))
+        values = np.concatenate([permutation[start:start + 100] for start in range(0, size, 100)])
+        assert sorted(values.tolist()) == list(range(size))
+
+def test_feistel_permutation_depends_on_the_seed():
+    first = FeistelPermutation(10000, np.random.default_rng(1))[0:10000]
+    second = FeistelPermutation(10000, np.random.default_rng(2))[0:10000]
+    assert not (first == second).all()
+    # Consecutive positions are not a fixed step apart, as in an affine order
+    assert len(np.unique(np.diff(first))) > 100
+
+def test_sampler_executes_every_pair_once(monkeypatch):
+    strings = [b"s%d" % index for index in range(50)]
+    for max_shuffled in (adaptive.MAX_SHUFFLED_PAIRS, 10):
+        monkeypatch.setattr(adaptive, "MAX_SHUFFLED_PAIRS", max_shuffled)
+        sampler = AdaptiveSampler(7, strings, target_precision=0.0, block_size=64, seed=3)
+        pairs = sampled_pairs(sampler)
+        assert sorted(pairs.tolist()) == list(range(7 * len(strings)))
+        # The same seed gives the same order
+        assert (sampled_pairs(AdaptiveSampler(7, strings, target_precision=0.0, block_size=64, seed=3)) == pairs).all()
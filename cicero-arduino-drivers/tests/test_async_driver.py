@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from CiceroSerial import framing
+from CiceroSerial.async_driver import AsyncCiceroOnArduino
+from CiceroSerial.bundle import Bundle, ProgramStatus, compile_options, write_bundle
+from CiceroSerial.bytecode_cache import BytecodeCache
+from CiceroSerial.driver import RegexError
+from CiceroSerial.framing import FrameType
+from CiceroSerial.isa import RAM_QWORDS
+
+class FakeWriter:
+    """Stands for the writer of the serial connection, pyserial-asyncio is not needed."""
+    def __init__(self) -> None:
+        self.written = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+async def connected_driver(bundle: Bundle=None) -> AsyncCiceroOnArduino:
+    driver = AsyncCiceroOnArduino("../cicero_compiler", "fake", bytecode_cache=BytecodeCache(None), bundle=bundle)
+    driver._reader = asyncio.StreamReader()
+    driver._writer = FakeWriter()
+    driver._window_semaphore = asyncio.Semaphore(driver.window)
+    driver._reader_task = asyncio.create_task(driver._read_frames())
+    return driver
+
+def test_requests_after_a_broken_stream_fail():
+    async def run():
+        driver = await connected_driver()
+        driver.regex_loaded = True
+        future = await driver._submit(FrameType.BUDGET, framing.BUDGET_PAYLOAD.pack(0), FrameType.ACK)
+        # A frame with a wrong CRC: the stream is not in sync anymore
+        frame = bytearray(framing.encode_frame(FrameType.ACK))
+        frame[-1] ^= 0xFF
+        driver._reader.feed_data(bytes(frame))
+        with pytest.raises(Exception):
+            await asyncio.wait_for(future, 1)
+
+        with pytest.raises(Exception, match="broken"):
+            await asyncio.wait_for(driver.match(b"ab"), 1)
+        await driver.close()
+
+    asyncio.run(run())
+
+def test_answers_resolve_requests_in_order():
+    async def run():
+        driver = await connected_driver()
+        first = await driver._submit(FrameType.TEXT, b"ab", FrameType.RESULT)
+        second = await driver._submit(FrameType.TEXT, b"cd", FrameType.RESULT)
+        driver._reader.feed_data(framing.encode_frame(FrameType.RESULT, framing.RESULT_PAYLOAD.pack(2, 24)))
+        driver._reader.feed_data(framing.encode_frame(FrameType.RESULT, framing.RESULT_PAYLOAD.pack(3, 48)))
+        assert driver._parse_result(await asyncio.wait_for(first, 1))[:2] == (True, 24)
+        assert driver._parse_result(await asyncio.wait_for(second, 1))[:2] == (False, 48)
+        await driver.close()
+
+    asyncio.run(run())
+
+def test_requests_fail_when_arduino_does_not_answer():
+    async def run():
+        driver = await connected_driver()
+        driver.regex_loaded = True
+        driver.timeout = 0.1
+        first = asyncio.ensure_future(driver.match(b"ab"))
+        second = asyncio.ensure_future(driver.match(b"cd"))
+        with pytest.raises(Exception, match="did not answer"):
+            await first
+        with pytest.raises(Exception, match="did not answer"):
+            await asyncio.wait_for(second, 1)
+
+        with pytest.raises(Exception, match="broken"):
+            await asyncio.wait_for(driver.match(b"ef"), 1)
+        await driver.close()
+
+    asyncio.run(run())
+
+def test_regex_too_large_for_cicero_is_not_sent(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, ["a"], [(ProgramStatus.OK, bytes(RAM_QWORDS * 8))], "pythonre", compile_options())
+
+    async def run():
+        with Bundle(path) as bundle:
+            driver = await connected_driver(bundle)
+            with pytest.raises(RegexError, match="does not fit"):
+                await driver.load_regex("a")
+            assert driver._writer.written == b""
+            await driver.close()
+
+    asyncio.run(run())
+
+def test_strings_are_sent_packed_when_arduino_supports_it():
+    async def run():
+        driver = await connected_driver()
+        driver.regex_loaded = True
+        driver.protocol_version = 2
+        match = asyncio.ensure_future(driver.match(b"ab"))
+        await asyncio.sleep(0)
+        driver._reader.feed_data(framing.encode_frame(FrameType.RESULT, framing.RESULT_PAYLOAD.pack(2, 24)))
+        assert (await asyncio.wait_for(match, 1))[:2] == (True, 24)
+
+        expected = bytearray(framing.packed_text_frame_size(2))
+        framing.pack_text_frame_into(expected, 0, b"ab")
+        assert driver._writer.written == expected
+        await driver.close()
+
+    asyncio.run(run())
@@ -0,0 +1,16 @@
+from CiceroSerial.bundle import Bundle, ProgramStatus, compile_options, write_bundle
+
+PROGRAMS = [(ProgramStatus.OK, b"\x40\x61\x00\x00"), (ProgramStatus.COMPILE_ERROR, b"ValueError: unbalanced parenthesis")]
+
+def test_bundle_records_the_compiler_version(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, ["a", "b("], PROGRAMS, "pythonre", compile_options(), "src-0123456789abcdef")
+    with Bundle(path) as bundle:
+        assert bundle.compiler_version == "src-0123456789abcdef"
+        assert bundle.code(bundle.find("a")) == PROGRAMS[0][1]
+        assert bundle.matches_options("pythonre", compiler_version="src-0123456789abcdef")
+        # Programs of another compiler must be compiled again
+        assert not bundle.matches_options("pythonre", compiler_version="src-fedcba9876543210")
+        # Without a compiler the bundle is the only source of programs
+        assert bundle.matches_options("pythonre")
+        assert not bundle.matches_options("pcre")
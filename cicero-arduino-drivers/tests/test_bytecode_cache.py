@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+from CiceroSerial.bytecode_cache import BytecodeCache, get_compiler_version
+
+@pytest.fixture
+def fake_compiler(tmp_path, monkeypatch):
+    """A compiler without __version__, made of more than one module."""
+    compiler_dir = tmp_path / "cicero_compiler"
+    (compiler_dir / "frontend").mkdir(parents=True)
+    (compiler_dir / "re2compiler.py").write_text("def compile(**kwargs):\n    return ''\n")
+    (compiler_dir / "frontend" / "parser.py").write_text("RULES = 1\n")
+    monkeypatch.syspath_prepend(str(compiler_dir))
+    sys.modules.pop("re2compiler", None)
+    yield compiler_dir
+    # Other tests run without a compiler
+    sys.modules.pop("re2compiler", None)
+
+def test_compiler_version_covers_every_module(fake_compiler):
+    version = get_compiler_version()
+    assert version.startswith("src-")
+    (fake_compiler / "frontend" / "parser.py").write_text("RULES = 2\n")
+    assert get_compiler_version() != version
+
+def test_overwrite_does_not_grow_disk_size(tmp_path):
+    cache = BytecodeCache(str(tmp_path / "cache"))
+    cache.put("ab" * 32, b"\x00" * 100)
+    cache.put("ab" * 32, b"\x00" * 60)
+    assert cache.stats()["disk_bytes"] == 60
@@ -0,0 +1,56 @@
+import csv
+
+import numpy as np
+import pytest
+
+from compare_results import CYCLES_MEASURE, MATCH_MEASURE, ALL_REGEXES, ResultSet, compare_result_sets
+
+REGEXES = [f"r{index}" for index in range(8)]
+STRINGS = 40
+
+def write_results(path, timeout_every: int=0, legacy_timeouts: bool=False, seed: int=0) -> None:
+    """Writes a results file as benchmark.py does, with a timeout every 'timeout_every' pairs."""
+    rng = np.random.default_rng(seed)
+    pair = 0
+    with open(path, 'w', newline='') as csvfile:
+        fout = csv.writer(csvfile)
+        for string in range(STRINGS):
+            fout.writerow(['string: ', f"string{string}", '', ''])
+            fout.writerow(['regex', MATCH_MEASURE, CYCLES_MEASURE])
+            for regex in REGEXES:
+                pair += 1
+                if timeout_every and pair % timeout_every == 0:
+                    fout.writerow([regex, "False" if legacy_timeouts else "TIMEOUT", "TIMEOUT"])
+                else:
+                    fout.writerow([regex, str(bool(rng.integers(2))), str(int(rng.integers(1000, 1100)))])
+
+@pytest.mark.parametrize("legacy_timeouts", [False, True])
+def test_timeouts_are_infinitely_slow(tmp_path, legacy_timeouts):
+    path = tmp_path / "results.csv"
+    write_results(path, timeout_every=4, legacy_timeouts=legacy_timeouts)
+
+    results = ResultSet(str(path))
+    assert len(results.cycles) == len(REGEXES) * STRINGS
+    assert np.isinf(results.cycles).sum() == len(REGEXES) * STRINGS // 4
+    assert (results.throughput[np.isinf(results.cycles)] == 0).all()
+
+@pytest.mark.parametrize("legacy_timeouts", [False, True])
+def test_timeouts_are_a_regression(tmp_path, legacy_timeouts):
+    baseline, candidate = tmp_path / "baseline.csv", tmp_path / "candidate.csv"
+    write_results(baseline)
+    write_results(candidate, timeout_every=4, legacy_timeouts=legacy_timeouts, seed=1)
+
+    report = compare_result_sets(str(baseline), str(candidate), test="bootstrap", per_regex=False, seed=0)
+    row = report[report["regex"] == ALL_REGEXES].iloc[0]
+    assert row["timeouts_baseline"] == 0
+    assert row["timeouts_candidate"] == len(REGEXES) * STRINGS // 4
+    assert np.isinf(row["slowdown"])
+    assert row["regression"]
+
+def test_same_results_are_not_a_regression(tmp_path):
+    baseline, candidate = tmp_path / "baseline.csv", tmp_path / "candidate.csv"
+    write_results(baseline)
+    write_results(candidate, seed=1)
+
+    report = compare_result_sets(str(baseline), str(candidate), test="bootstrap", seed=0)
+    assert not report["regression"].any()
@@ -0,0 +1,24 @@
+import pytest
+
+from CiceroSerial.bytecode_cache import BytecodeCache
+from CiceroSerial.driver import CiceroOnArduino
+from test_pool import bundle, emulators
+
+LONG = b"x" * 3000
+SHORT = b"x" * 10
+
+@pytest.fixture
+def driver(emulators, bundle):
+    driver = CiceroOnArduino("../cicero_compiler", emulators[0].port, timeout=0.5, bytecode_cache=BytecodeCache(None), bundle=bundle)
+    driver.load_regex("ab")
+    yield driver
+    driver.arduino.close()
+
+def test_budget_stops_long_executions(driver):
+    results = driver.test_strings([LONG, SHORT, LONG], [100, 100, 100])
+    assert [result for result, _ in results] == [CiceroOnArduino.CICERO_TIMEOUT, CiceroOnArduino.MATCH_NOT_FOUND, CiceroOnArduino.CICERO_TIMEOUT]
+
+def test_string_without_limit_removes_the_limit_of_its_batch(driver):
+    for no_limit in (0, None):
+        results = driver.test_strings([LONG, SHORT, LONG], [100, 100, no_limit])
+        assert all(result == CiceroOnArduino.MATCH_NOT_FOUND for result, _ in results)
@@ -0,0 +1,45 @@
+import re
+import sys
+import types
+
+import pytest
+
+import measurers
+from measurers import RESULT_measurer
+
+STRINGS = [b"xaby", b"ab", b"cd", b"ab"]
+
+@pytest.fixture
+def golden_model(monkeypatch):
+    """A golden model that counts the translations of the regexes, the compiler is not needed."""
+    module = types.ModuleType("golden_model")
+    module.translations = []
+
+    def translate_regex(regex, no_prefix=True, no_postfix=True, frontend="pythonre"):
+        module.translations.append(regex)
+        return re.compile((("\\A" if no_prefix else "") + "(?:" + regex + ")" + ("\\Z" if no_postfix else "")).encode())
+
+    def get_golden_model_result(regex, string, no_prefix=True, no_postfix=True, frontend="pythonre"):
+        return translate_regex(regex, no_prefix, no_postfix, frontend).search(string) is not None
+
+    module.translate_regex = translate_regex
+    module.get_golden_model_result = get_golden_model_result
+    monkeypatch.setitem(sys.modules, "golden_model", module)
+    measurers._golden_model_pattern.cache_clear()
+    yield module
+    measurers._golden_model_pattern.cache_clear()
+
+def test_regex_is_translated_once_for_all_the_batches(golden_model):
+    measurer = RESULT_measurer()
+    assert measurer.execute_multiple_strings("ab", STRINGS) == [True, True, False, True]
+    assert measurer.execute_multiple_strings("ab", STRINGS[:2]) == [True, True]
+    assert golden_model.translations == ["ab"]
+    # Anchors change the translation
+    assert measurer.execute_multiple_strings("ab", STRINGS, no_prefix=True, no_postfix=True) == [False, True, False, True]
+    assert golden_model.translations == ["ab", "ab"]
+
+def test_regex_that_does_not_translate_has_no_results(golden_model):
+    measurer = RESULT_measurer()
+    assert measurer.execute_multiple_strings("ab(", STRINGS) == [None] * len(STRINGS)
+    with pytest.raises(re.error):
+        measurer.execute_multiple_strings("ab(", STRINGS, skipException=False)
@@ -0,0 +1,140 @@
+import pytest
+
+from CiceroSerial import framing
+from CiceroSerial.bundle import ProgramStatus, compile_options, write_bundle, Bundle
+from CiceroSerial.bytecode_cache import BytecodeCache
+from CiceroSerial.driver import CiceroOnArduino, RegexError
+from CiceroSerial.emulator import CiceroEmulator
+from CiceroSerial.framing import FrameType
+from CiceroSerial.isa import OPCODE_SHIFT, Opcode
+from CiceroSerial.pool import CiceroPool
+
+def instruction(opcode: Opcode, data: int=0) -> bytes:
+    return ((opcode << OPCODE_SHIFT) | data).to_bytes(2, "big")
+
+def search_program(literal: str) -> bytes:
+    """Bytecode that finds the literal anywhere in the string, as the compiler would produce without prefix and postfix anchors."""
+    code = instruction(Opcode.SPLIT, 3) + instruction(Opcode.MATCH_ANY) + instruction(Opcode.JMP, 0)
+    code += b"".join(instruction(Opcode.MATCH, ord(char)) for char in literal)
+    return code + instruction(Opcode.ACCEPT_PARTIAL)
+
+# Regexes of the tests: the bundle replaces the compiler, that is not needed to run them
+PROGRAMS = {
+    "ab": (ProgramStatus.OK, search_program("ab")),
+    "cd": (ProgramStatus.OK, search_program("cd")),
+    "bad(": (ProgramStatus.COMPILE_ERROR, b"missing )"),
+}
+STRINGS = [b"xxab", b"cdxx", b"", b"abcd", b"xyz" * 20, b"a" * 100 + b"b"] * 4
+
+@pytest.fixture
+def bundle(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, list(PROGRAMS), list(PROGRAMS.values()), "pythonre", compile_options())
+    with Bundle(path) as bundle:
+        yield bundle
+
+@pytest.fixture
+def emulators():
+    emulators = [CiceroEmulator() for _ in range(2)]
+    for emulator in emulators:
+        emulator.start()
+    yield emulators
+    for emulator in emulators:
+        if not emulator._stopped:
+            emulator.stop()
+
+def make_pool(emulators, bundle, **kwargs) -> CiceroPool:
+    return CiceroPool("../cicero_compiler", [emulator.port for emulator in emulators], timeout=0.5, bytecode_cache=BytecodeCache(None), bundle=bundle, **kwargs)
+
+def expected(literal: str) -> list[bool]:
+    return [literal.encode() in string for string in STRINGS]
+
+def test_pool_shards_strings(emulators, bundle):
+    pool = make_pool(emulators, bundle, chunk_size=5)
+    try:
+        for regex in ("ab", "cd"):
+            results = pool.load_regex_and_test_strings(regex, STRINGS)
+            assert [result[0] for result in results] == expected(regex)
+        assert all(emulator.executions > 0 for emulator in emulators)
+    finally:
+        pool.close()
+
+def test_regex_error_does_not_kill_boards(emulators, bundle):
+    pool = make_pool(emulators, bundle, chunk_size=5, max_attempts=3)
+    try:
+        with pytest.raises(RegexError):
+            pool.load_regex_and_test_strings("bad(", STRINGS)
+        # Not in the bundle: the compiler is not available here, so it fails to compile too
+        with pytest.raises(RegexError):
+            pool.load_regex_and_test_strings("not in bundle", STRINGS)
+        assert all(status["alive"] for status in pool.stats().values())
+
+        results = pool.load_regex_and_test_strings("ab", STRINGS)
+        assert [result[0] for result in results] == expected("ab")
+    finally:
+        pool.close()
+
+def test_jobs_of_a_dead_board_are_retried(emulators, bundle):
+    pool = make_pool(emulators, bundle, chunk_size=5)
+    try:
+        emulators[0].stop()
+        results = pool.load_regex_and_test_strings("cd", STRINGS)
+        assert [result[0] for result in results] == expected("cd")
+        stats = pool.stats()
+        assert not stats[emulators[0].port]["alive"]
+        assert stats[emulators[1].port]["alive"]
+    finally:
+        pool.close()
+
+def test_driver_rejects_code_too_large(emulators, tmp_path):
+    path = str(tmp_path / "large.bin")
+    write_bundle(path, ["large"], [(ProgramStatus.OK, search_program("a" * 4096))], "pythonre", compile_options())
+    with Bundle(path) as bundle:
+        driver = CiceroOnArduino("../cicero_compiler", emulators[0].port, timeout=0.5, bytecode_cache=BytecodeCache(None), bundle=bundle)
+        try:
+            with pytest.raises(RegexError):
+                driver.load_regex("large")
+            assert driver.regex_uploads == 0
+        finally:
+            driver.arduino.close()
+
+def drop_next_result(emulator: CiceroEmulator) -> None:
+    """Loses the next result frame sent by the emulator, as a glitch of the serial link would."""
+    write = emulator._write
+
+    def dropping_write(data: bytes) -> None:
+        if data[:1] == bytes([framing.FRAME_MAGIC]) and framing.decode_header(data[:framing.FRAME_HEADER.size])[0] == FrameType.RESULT:
+            emulator._write = write
+            return
+        write(data)
+    emulator._write = dropping_write
+
+def test_board_is_recovered_after_a_timeout(emulators, bundle):
+    pool = make_pool(emulators, bundle, chunk_size=5)
+    try:
+        pool.load_regex_and_test_strings("ab", STRINGS)
+        drop_next_result(emulators[0])
+        assert [result[0] for result in pool.load_regex_and_test_strings("ab", STRINGS)] == expected("ab")
+        jobs_done = pool.stats()[emulators[0].port]["jobs_done"]
+
+        assert [result[0] for result in pool.load_regex_and_test_strings("cd", STRINGS)] == expected("cd")
+        stats = pool.stats()[emulators[0].port]
+        assert stats["alive"]
+        assert stats["jobs_done"] > jobs_done
+    finally:
+        pool.close()
+
+def test_dead_board_is_probed_again(emulators, bundle):
+    pool = make_pool(emulators, bundle, chunk_size=5, max_recoveries=0, probe_interval=0.0)
+    try:
+        drop_next_result(emulators[0])
+        assert [result[0] for result in pool.load_regex_and_test_strings("ab", STRINGS)] == expected("ab")
+        assert not pool.stats()[emulators[0].port]["alive"]
+
+        jobs_done = pool.stats()[emulators[0].port]["jobs_done"]
+        assert [result[0] for result in pool.load_regex_and_test_strings("cd", STRINGS)] == expected("cd")
+        stats = pool.stats()[emulators[0].port]
+        assert stats["alive"]
+        assert stats["jobs_done"] > jobs_done
+    finally:
+        pool.close()
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from CiceroSerial.bundle import ProgramStatus, compile_options, write_bundle, Bundle
+from CiceroSerial.emulator import CiceroEmulator
+from CiceroSerial.isa import Opcode
+from measurers import CiceroRuleset_measurer
+from test_pool import STRINGS, expected, instruction, search_program
+
+def union_program(first: str, second: str) -> bytes:
+    """Bytecode that finds either literal anywhere in the string."""
+    code = instruction(Opcode.SPLIT, 3) + instruction(Opcode.MATCH_ANY) + instruction(Opcode.JMP, 0)
+    second_start = 4 + len(first) + 1
+    code += instruction(Opcode.SPLIT, second_start)
+    code += b"".join(instruction(Opcode.MATCH, ord(char)) for char in first) + instruction(Opcode.ACCEPT_PARTIAL)
+    return code + b"".join(instruction(Opcode.MATCH, ord(char)) for char in second) + instruction(Opcode.ACCEPT_PARTIAL)
+
+PROGRAMS = {
+    "ab": (ProgramStatus.OK, search_program("ab")),
+    "cd": (ProgramStatus.OK, search_program("cd")),
+    "(ab)|(cd)": (ProgramStatus.OK, union_program("ab", "cd")),
+    "bad(": (ProgramStatus.COMPILE_ERROR, b"missing )"),
+}
+REGEXES = ["ab", "cd", "bad("]
+
+@pytest.fixture
+def measurer(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, list(PROGRAMS), list(PROGRAMS.values()), "pythonre", compile_options())
+    emulator = CiceroEmulator()
+    emulator.start()
+    with Bundle(path) as bundle:
+        measurer = CiceroRuleset_measurer(emulator.port, REGEXES, "pythonre", 128, bundle=bundle)
+        yield measurer
+        measurer.cicero.arduino.close()
+    emulator.stop()
+
+def test_ruleset_is_executed_once_for_all_the_regexes(measurer, tmp_path):
+    assert measurer.ruleset.groups == [[0, 1], [2]]
+    assert measurer.execute_multiple_strings("ab", STRINGS) == expected("ab")
+    loads = measurer.ruleset.regex_loads
+    assert measurer.execute_multiple_strings("cd", STRINGS) == expected("cd")
+    assert measurer.ruleset.regex_loads == loads
+    # A regex that can't be executed has no results, the other groups are still executed
+    assert measurer.execute_multiple_strings("bad(", STRINGS) == [None] * len(STRINGS)
+
+    path = str(tmp_path / "ruleset.json")
+    measurer.export_json(path)
+    with open(path) as f:
+        report = json.load(f)
+    assert report["group_count"] == 2
+    assert report["executions_without_groups"] == len(REGEXES) * len(STRINGS)
+    assert list(report["errors"]) == ["bad("]
@@ -122,6 +122,7 @@ void Cicero_::begin() {
   setupFPGA();
   
   strStartAddr = 0;
+  cycleBudget = 0;
 }
 
 /*********************************************
@@ -224,28 +225,37 @@ void Cicero_::loadStringAndStart(String str) {
   uint8_t strBytes[str.length()];
   convertStringToBytes(str, strBytes);
 
-  // Calculate the address of the first and the last byte as if the RAM was addressed by bytes
-  // This is needed by Cicero to understand where to start and stop reading the string
-  // Note that the start of the string will always be aligned with the start of a qword
-  uint32_t strStartByteAddr = strStartAddr * 8;
-  uint32_t strEndByteAddr = strStartByteAddr + str.length();
+  loadStringAndStart(str.length(), strBytes);
+}
 
-  int qwordsToWrite = ceil(str.length() / 8.0);
+void Cicero_::loadStringAndStart(int numBytes, uint8_t str[]) {
+  int qwordsToWrite = ceil(numBytes / 8.0);
   uint64_t qwords[qwordsToWrite];
 
-  for (int i = 0; i < str.length(); i = i + 8) {
+  for (int i = 0; i < numBytes; i = i + 8) {
     uint64_t qword = 0;
     
     for (int j = 0; j < 8; j++) {
-      if (i + j >= str.length()) break;
+      if (i + j >= numBytes) break;
       // The string needs to be written in RAM as little-endian refering to bytes
       // So we need to write the first byte in the least significant byte and the last byte in the most significant byte
-      qword = qword | ((uint64_t) strBytes[i + j]) << 8 * j;
+      qword = qword | ((uint64_t) str[i + j]) << 8 * j;
     }
 
     qwords[i / 8] = qword;
   }
 
+  loadPackedStringAndStart(numBytes, qwords);
+}
+
+void Cicero_::loadPackedStringAndStart(int numBytes, uint64_t qwords[]) {
+  // Calculate the address of the first and the last byte as if the RAM was addressed by bytes
+  // This is needed by Cicero to understand where to start and stop reading the string
+  // Note that the start of the string will always be aligned with the start of a qword
+  uint32_t strStartByteAddr = strStartAddr * 8;
+  uint32_t strEndByteAddr = strStartByteAddr + numBytes;
+
+  int qwordsToWrite = ceil(numBytes / 8.0);
   writeQWordsToRAM(qwordsToWrite, qwords, strStartAddr);
 
   writeRegister32(VIR_START_CC_POINTER, strStartByteAddr);
@@ -261,6 +271,23 @@ uint32_t Cicero_::getStatus() {
   return readRegister32(VIR_STATUS);
 }
 
+void Cicero_::setCycleBudget(uint32_t cycleBudget) {
+  this->cycleBudget = cycleBudget;
+}
+
+uint32_t Cicero_::getStatusWithinBudget() {
+  // The time is taken before reading the status, and the start time after starting CICERO, so if it is still running
+  // it has run for at least this time: the time spent polling the FPGA is never counted as cycles of the execution
+  unsigned long execTime = getExecTime();
+  uint32_t status = getStatus();
+  // The margin covers the resolution of micros(), a runaway execution is stopped late by at most the margin and one poll
+  if (status == CICERO_STATUS_RUNNING && cycleBudget > 0 && execTime > CICERO_BUDGET_MARGIN_US && (uint64_t) (execTime - CICERO_BUDGET_MARGIN_US) * CICERO_CLOCK_MHZ > cycleBudget) {
+    reset();
+    return CICERO_STATUS_TIMEOUT;
+  }
+  return status;
+}
+
 unsigned long Cicero_::getExecTime() {
   return micros() - execStartingTime;
 }
@@ -13,6 +13,13 @@
 #define CICERO_STATUS_ACCEPTED   0x2
 #define CICERO_STATUS_REJECTED   0x3
 #define CICERO_STATUS_ERROR      0x4
+// Not a status of the hardware: reported by getStatusWithinBudget() when an execution exceeds its cycle budget
+#define CICERO_STATUS_TIMEOUT    0x5
+
+// Clock frequency of CICERO on the FPGA in MHz, used to convert the time elapsed since the start into clock cycles
+#define CICERO_CLOCK_MHZ  24
+// Microseconds subtracted from the time elapsed since the start before comparing it with the cycle budget
+#define CICERO_BUDGET_MARGIN_US  8
 
 #include <Arduino.h>
 
@@ -58,6 +65,21 @@ class Cicero_ {
       @param str the string to analyze
     */
     void loadStringAndStart(String str);
+    /**
+      Writes the string into RAM and starts the execution of CICERO.
+      
+      @param numBytes the number of bytes of the string, including the terminator
+      @param str an array containing the bytes of the string, must be of size 'numBytes'
+    */
+    void loadStringAndStart(int numBytes, uint8_t str[]);
+    /**
+      Writes a string that is already laid out as CICERO expects it in RAM and starts the execution of CICERO.
+      The bytes of the string, including the terminator, must be stored in little-endian order in consecutive qwords, the unused bytes of the last qword are ignored.
+      
+      @param numBytes the number of bytes of the string, including the terminator
+      @param qwords an array containing the string, must be of size ceil('numBytes' / 8)
+    */
+    void loadPackedStringAndStart(int numBytes, uint64_t qwords[]);
     /**
       Gets the current status of CICERO.
       
@@ -69,6 +91,20 @@ class Cicero_ {
                 - 4: error
     */
     uint32_t getStatus();
+    /**
+      Sets the max number of clock cycles of an execution, checked by getStatusWithinBudget().
+      
+      @param cycleBudget the number of clock cycles, 0 for no limit
+    */
+    void setCycleBudget(uint32_t cycleBudget);
+    /**
+      Gets the current status of CICERO, stopping the execution if it has exceeded the cycle budget (see setCycleBudget()).
+      The cycles are estimated from the time elapsed since loadStringAndStart() has been called, measured before reading the status and reduced by CICERO_BUDGET_MARGIN_US,
+      that is a lower bound of the cycles actually used by CICERO: an execution within its budget is never stopped, a runaway one is stopped slightly late.
+      
+      @return the same values as getStatus(), or 5 (timeout) if the execution has been stopped, in which case CICERO has already been reset
+    */
+    uint32_t getStatusWithinBudget();
     /**
       Gets the time elapsed since loadStringAndStart() has been called.
       
@@ -113,6 +149,10 @@ class Cicero_ {
       Execution starting time, for debugging purposes.
     */
     unsigned long execStartingTime;
+    /**
+      The max number of clock cycles of an execution, 0 for no limit.
+    */
+    uint32_t cycleBudget;
     /**
       Converts a String into an array of bytes.
       
@@ -11,6 +11,8 @@ no_prefix = False
 # If True, requires that regular expression matches with the end of the string (equivalent to <your_regex>$)
 no_postfix = False
 # NB: no_postfix=True does not seem to work, as the compiled code does not recognize any string even if it is valid
+# The format of the regex (see compiler)
+regex_format = "pythonre"
 
 output_file = "code.h"
 
@@ -19,56 +21,113 @@ output_file = "code.h"
 # Compilation logic
 # ##################
 
-def compile_regex(regex):
+def add_paths():
+    import os
     import sys
 
     # Add Cicero compiler folder to path
-    sys.path.append('cicero_compiler')
+    if 'cicero_compiler' not in sys.path:
+        sys.path.append('cicero_compiler')
+    # Add the drivers folder to path, to share the bytecode cache with the driver and the measurers
+    drivers_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cicero-arduino-drivers')
+    if drivers_path not in sys.path:
+        sys.path.append(drivers_path)
 
-    import re2compiler
-    
-    code = re2compiler.compile(data=regex, O1=True, no_postfix=no_postfix, no_prefix=no_prefix)
-    return code.split('\n')
 
+def compile_regex(regex, regex_format=regex_format, show_stats=True, cache=None):
+    add_paths()
 
-def code_to_bytes(code):
-    res = bytearray()
-    
-    for line in code:
-        if line.lstrip() == '':
-            break
-        tmp = int(line, 16)
-        res += tmp.to_bytes(2, 'big')
-    return res
+    from CiceroSerial.bytecode_cache import BytecodeCache, code_to_bytes
 
+    def compile_uncached():
+        import re2compiler
+        return code_to_bytes(re2compiler.compile(data=regex, O1=True, no_postfix=no_postfix, no_prefix=no_prefix, frontend=regex_format))
 
-def get_byte_repr(byte):
-    return str(int.from_bytes(byte, 'big'))
+    if cache is None:
+        cache = BytecodeCache()
+    code_bytes = cache.get_or_compile(regex, compile_uncached, regex_format=regex_format, O1=True, no_prefix=no_prefix, no_postfix=no_postfix)
+    if show_stats:
+        print("Bytecode cache:", cache.stats())
+    return code_bytes
+
+
+# Bytecode cache of a worker of the batch mode, shared by all the regexes it compiles
+worker_cache = None
+
+
+def init_worker():
+    global worker_cache
+
+    add_paths()
+
+    from CiceroSerial.bytecode_cache import BytecodeCache
+
+    # Scanning the persistent tier is done once per worker, not once per regex
+    worker_cache = BytecodeCache()
+
+
+def compile_program(regex, regex_format):
+    # Executed by the workers of the batch mode: failures are recorded in the bundle instead of stopping the batch
+    add_paths()
+
+    from CiceroSerial.bundle import MAX_CODE_LENGTH, ProgramStatus
+
+    try:
+        code_bytes = compile_regex(regex, regex_format, show_stats=False, cache=worker_cache)
+    except Exception as e:
+        return ProgramStatus.COMPILE_ERROR, f"{type(e).__name__}: {e}".encode("utf-8")
+    if len(code_bytes) > MAX_CODE_LENGTH:
+        return ProgramStatus.TOO_LARGE, f"Program of {len(code_bytes)} bytes, at most {MAX_CODE_LENGTH} fit in CICERO RAM".encode("utf-8")
+    return ProgramStatus.OK, bytes(code_bytes)
+
+
+def compile_regex_file(regex_file, bundle_file, regex_format=regex_format, workers=None):
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    add_paths()
+
+    from CiceroSerial.bundle import Bundle, compile_options, write_bundle
+    from CiceroSerial.bytecode_cache import find_compiler_version
+    from inputs import open_regexes
+
+    # The version is stored in the bundle, so that programs of another compiler are not used
+    compiler_version = find_compiler_version()
+    if compiler_version is None:
+        raise Exception("CICERO compiler is needed to compile the regexes, it must be in the 'cicero_compiler' folder")
+
+    # Regexes are read as benchmark.py does, so that their index in the bundle is their index in the benchmark
+    regexes = list(open_regexes(regex_file))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        programs = list(pool.map(compile_program, regexes, [regex_format] * len(regexes), chunksize=max(1, len(regexes) // (4 * (workers or os.cpu_count() or 1)))))
+
+    write_bundle(bundle_file, regexes, programs, regex_format, compile_options(True, no_prefix, no_postfix), compiler_version)
+    with Bundle(bundle_file) as bundle:
+        print("Bundle written to", bundle_file, bundle.stats())
 
 
 def write_bytes_to_file(code_bytes):
-    res = ""
-    numbytes = len(code_bytes)
-    
     # Encode the number of bytes of code in the two first bytes of the file
-    numbytes_bytes = numbytes.to_bytes(2, 'big')
-    for i in range(0, 2):
-        res += get_byte_repr(numbytes_bytes[i:i+1]) + ','
-        
-    for i in range(0, numbytes):
-        if i == numbytes - 1:
-            res += get_byte_repr(code_bytes[i:i+1])
-        else:
-            res += get_byte_repr(code_bytes[i:i+1]) + ','
-    
+    data = len(code_bytes).to_bytes(2, 'big') + bytes(code_bytes)
+
     with open(output_file, "w") as f:
-        f.write(res);
+        f.write(",".join(str(byte) for byte in data))
         print("Done")
 
 
 if __name__ == "__main__":
-    code = compile_regex(regex)
-    code_bytes = code_to_bytes(code)
-    write_bytes_to_file(code_bytes)
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='compile the regex above to ' + output_file + ', or all the regexes of a file to a bundle')
+    arg_parser.add_argument('-regexfile',         type=str,  help='file with a regex for each line, e.g. inputs/protomata/regex.txt, compiled to a bundle',  default=None)
+    arg_parser.add_argument('-bundle',            type=str,  help='path of the bundle',                                                                default='bundle.bin')
+    arg_parser.add_argument('-format',            type=str,  help='regex input format',                                                                default=regex_format)
+    arg_parser.add_argument('-workers',           type=int,  help='processes that compile the regexes, defaults to the number of CPUs',                default=None)
 
+    args = arg_parser.parse_args()
 
+    if args.regexfile:
+        compile_regex_file(args.regexfile, args.bundle, args.format, args.workers)
+    else:
+        code_bytes = compile_regex(regex, args.format)
+        write_bytes_to_file(code_bytes)